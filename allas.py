@@ -3,37 +3,55 @@ from __future__ import annotations
 import os
 import sys
 
-from keystoneauth1 import session
-from keystoneauth1.identity import v3
-import os
 import swiftclient
-from swiftclient.multithreading import OutputManager
 from swiftclient.service import SwiftError, SwiftService, SwiftUploadObject
 
+from download_cache import DownloadCache
 from github_data import GithubData
+from storage import Storage
+from tracing import traced
 
-_authurl = os.environ['OS_AUTH_URL']
-_auth_version = os.environ['OS_IDENTITY_API_VERSION']
-_user = os.environ['OS_USERNAME']
-_key = os.environ['OS_PASSWORD']
-_os_options = {
-    'user_domain_name': os.environ['OS_USER_DOMAIN_NAME'],
-    'project_domain_name': os.environ['OS_USER_DOMAIN_NAME'],
-    'project_name': os.environ['OS_PROJECT_NAME']
-}
+# Files larger than this are uploaded in segments, as a static large object. Single objects are capped at 5 GB.
+SEGMENT_SIZE = 256 * 1024 * 1024
+UPLOAD_THREADS = 8
 
 
-class Allas:
-    gh_data = GithubData()
+class Allas(Storage):
+    """
+    The results bucket in Allas, through the Swift API. Credentials are read from the OS_* environment variables.
+    A storage URL and token from an earlier authentication (OS_STORAGE_URL and OS_AUTH_TOKEN) are used as they are,
+    skipping the Keystone round-trip until the token expires.
+    """
 
-    def __init__(self, bucket_name='shot-benchmarks'):
+    @traced("Swift connect", "swift")
+    def __init__(self, bucket_name='shot-benchmarks', cache: DownloadCache | None = None,
+                 gh_data: GithubData | None = None, storage_url: str | None = None, auth_token: str | None = None):
+        super().__init__(gh_data)
         self.bucket_name = bucket_name
+        self.cache = cache if cache is not None else DownloadCache.from_env()
+        try:
+            self.credentials = {
+                'auth': os.environ['OS_AUTH_URL'],
+                'user': os.environ['OS_USERNAME'],
+                'key': os.environ['OS_PASSWORD'],
+                'auth_version': os.environ['OS_IDENTITY_API_VERSION'],
+                'os_options': {
+                    'user_domain_name': os.environ['OS_USER_DOMAIN_NAME'],
+                    'project_domain_name': os.environ['OS_USER_DOMAIN_NAME'],
+                    'project_name': os.environ['OS_PROJECT_NAME']
+                }
+            }
+        except KeyError as e:
+            print("Missing Allas credentials, {0} is not set".format(e))
+            sys.exit(1)
         self.conn = swiftclient.Connection(
-            authurl=_authurl,
-            user=_user,
-            key=_key,
-            os_options=_os_options,
-            auth_version=_auth_version
+            authurl=self.credentials['auth'],
+            user=self.credentials['user'],
+            key=self.credentials['key'],
+            os_options=self.credentials['os_options'],
+            auth_version=self.credentials['auth_version'],
+            preauthurl=storage_url or os.environ.get('OS_STORAGE_URL'),
+            preauthtoken=auth_token or os.environ.get('OS_AUTH_TOKEN')
         )
         # We check the connection here.
         try:
@@ -44,6 +62,7 @@ class Allas:
             sys.exit(1)
 
     # Creates the bucket if it does not exist.
+    @traced("Swift create bucket", "swift")
     def create_bucket(self):
         # We create the container if it does not exist.
         for container in self.containers:
@@ -54,37 +73,111 @@ class Allas:
         else:
             self.conn.put_container(self.bucket_name)
 
-    # Uploads the file to the correct place.
-    def upload_file(self, sha: str, file: str, filename_suffix: str = "") -> bool:
-        path = self.gh_data.construct_valid_data(sha)
-        if not path:
-            return False
-        path = "{0}data{1}.json".format(path, filename_suffix)
-        with open(file, "r") as f:
-            print("Uploading file: {0}".format(path))
-            try:
-                self.conn.put_object(
-                    self.bucket_name,
-                    path,
-                    contents=f.read(),
-                    content_type="application/json"
-                )
-                print("File uploaded: {0}".format(path))
-                return True
-            except swiftclient.ClientException as e:
-                print("Error uploading file: {0}".format(e))
-
-    def download_file(self, sha: str, filename: str, filename_suffix: str = "") -> None | str:
-        path = self.gh_data.construct_valid_data(sha)
-        path = "{0}data{1}.json".format(path, filename_suffix)
-        local_path = os.path.join('/tmp', filename)
+    @traced("Swift download", "swift")
+    def fetch_object(self, path: str) -> None | str:
+        """
+        Fetches the object into the download cache and returns the path of the cached contents.
+        A cached copy is revalidated with its ETag, and objects that were recently not found are not requested again.
+        """
+        if self.cache.is_known_missing(path):
+            print("Object {0} was recently not found, skipping download".format(path))
+            return None
+        entry = self.cache.lookup(path)
+        headers = {}
+        if entry is not None and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
         try:
             print("Downloading file: {0}".format(path))
-            _, obj_contents = self.conn.get_object(self.bucket_name, path)
-            with open(local_path, 'wb') as local_file:
-                local_file.write(obj_contents)
-            print("File {0} downloaded to {1}".format(filename, local_path))
+            response_headers, obj_contents = self.conn.get_object(self.bucket_name, path, headers=headers)
         except swiftclient.ClientException as e:
+            if e.http_status == 304 and entry is not None:
+                print("Using cached copy of {0}".format(path))
+                return self.cache.touch(path)
+            if e.http_status == 404:
+                self.cache.mark_missing(path)
             print("Error downloading file: {0}".format(e))
             return None
+        local_path = self.cache.store(path, obj_contents, response_headers.get('etag'))
+        print("File {0} downloaded to {1}".format(path, local_path))
         return local_path
+
+    @traced("Swift range download", "swift")
+    def fetch_range(self, path: str, offset: int, length: int) -> None | bytes:
+        """
+        Fetches part of the object with a range request, bypassing the download cache.
+        """
+        headers = {"Range": "bytes={0}-{1}".format(offset, offset + length - 1)}
+        try:
+            print("Downloading {0} bytes of {1}".format(length, path))
+            _, contents = self.conn.get_object(self.bucket_name, path, headers=headers)
+        except swiftclient.ClientException as e:
+            print("Error downloading file: {0}".format(e))
+            return None
+        return contents
+
+    @traced("Swift upload files", "swift")
+    def upload_files(self, files: list[tuple[str, str]], content_type: str = "application/octet-stream") -> bool:
+        """
+        Uploads the files concurrently with SwiftService, which streams them from disk and splits the ones larger
+        than SEGMENT_SIZE into segments uploaded in parallel.
+        """
+        # SwiftService builds its connections from the os_* options, not from os_options.
+        options = {key: value for key, value in self.credentials.items() if key != 'os_options'}
+        options.update({"os_" + key: value for key, value in self.credentials['os_options'].items()})
+        options.update(object_uu_threads=UPLOAD_THREADS, segment_threads=UPLOAD_THREADS)
+        objects = [SwiftUploadObject(source, object_name=path) for source, path in files]
+        upload_options = {"segment_size": SEGMENT_SIZE, "use_slo": True,
+                          "header": ["Content-Type:{0}".format(content_type)]}
+        success = True
+        try:
+            with SwiftService(options=options) as swift:
+                for result in swift.upload(self.bucket_name, objects, options=upload_options):
+                    if not result["success"]:
+                        print("Error uploading {0}: {1}".format(result.get("object", result["action"]),
+                                                                result.get("error")))
+                        success = False
+                    elif result["action"] == "upload_object":
+                        print("File uploaded: {0}".format(result["object"]))
+        except SwiftError as e:
+            print("Error uploading files: {0}".format(e))
+            return False
+        return success
+
+    def clone(self) -> Allas:
+        # Swift connections are not thread safe, the download cache and the token are shared.
+        return Allas(self.bucket_name, cache=self.cache, gh_data=self._gh_data, storage_url=self.conn.url,
+                     auth_token=self.conn.token)
+
+    @traced("Swift token check", "swift")
+    def session_environment(self) -> dict:
+        """
+        The storage URL and a valid token, renewed if it has expired, for other processes to reuse.
+        """
+        try:
+            self.conn.head_account()
+        except swiftclient.ClientException as e:
+            print("Error checking the Swift token: {0}".format(e))
+            return {}
+        return {'OS_STORAGE_URL': self.conn.url, 'OS_AUTH_TOKEN': self.conn.token}
+
+    @traced("Swift list", "swift")
+    def list_objects(self, prefix: str = "") -> list[str]:
+        """
+        Lists the names of all the objects in the bucket under the prefix, in a single (paginated) listing.
+        """
+        try:
+            _, objects = self.conn.get_container(self.bucket_name, prefix=prefix, full_listing=True)
+        except swiftclient.ClientException as e:
+            print("Error listing objects: {0}".format(e))
+            return []
+        return [obj['name'] for obj in objects]
+
+    @traced("Swift upload", "swift")
+    def upload_contents(self, path: str, contents: str | bytes, content_type: str = "application/json") -> bool:
+        try:
+            self.conn.put_object(self.bucket_name, path, contents=contents, content_type=content_type)
+            print("File uploaded: {0}".format(path))
+            return True
+        except swiftclient.ClientException as e:
+            print("Error uploading file: {0}".format(e))
+            return False
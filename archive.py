@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import gzip
+import io
+import json
+import os
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+
+from profiler import PROFILE_FILE_EXTENSIONS
+from runner import RUN_FILE_EXTENSIONS
+from storage import Storage
+
+MANIFEST_VERSION = 1
+# Problems are packed into bundles of about this many bytes before compression.
+DEFAULT_BUNDLE_SIZE = 512 * 1024 * 1024
+DEFAULT_WORKERS = 4
+ARTIFACT_FILE_EXTENSIONS = RUN_FILE_EXTENSIONS + PROFILE_FILE_EXTENSIONS
+
+
+def get_artifact_prefix(sha_prefix: str, comparison_suffix: str = "") -> str:
+    """
+    Where the artifacts of a commit are stored, next to its data file.
+    :param sha_prefix: The folder of the commit in the storage, see GithubData.construct_valid_data
+    """
+    return "{0}artifacts{1}/".format(sha_prefix, comparison_suffix)
+
+
+def get_problem_files(run_directory: str, name: str, run_count: int) -> list[str]:
+    """
+    The output files of every run of the problem that are in the run directory.
+    """
+    files = []
+    for i in range(run_count):
+        for extension in ARTIFACT_FILE_EXTENSIONS:
+            path = os.path.join(run_directory, "{0}-run-{1}.{2}".format(name, i, extension))
+            if os.path.isfile(path):
+                files.append(path)
+    return files
+
+
+def group_bundles(problem_files: dict, bundle_size: int = DEFAULT_BUNDLE_SIZE) -> list[list[str]]:
+    """
+    Splits the problems, in order, into bundles of at most bundle_size bytes of files. A problem is never split, so
+    a problem larger than bundle_size gets a bundle of its own.
+    """
+    bundles, current, current_size = [], [], 0
+    for name, files in problem_files.items():
+        size = sum(os.path.getsize(path) for path in files)
+        if current and current_size + size > bundle_size:
+            bundles.append(current)
+            current, current_size = [], 0
+        current.append(name)
+        current_size += size
+    if current:
+        bundles.append(current)
+    return bundles
+
+
+def pack_bundle(path: str, problems: list[str], problem_files: dict) -> dict:
+    """
+    Writes the bundle as one gzip member per problem, each holding a tar archive of the files of that problem.
+    The files are streamed from disk, and every member can be decompressed on its own, so a single problem can be
+    fetched with a range request. The whole bundle extracts with tar -xzif.
+    :return dict: The offset and length of every problem in the bundle, and the names of its files
+    """
+    entries = {}
+    with open(path, "wb") as bundle:
+        for name in problems:
+            offset = bundle.tell()
+            with gzip.GzipFile(fileobj=bundle, mode="wb") as member, tarfile.open(fileobj=member, mode="w") as tar:
+                for file in problem_files[name]:
+                    tar.add(file, arcname=os.path.basename(file))
+            entries[name] = {"offset": offset, "length": bundle.tell() - offset,
+                             "files": [os.path.basename(file) for file in problem_files[name]]}
+    return entries
+
+
+def archive_artifacts(storage: Storage, prefix: str, run_directory: str, run_counts: dict, work_directory: str,
+                      part: str = "", bundle_size: int = DEFAULT_BUNDLE_SIZE,
+                      workers: int = DEFAULT_WORKERS) -> bool:
+    """
+    Packs the output files of the runs into compressed bundles, uploads them concurrently and then writes the
+    manifest, which lists the bundle, offset and length of every problem. The manifest is written last, so it never
+    points to a bundle that is missing.
+    :param prefix: The artifact folder in the storage, see get_artifact_prefix
+    :param run_counts: The number of runs of every problem
+    :param work_directory: Where the bundles are written before they are uploaded
+    :param part: Distinguishes the bundles and manifests of the shards of a run
+    :return bool: Whether every bundle and the manifest were uploaded
+    """
+    problem_files = {name: get_problem_files(run_directory, name, count) for name, count in run_counts.items()}
+    problem_files = {name: files for name, files in problem_files.items() if files}
+    if not problem_files:
+        print("No run artifacts to archive")
+        return True
+    os.makedirs(work_directory, exist_ok=True)
+    bundles = group_bundles(problem_files, bundle_size)
+    names = ["bundle{0}-{1:03d}.tar.gz".format(part, i) for i in range(len(bundles))]
+    paths = [os.path.join(work_directory, name) for name in names]
+    # zlib releases the GIL, so the bundles compress in parallel.
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        entries = list(executor.map(pack_bundle, paths, bundles, [problem_files] * len(bundles)))
+
+    print("Uploading {0} artifact bundles ({1} MB)".format(
+        len(paths), round(sum(os.path.getsize(path) for path in paths) / 1024 / 1024, 1)))
+    if not storage.upload_files([(path, prefix + name) for path, name in zip(paths, names)],
+                                content_type="application/gzip"):
+        print("Error uploading the artifact bundles, the manifest is not written")
+        return False
+    manifest = {"version": MANIFEST_VERSION, "problems": {}}
+    for name, bundle_entries in zip(names, entries):
+        for problem, entry in bundle_entries.items():
+            manifest["problems"][problem] = dict(entry, bundle=name)
+    return storage.upload_contents("{0}manifest{1}.json".format(prefix, part), json.dumps(manifest, sort_keys=True))
+
+
+def read_manifests(storage: Storage, prefix: str) -> dict:
+    """
+    Reads and merges the manifests under the artifact folder, one per shard.
+    :return dict: The manifest entry of every problem, with the bundle as its full object name
+    """
+    problems = {}
+    for object_name in storage.list_objects(prefix):
+        filename = object_name[len(prefix):]
+        if not filename.startswith("manifest") or not filename.endswith(".json"):
+            continue
+        contents = storage.download_object(object_name)
+        if contents is None:
+            continue
+        manifest = json.loads(contents)
+        if manifest.get("version") != MANIFEST_VERSION:
+            print("Skipping {0}, unsupported manifest version {1}".format(object_name, manifest.get("version")))
+            continue
+        for problem, entry in manifest["problems"].items():
+            problems[problem] = dict(entry, bundle=prefix + entry["bundle"])
+    return problems
+
+
+def download_artifacts(storage: Storage, prefix: str, problem: str, destination: str) -> None | list[str]:
+    """
+    Downloads the artifacts of a single problem, fetching only its part of the bundle.
+    :return None | list[str]: The local paths of the files, or None if the problem has no artifacts
+    """
+    entry = read_manifests(storage, prefix).get(problem)
+    if entry is None:
+        return None
+    contents = storage.fetch_range(entry["bundle"], entry["offset"], entry["length"])
+    if contents is None:
+        return None
+    os.makedirs(destination, exist_ok=True)
+    with tarfile.open(fileobj=io.BytesIO(contents), mode="r:gz") as tar:
+        tar.extractall(destination, filter="data")
+    return [os.path.join(destination, file) for file in entry["files"]]
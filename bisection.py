@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import math
+import warnings
+from typing import Callable
+
+import numpy as np
+
+from comparison import SLOWER, compare_results, comparable_time_matrices, shifted_geometric_mean
+
+# A commit is bad once it has moved at least this far from the good times towards the bad ones, on a log scale.
+BAD_FRACTION = 0.5
+
+
+def find_regressed_problems(good_results: list, bad_results: list) -> list[str]:
+    """
+    The problems that are significantly slower in the bad results, see comparison.compare_problems.
+    """
+    good_names = set(result["name"] for result in good_results)
+    names = sorted(result["name"] for result in bad_results if result["name"] in good_names)
+    per_problem, _ = compare_results(bad_results, good_results, names)
+    return [name for name in names if per_problem[name]["time_classification"] == SLOWER]
+
+
+def _mean_times(results: list[list], names: list[str]) -> list[np.ndarray]:
+    """
+    The mean times of the problems in every one of the results, calibrated only if all of them were.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return [np.nanmean(matrix, axis=1) for matrix in comparable_time_matrices(results, names)]
+
+
+def regression_fraction(good_results: list, bad_results: list, results: list, names: list[str]) -> float | None:
+    """
+    Where the results of a commit lie between the good (0) and the bad (1) results, measured with the shifted
+    geometric mean of the regressed problems on a log scale. None if the commit has no times for them.
+    """
+    by_name = set(result["name"] for result in results)
+    names = [name for name in names if name in by_name]
+    if not names:
+        return None
+    good, bad, current = _mean_times([good_results, bad_results, results], names)
+    valid = np.isfinite(good) & np.isfinite(bad) & np.isfinite(current)
+    if not np.any(valid):
+        return None
+    good_sgm, bad_sgm, current_sgm = (float(shifted_geometric_mean(times[valid])) for times in (good, bad, current))
+    if bad_sgm <= good_sgm:
+        return None
+    return (math.log(current_sgm) - math.log(good_sgm)) / (math.log(bad_sgm) - math.log(good_sgm))
+
+
+def bisect_commits(commits: list[str], is_bad: Callable[[str], bool]) -> int:
+    """
+    Binary searches the commits, oldest first, where the first is known to be good and the last known to be bad.
+    :return int: The index of the first bad commit
+    """
+    good, bad = 0, len(commits) - 1
+    while bad - good > 1:
+        middle = (good + bad) // 2
+        if is_bad(commits[middle]):
+            bad = middle
+        else:
+            good = middle
+    return bad
+
+
+def regression_evidence(last_good_results: list, first_bad_results: list, names: list[str]) -> dict:
+    """
+    The statistical comparison of the first bad commit to the last good one, for the regressed problems in both.
+    """
+    available = set(result["name"] for result in last_good_results) & set(
+        result["name"] for result in first_bad_results)
+    names = [name for name in names if name in available]
+    per_problem, suite = compare_results(first_bad_results, last_good_results, names)
+    return {"problems": per_problem, "suite": suite}
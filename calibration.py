@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import time
+
+# A nominal time of the calibration kernel, which only keeps the factors in a readable range around 1.
+# Only the ratio between two factors matters for comparisons.
+REFERENCE_TIME = 0.1
+
+
+def calibration_kernel():
+    """
+    A small, fixed workload mixing integer, floating point and memory bound work.
+    """
+    values = [(i * 7919) % 10007 for i in range(200000)]
+    values.sort()
+    total = 0.0
+    for i, value in enumerate(values):
+        total += (value * 0.5 + i) / (value + 1.0)
+    return total
+
+
+def measure_kernel(repeats: int = 5) -> float:
+    """
+    Times the calibration kernel, the fastest of the repeats is used as it is the least affected by noise.
+    """
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        calibration_kernel()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def calibration_result(before: float, after: float) -> dict:
+    """
+    The calibration of a sweep, from the kernel times measured before and after it.
+    Dividing a time by the factor normalizes it to the speed of the reference machine.
+    """
+    return {
+        "before": before,
+        "after": after,
+        "factor": (before + after) / 2 / REFERENCE_TIME
+    }
@@ -0,0 +1,276 @@
+from __future__ import annotations
+
+import json
+import os
+import struct
+import zipfile
+from collections.abc import Mapping
+
+import numpy as np
+
+from log_parser import LOG_METRICS
+
+FORMAT_VERSION = 1
+COLUMNS_EXTENSION = "npz"
+# Problem level columns holding a float per problem, NaN where the JSON has None.
+_problem_columns = ("average_time", "median_time", "calibration_factor") + tuple(
+    "average_{0}".format(metric) for metric in LOG_METRICS)
+
+
+def _float_or_nan(value) -> float:
+    try:
+        return float(value) if value is not None else np.nan
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _none_if_nan(value) -> float | None:
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+class ProblemView(Mapping):
+    """
+    Read-only view of one problem of ResultColumns, with the same keys as a problem in data.json. Values are read
+    from the arrays when they are accessed, so iterating over the problems allocates nothing per run.
+    """
+
+    def __init__(self, columns: ResultColumns, index: int):
+        self.columns = columns
+        self.index = index
+
+    def __getitem__(self, key: str):
+        return self.columns.get_field(self.index, key)
+
+    def __iter__(self):
+        return iter(self.columns.get_keys(self.index))
+
+    def __len__(self) -> int:
+        return len(self.columns.get_keys(self.index))
+
+
+class ResultColumns:
+    """
+    The results of a commit as column arrays, one row per problem and one row per run, where the runs of problem i
+    are the rows run_offsets[i] to run_offsets[i + 1]. Statuses are dictionary
+    encoded, and the phase times and counters are matrices with a column per phase or counter, NaN where missing.
+    Only the fields used by the comparisons and reports are kept, the bound trajectories and traces stay in the JSON.
+    Iterating gives a ProblemView per problem, so the code written for data.json works on the columns as well.
+    """
+
+    def __init__(self, arrays: dict, meta: dict):
+        self.arrays = arrays
+        self.meta = meta
+        self.names = meta["names"]
+        self.statuses = meta["statuses"]
+        self.phases = meta["phases"]
+        self.counters = meta["counters"]
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __iter__(self):
+        return (ProblemView(self, i) for i in range(len(self.names)))
+
+    def __getitem__(self, index: int) -> ProblemView:
+        return ProblemView(self, range(len(self.names))[index])
+
+    def get_keys(self, index: int) -> list[str]:
+        keys = ["name", "runs", "run_count", "most_common_status", "most_common_substatus", "average_time",
+                "median_time", "average_phase_times", "average_counters"]
+        keys += ["average_{0}".format(metric) for metric in LOG_METRICS]
+        if not np.isnan(self.arrays["calibration_factor"][index]):
+            keys.append("calibration")
+        return keys
+
+    def get_field(self, index: int, key: str):
+        arrays = self.arrays
+        if key == "name":
+            return self.names[index]
+        if key == "runs":
+            return self.get_runs(index)
+        if key == "run_count":
+            return int(arrays["run_offsets"][index + 1] - arrays["run_offsets"][index])
+        if key == "most_common_status":
+            return self.statuses[arrays["status"][index]]
+        if key == "most_common_substatus":
+            return self.statuses[arrays["substatus"][index]]
+        if key == "average_phase_times":
+            return self._row_dict(arrays["average_phase_times"][index], self.phases)
+        if key == "average_counters":
+            return self._row_dict(arrays["average_counters"][index], self.counters)
+        if key == "calibration" and not np.isnan(arrays["calibration_factor"][index]):
+            return {"factor": float(arrays["calibration_factor"][index])}
+        if key in _problem_columns and key != "calibration_factor":
+            return _none_if_nan(arrays[key][index])
+        raise KeyError(key)
+
+    def get_runs(self, index: int) -> list[dict]:
+        arrays = self.arrays
+        runs = []
+        for row in range(arrays["run_offsets"][index], arrays["run_offsets"][index + 1]):
+            runs.append({"time": _none_if_nan(arrays["run_time"][row]),
+                         "status": self.statuses[arrays["run_status"][row]],
+                         "substatus": self.statuses[arrays["run_substatus"][row]],
+                         "phase_times": self._row_dict(arrays["run_phase_times"][row], self.phases)})
+        return runs
+
+    @staticmethod
+    def _row_dict(row: np.ndarray, keys: list[str]) -> dict:
+        return {key: float(value) for key, value in zip(keys, row) if not np.isnan(value)}
+
+    def time_matrix(self, names: list[str]) -> np.ndarray:
+        """
+        The (problems, runs) matrix of the run times of the named problems, see comparison.run_time_matrix.
+        """
+        rows = np.array([self.index[name] for name in names], dtype=np.int64)
+        offsets = np.asarray(self.arrays["run_offsets"])
+        starts, counts = offsets[rows], offsets[rows + 1] - offsets[rows]
+        matrix = np.full((len(names), max(int(counts.max(initial=0)), 1)), np.nan)
+        # Scatter all the runs at once: run j of problem i goes to matrix[i, j].
+        problem_index = np.repeat(np.arange(len(names)), counts)
+        run_index = np.arange(problem_index.size) - np.repeat(np.cumsum(counts) - counts, counts)
+        matrix[problem_index, run_index] = np.asarray(self.arrays["run_time"])[np.repeat(starts, counts) + run_index]
+        return matrix
+
+    def calibration_factors(self, names: list[str]) -> np.ndarray:
+        """
+        The calibration factors of the named problems, NaN where a problem was not calibrated.
+        """
+        rows = np.array([self.index[name] for name in names], dtype=np.int64)
+        factors = np.array(self.arrays["calibration_factor"], dtype=float)[rows]
+        factors[factors == 0] = np.nan
+        return factors
+
+    def to_records(self) -> list[dict]:
+        """
+        The results in the data.json format, without the fields that are not stored in the columns.
+        """
+        return [dict(view) for view in self]
+
+
+def to_columns(comparison_data: list) -> ResultColumns:
+    """
+    Converts results in the data.json format to columns.
+    """
+    names = [result["name"] for result in comparison_data]
+    statuses = sorted(set(str(value) for result in comparison_data for value in
+                          [result.get("most_common_status", ""), result.get("most_common_substatus", "")] +
+                          [run.get(key, "") for run in result.get("runs", []) for key in ("status", "substatus")]))
+    status_codes = {status: code for code, status in enumerate(statuses)}
+    phases = sorted(set(phase for result in comparison_data for phase in (result.get("average_phase_times") or {})) |
+                    set(phase for result in comparison_data for run in result.get("runs", [])
+                        for phase in (run.get("phase_times") or {})))
+    counters = sorted(set(counter for result in comparison_data for counter in (result.get("average_counters") or {})))
+    runs = [run for result in comparison_data for run in result.get("runs", [])]
+
+    def matrix(rows: list[dict], keys: list[str]) -> np.ndarray:
+        return np.array([[_float_or_nan(row.get(key)) for key in keys] for row in rows],
+                        dtype=np.float64).reshape(len(rows), len(keys))
+
+    arrays = {
+        "run_offsets": np.cumsum([0] + [len(result.get("runs", [])) for result in comparison_data], dtype=np.int64),
+        "status": np.array([status_codes[str(result.get("most_common_status", ""))] for result in comparison_data],
+                           dtype=np.int32),
+        "substatus": np.array([status_codes[str(result.get("most_common_substatus", ""))]
+                               for result in comparison_data], dtype=np.int32),
+        "average_phase_times": matrix([result.get("average_phase_times") or {} for result in comparison_data], phases),
+        "average_counters": matrix([result.get("average_counters") or {} for result in comparison_data], counters),
+        "calibration_factor": np.array([_float_or_nan((result.get("calibration") or {}).get("factor"))
+                                        for result in comparison_data], dtype=np.float64),
+        "run_time": np.array([_float_or_nan(run.get("time")) for run in runs], dtype=np.float64),
+        "run_status": np.array([status_codes[str(run.get("status", ""))] for run in runs], dtype=np.int32),
+        "run_substatus": np.array([status_codes[str(run.get("substatus", ""))] for run in runs], dtype=np.int32),
+        "run_phase_times": matrix([run.get("phase_times") or {} for run in runs], phases),
+    }
+    for column in _problem_columns:
+        if column != "calibration_factor":
+            arrays[column] = np.array([_float_or_nan(result.get(column)) for result in comparison_data],
+                                      dtype=np.float64)
+    meta = {"version": FORMAT_VERSION, "names": names, "statuses": statuses, "phases": phases, "counters": counters}
+    return ResultColumns(arrays, meta)
+
+
+def write_columns(path: str, columns: ResultColumns, compress: bool = False):
+    """
+    Writes the columns as an .npz file, readable with numpy.load. The arrays are stored uncompressed by default, so
+    load_columns can memory-map them, compress for files that are sent over the network.
+    """
+    compression = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    with zipfile.ZipFile(path, "w", compression=compression, allowZip64=True) as archive:
+        for name, array in columns.arrays.items():
+            with archive.open("{0}.npy".format(name), "w", force_zip64=True) as member:
+                np.lib.format.write_array(member, np.ascontiguousarray(array), allow_pickle=False)
+        archive.writestr("meta.json", json.dumps(columns.meta), compress_type=zipfile.ZIP_DEFLATED)
+
+
+def _map_member(path: str, archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> np.ndarray:
+    """
+    Memory-maps an uncompressed array in the .npz file, reading it instead if it is compressed.
+    """
+    if info.compress_type != zipfile.ZIP_STORED:
+        with archive.open(info) as member:
+            return np.lib.format.read_array(member, allow_pickle=False)
+    with open(path, "rb") as file:
+        # The data starts after the local file header, whose name and extra field lengths may differ from the
+        # central directory.
+        file.seek(info.header_offset)
+        name_length, extra_length = struct.unpack("<HH", file.read(30)[26:30])
+        file.seek(info.header_offset + 30 + name_length + extra_length)
+        version = np.lib.format.read_magic(file)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+        offset = file.tell()
+    if int(np.prod(shape)) == 0:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape, order="F" if fortran_order else "C", offset=offset)
+
+
+def load_columns(path: str) -> ResultColumns:
+    """
+    Loads a file written by write_columns, memory-mapping the arrays that are stored uncompressed.
+    Raises a ValueError if the file is not a result file or of an unsupported version.
+    """
+    try:
+        archive = zipfile.ZipFile(path, "r")
+    except zipfile.BadZipFile as e:
+        raise ValueError("Invalid result file {0}: {1}".format(path, e))
+    with archive:
+        meta = json.loads(archive.read("meta.json"))
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError("Unsupported result format version {0} in {1}".format(meta.get("version"), path))
+        arrays = {info.filename[:-len(".npy")]: _map_member(path, archive, info) for info in archive.infolist()
+                  if info.filename.endswith(".npy")}
+    return ResultColumns(arrays, meta)
+
+
+def load_results(path: str) -> list | ResultColumns:
+    """
+    Loads results from either format, by the file extension.
+    """
+    if path.endswith("." + COLUMNS_EXTENSION):
+        return load_columns(path)
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+def convert_file(path: str) -> str:
+    """
+    Converts a data.json file to the columnar format or back, next to the original.
+    The columns only hold the fields the comparison reads, so the JSON converted back is written as
+    <name>.from-npz.json and never replaces a full data.json.
+    :return str: The path of the converted file
+    """
+    if path.endswith("." + COLUMNS_EXTENSION):
+        destination = path[:-len(COLUMNS_EXTENSION)] + "from-npz.json"
+        if os.path.exists(destination):
+            raise FileExistsError("{0} already exists".format(destination))
+        with open(destination, "w") as file:
+            json.dump(load_columns(path).to_records(), file, sort_keys=True, indent=4)
+        return destination
+    destination = path.rsplit(".", 1)[0] + "." + COLUMNS_EXTENSION
+    write_columns(destination, to_columns(load_results(path)))
+    return destination
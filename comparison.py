@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import math
+import warnings
+
+import numpy as np
+
+from columnar import ResultColumns
+from stats import cornish_fisher_t, t_critical
+
+# Shift used for the shifted geometric means, in seconds, so that very short times do not dominate the mean.
+DEFAULT_SHIFT = 1.0
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_BOOTSTRAP_SAMPLES = 1000
+# Times are clamped to the timer resolution before taking logs, so instant solves do not give infinite ratios.
+MIN_TIME = 1e-3
+
+# The OSrL time type of the whole run, every other time type is a phase of it.
+TOTAL_PHASE = "Total"
+
+FASTER = "faster"
+SLOWER = "slower"
+NO_CHANGE = "no significant change"
+INSUFFICIENT_DATA = "insufficient data"
+
+
+def run_time_matrix(results: list | ResultColumns, names: list[str]) -> np.ndarray:
+    """
+    Builds a (problems, runs) matrix of the raw run times of the named problems, padded with NaN.
+    Failed runs without a time are NaN as well. See comparable_time_matrices for calibrated times.
+    """
+    if isinstance(results, ResultColumns):
+        return results.time_matrix(names)
+    by_name = {result["name"]: result for result in results}
+    max_runs = max((len(by_name[name].get("runs", [])) for name in names), default=0)
+    matrix = np.full((len(names), max(max_runs, 1)), np.nan)
+    for i, name in enumerate(names):
+        times = [run.get("time") for run in by_name[name].get("runs", [])]
+        matrix[i, :len(times)] = [np.nan if time is None else float(time) for time in times]
+    return matrix
+
+
+def result_names(results: list | ResultColumns) -> list[str]:
+    """
+    The names of the problems in the results, without building a view per problem for columns.
+    """
+    if isinstance(results, ResultColumns):
+        return list(results.names)
+    return [result["name"] for result in results]
+
+
+def calibration_factors(results: list | ResultColumns, names: list[str]) -> np.ndarray:
+    """
+    The calibration factors of the named problems, NaN where a problem was not calibrated.
+    """
+    if isinstance(results, ResultColumns):
+        return results.calibration_factors(names)
+    by_name = {result["name"]: result for result in results}
+    factors = np.full(len(names), np.nan)
+    for i, name in enumerate(names):
+        calibration = by_name[name].get("calibration")
+        if calibration is not None and calibration.get("factor"):
+            factors[i] = calibration["factor"]
+    return factors
+
+
+def comparable_time_matrices(results: list, names: list[str]) -> list[np.ndarray]:
+    """
+    The run time matrices of several results of the same problems. The times of a problem are only normalized by the
+    calibration factors when all the results were calibrated, a calibrated time is not comparable to a raw one.
+    """
+    matrices = [run_time_matrix(result, names) for result in results]
+    factors = np.array([calibration_factors(result, names) for result in results]).reshape(len(results), len(names))
+    calibrated = np.all(np.isfinite(factors), axis=0)
+    for matrix, factor in zip(matrices, factors):
+        matrix[calibrated] /= factor[calibrated, None]
+    return matrices
+
+
+def shifted_geometric_mean(values: np.ndarray, shift: float = DEFAULT_SHIFT, axis: int = -1) -> np.ndarray:
+    return np.exp(np.nanmean(np.log(values + shift), axis=axis)) - shift
+
+
+def _t_p_value(statistic: np.ndarray, degrees_of_freedom: np.ndarray) -> np.ndarray:
+    """
+    Two-sided p-value of t statistics. The Cornish-Fisher expansion used for the critical values is inverted by
+    bisection to get the matching normal quantile, so the p-values agree with the confidence intervals.
+    """
+    target = np.abs(statistic)
+    low = np.zeros_like(target)
+    high = np.full_like(target, 40.0)
+    for _ in range(60):
+        middle = (low + high) / 2
+        below = cornish_fisher_t(middle, degrees_of_freedom) < target
+        low = np.where(below, middle, low)
+        high = np.where(below, high, middle)
+    z = np.where(np.isinf(target), np.inf, (low + high) / 2)
+    return np.vectorize(math.erfc, otypes=[float])(z / math.sqrt(2))
+
+
+def benjamini_hochberg(p_values: np.ndarray) -> np.ndarray:
+    """
+    Adjusts the p-values for testing many problems at once, controlling the false discovery rate.
+    NaN p-values are left out of the adjustment and stay NaN.
+    """
+    adjusted = np.full_like(p_values, np.nan)
+    valid = np.flatnonzero(~np.isnan(p_values))
+    if len(valid) == 0:
+        return adjusted
+    order = valid[np.argsort(p_values[valid])]
+    ranked = p_values[order] * len(valid) / np.arange(1, len(valid) + 1)
+    adjusted[order] = np.minimum(1.0, np.minimum.accumulate(ranked[::-1])[::-1])
+    return adjusted
+
+
+def _classify(difference: np.ndarray, half_width: np.ndarray, p_value: np.ndarray, testable: np.ndarray,
+              confidence: float) -> dict:
+    """
+    Turns the mean log time differences into ratios with confidence intervals, and classifies the problems by their
+    false discovery rate adjusted p-values.
+    """
+    p_value[~testable] = np.nan
+    adjusted_p_value = benjamini_hochberg(p_value)
+    significant = testable & (adjusted_p_value < 1 - confidence)
+    ratio = np.exp(difference)
+    classification = np.full(len(ratio), NO_CHANGE, dtype=object)
+    classification[significant & (ratio < 1)] = FASTER
+    classification[significant & (ratio > 1)] = SLOWER
+    classification[~testable] = INSUFFICIENT_DATA
+    return {
+        "ratio": ratio,
+        "ratio_lower": np.exp(difference - half_width),
+        "ratio_upper": np.exp(difference + half_width),
+        "p_value": p_value,
+        "adjusted_p_value": adjusted_p_value,
+        "classification": classification
+    }
+
+
+def compare_problems(current: np.ndarray, previous: np.ndarray, confidence: float = DEFAULT_CONFIDENCE) -> dict:
+    """
+    Compares the run times of every problem with Welch's t-test on the log times, so the effect is the ratio of the
+    geometric mean times (current / previous). As a large suite runs a test per problem, a problem is only faster or
+    slower when its false discovery rate adjusted p-value is below 1 - confidence.
+    Problems with fewer than two valid runs on either side cannot be tested.
+    All the problems are tested at once, as whole array operations.
+    :return dict: Arrays of the ratio, its confidence interval, the p-values and the classification, per problem
+    """
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        # Problems without enough valid runs give NaN rows, which are reported as insufficient data below.
+        warnings.simplefilter("ignore", RuntimeWarning)
+        current_logs = np.log(np.maximum(current, MIN_TIME))
+        previous_logs = np.log(np.maximum(previous, MIN_TIME))
+        current_counts = np.sum(~np.isnan(current_logs), axis=1)
+        previous_counts = np.sum(~np.isnan(previous_logs), axis=1)
+        difference = np.nanmean(current_logs, axis=1) - np.nanmean(previous_logs, axis=1)
+        current_error = np.nanvar(current_logs, axis=1, ddof=1) / current_counts
+        previous_error = np.nanvar(previous_logs, axis=1, ddof=1) / previous_counts
+        standard_error = np.sqrt(current_error + previous_error)
+        # Welch-Satterthwaite degrees of freedom, identical runs on both sides have no spread at all.
+        degrees_of_freedom = (current_error + previous_error) ** 2 / (
+                current_error ** 2 / (current_counts - 1) + previous_error ** 2 / (previous_counts - 1))
+        # Two runs a side can give fewer than 2 degrees of freedom, where the t quantiles are too small, see
+        # stats.t_critical. The p-values invert the same expansion, so they still agree with the intervals.
+        degrees_of_freedom = np.where(np.isfinite(degrees_of_freedom), np.maximum(degrees_of_freedom, 1.0), 1e6)
+        half_width = t_critical(degrees_of_freedom, confidence) * standard_error
+        statistic = np.where(standard_error > 0, difference / standard_error,
+                             np.where(difference == 0, 0.0, np.inf))
+        p_value = _t_p_value(np.nan_to_num(statistic, nan=0.0), degrees_of_freedom)
+
+    testable = (current_counts >= 2) & (previous_counts >= 2) & np.isfinite(difference)
+    return _classify(difference, half_width, p_value, testable, confidence)
+
+
+def compare_suite(current: np.ndarray, previous: np.ndarray, shift: float = DEFAULT_SHIFT,
+                  confidence: float = DEFAULT_CONFIDENCE, samples: int = DEFAULT_BOOTSTRAP_SAMPLES,
+                  seed: int | None = 0) -> dict:
+    """
+    Compares the shifted geometric means of the per problem mean times over the problems both sides solved.
+    The confidence interval of the ratio comes from a paired bootstrap over the problems, with all the bootstrap
+    samples computed at once.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        current_means = np.nanmean(current, axis=1)
+        previous_means = np.nanmean(previous, axis=1)
+    valid = np.isfinite(current_means) & np.isfinite(previous_means)
+    current_means = current_means[valid]
+    previous_means = previous_means[valid]
+    if len(current_means) == 0:
+        return {"problems": 0}
+
+    current_sgm = float(shifted_geometric_mean(current_means, shift))
+    previous_sgm = float(shifted_geometric_mean(previous_means, shift))
+    rng = np.random.default_rng(seed)
+    indices = rng.integers(0, len(current_means), size=(samples, len(current_means)))
+    ratios = shifted_geometric_mean(current_means[indices], shift) / shifted_geometric_mean(previous_means[indices],
+                                                                                              shift)
+    alpha = 1 - confidence
+    return {
+        "problems": int(len(current_means)),
+        "shift": shift,
+        "current_sgm": current_sgm,
+        "previous_sgm": previous_sgm,
+        "ratio": current_sgm / previous_sgm,
+        "ratio_lower": float(np.quantile(ratios, alpha / 2)),
+        "ratio_upper": float(np.quantile(ratios, 1 - alpha / 2))
+    }
+
+
+def _finite_or_none(value) -> float | None:
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def compare_results(comparison_data: list, previous_result: list, names: list[str],
+                    confidence: float = DEFAULT_CONFIDENCE, samples: int = DEFAULT_BOOTSTRAP_SAMPLES,
+                    paired: bool = False) -> tuple[dict, dict]:
+    """
+    Runs the statistical comparison of the named problems, which have to be in both results.
+    With paired, the runs of both results were interleaved and are compared in pairs, see compare_paired.
+    :return tuple[dict, dict]: The comparison per problem name, in a JSON friendly form, and the suite comparison
+    """
+    current, previous = comparable_time_matrices([comparison_data, previous_result], names)
+    if paired:
+        problems = compare_paired(current, previous, confidence)
+    else:
+        problems = compare_problems(current, previous, confidence)
+    per_problem = {}
+    for i, name in enumerate(names):
+        per_problem[name] = {
+            "time_ratio": _finite_or_none(problems["ratio"][i]),
+            "time_ratio_lower": _finite_or_none(problems["ratio_lower"][i]),
+            "time_ratio_upper": _finite_or_none(problems["ratio_upper"][i]),
+            "p_value": _finite_or_none(problems["p_value"][i]),
+            "adjusted_p_value": _finite_or_none(problems["adjusted_p_value"][i]),
+            "time_classification": problems["classification"][i]
+        }
+    suite = compare_suite(current, previous, confidence=confidence, samples=samples)
+    # With a single run on either side there is no spread to test against, which the summary has to say.
+    suite["untested"] = int(np.sum(problems["classification"] == INSUFFICIENT_DATA))
+    return per_problem, suite
+
+
+def attribute_phases(current_phases: dict, previous_phases: dict, limit: int = 3) -> list[list]:
+    """
+    Finds the phases that account for the change of the total time: the phases whose mean time changed in the same
+    direction as the total, largest change first. SHOT nests some phases in others, so the changes can add up to
+    more than the total change.
+    :return list[list]: [phase, change in seconds, share of the total change] for at most `limit` phases
+    """
+    phases = (set(current_phases) & set(previous_phases)) - {TOTAL_PHASE}
+    changes = {phase: current_phases[phase] - previous_phases[phase] for phase in phases}
+    total_change = current_phases.get(TOTAL_PHASE, 0.0) - previous_phases.get(TOTAL_PHASE, 0.0)
+    if total_change == 0:
+        return []
+    contributing = sorted((phase for phase in phases if changes[phase] * total_change > 0),
+                          key=lambda phase: (-abs(changes[phase]), phase))
+    return [[phase, changes[phase], changes[phase] / total_change] for phase in contributing[:limit]]
+
+
+def compare_paired(current: np.ndarray, previous: np.ndarray, confidence: float = DEFAULT_CONFIDENCE) -> dict:
+    """
+    Compares run times that were measured in pairs, run i of both sides right after each other, with a paired t-test
+    on the log time ratios of the pairs. Pairing removes the machine drift both sides saw, so it detects smaller
+    changes than compare_problems. Pairs where either run has no time are left out.
+    :return dict: The same arrays as compare_problems
+    """
+    width = min(current.shape[1], previous.shape[1])
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        differences = (np.log(np.maximum(current[:, :width], MIN_TIME)) -
+                       np.log(np.maximum(previous[:, :width], MIN_TIME)))
+        counts = np.sum(~np.isnan(differences), axis=1)
+        difference = np.nanmean(differences, axis=1)
+        standard_error = np.sqrt(np.nanvar(differences, axis=1, ddof=1) / counts)
+        degrees_of_freedom = np.maximum(counts - 1, 1).astype(float)
+        half_width = t_critical(degrees_of_freedom, confidence) * standard_error
+        statistic = np.where(standard_error > 0, difference / standard_error,
+                             np.where(difference == 0, 0.0, np.inf))
+        p_value = _t_p_value(np.nan_to_num(statistic, nan=0.0), degrees_of_freedom)
+
+    testable = (counts >= 2) & np.isfinite(difference)
+    return _classify(difference, half_width, p_value, testable, confidence)
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "shot-benchmarker")
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+# How long a "not found" answer is trusted before asking again.
+DEFAULT_NEGATIVE_TTL = 10 * 60
+
+
+class DownloadCache:
+    """
+    Persistent, content-addressed cache for downloaded objects.
+    The contents are stored by their SHA-256 in blobs/, and index.json maps object names to their blob, ETag and
+    last access time. When the blobs exceed max_size, the least recently used ones are evicted.
+    Missing objects are remembered for negative_ttl seconds.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_size: int = DEFAULT_MAX_SIZE,
+                 negative_ttl: float = DEFAULT_NEGATIVE_TTL):
+        self.directory = directory
+        self.max_size = max_size
+        self.negative_ttl = negative_ttl
+        self.lock = threading.Lock()
+        self.index_path = os.path.join(directory, "index.json")
+        os.makedirs(os.path.join(directory, "blobs"), exist_ok=True)
+        self.index = self._read_index()
+
+    @classmethod
+    def from_env(cls) -> DownloadCache:
+        """
+        Creates the cache from INPUT_CACHE_DIR and INPUT_CACHE_MAX_SIZE (in MB), so it can live in the Actions cache.
+        """
+        max_size = os.environ.get("INPUT_CACHE_MAX_SIZE")
+        return cls(
+            directory=os.environ.get("INPUT_CACHE_DIR") or DEFAULT_CACHE_DIR,
+            max_size=int(max_size) * 1024 * 1024 if max_size else DEFAULT_MAX_SIZE
+        )
+
+    def _read_index(self) -> dict:
+        try:
+            with open(self.index_path, "r") as file:
+                index = json.load(file)
+        except (OSError, ValueError):
+            return {"objects": {}, "missing": {}}
+        index.setdefault("objects", {})
+        index.setdefault("missing", {})
+        return index
+
+    def _write_index(self):
+        # Written to a temporary file first, so an interrupted write never leaves a broken index behind.
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as file:
+            json.dump(self.index, file)
+        os.replace(tmp_path, self.index_path)
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.directory, "blobs", digest[:2], digest)
+
+    def lookup(self, name: str) -> dict | None:
+        """
+        Returns the cache entry of the object, or None if it is not cached (or its blob has gone missing).
+        """
+        with self.lock:
+            entry = self.index["objects"].get(name)
+            if entry is None:
+                return None
+            if not os.path.isfile(self.blob_path(entry["digest"])):
+                del self.index["objects"][name]
+                return None
+            return dict(entry)
+
+    def touch(self, name: str) -> str | None:
+        """
+        Marks the object as used, returning the path of its contents.
+        """
+        with self.lock:
+            entry = self.index["objects"].get(name)
+            if entry is None:
+                return None
+            entry["accessed"] = time.time()
+            self._write_index()
+            return self.blob_path(entry["digest"])
+
+    def store(self, name: str, contents: bytes, etag: str | None = None) -> str:
+        """
+        Stores the contents of the object and returns the path of the cached contents.
+        """
+        if isinstance(contents, str):
+            contents = contents.encode()
+        digest = hashlib.sha256(contents).hexdigest()
+        path = self.blob_path(digest)
+        with self.lock:
+            if not os.path.isfile(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+                with os.fdopen(fd, "wb") as file:
+                    file.write(contents)
+                os.replace(tmp_path, path)
+            self.index["objects"][name] = {
+                "digest": digest,
+                "etag": etag,
+                "size": len(contents),
+                "accessed": time.time()
+            }
+            self.index["missing"].pop(name, None)
+            self._evict(keep=digest)
+            self._write_index()
+        return path
+
+    def mark_missing(self, name: str):
+        with self.lock:
+            self.index["missing"][name] = time.time() + self.negative_ttl
+            self._write_index()
+
+    def is_known_missing(self, name: str) -> bool:
+        with self.lock:
+            missing_until = self.index["missing"].get(name)
+            if missing_until is None:
+                return False
+            if missing_until < time.time():
+                del self.index["missing"][name]
+                return False
+            return True
+
+    def _evict(self, keep: str | None = None):
+        """
+        Removes the least recently used blobs until the cache fits in max_size. Has to be called with the lock held.
+        Blobs are shared between objects with the same contents, so a blob is only deleted with its last object.
+        The blob that was just stored (keep) is never evicted.
+        """
+        blobs = {}
+        for name, entry in self.index["objects"].items():
+            accessed, size = blobs.get(entry["digest"], (0, entry["size"]))
+            blobs[entry["digest"]] = (max(accessed, entry["accessed"]), size)
+        total_size = sum(size for _, size in blobs.values())
+        if total_size <= self.max_size:
+            return
+        for digest, (_, size) in sorted(blobs.items(), key=lambda item: item[1][0]):
+            if total_size <= self.max_size:
+                break
+            if digest == keep:
+                continue
+            for name in [name for name, entry in self.index["objects"].items() if entry["digest"] == digest]:
+                del self.index["objects"][name]
+            try:
+                os.remove(self.blob_path(digest))
+            except FileNotFoundError:
+                pass
+            total_size -= size
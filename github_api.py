@@ -6,21 +6,25 @@ from github import Github, GithubException, Auth
 from github.Commit import Commit
 
 from github_data import GithubData
+from tracing import traced
 
 
 class GithubAPI:
-    gh_data = GithubData()
 
+    @traced("GitHub connect", "github")
     def __init__(self):
+        self.gh_data = GithubData()
         # Setup GitHub auth
         self.auth = Auth.Token(os.environ.get("GITHUB_TOKEN"))
-        self.g = Github(auth=self.auth)
+        # Large pages, so that looking up the recent history of a branch is a single request.
+        self.g = Github(auth=self.auth, per_page=100)
         try:
             self.repo = self.g.get_repo("coin-or/SHOT")
         except GithubException:
             print("Error connecting to GitHub")
             sys.exit(1)
 
+    @traced("GitHub commit lookup", "github")
     def get_commit_from_head(self, i: int) -> Commit | None:
         """
         Handles getting the commit from head (so e.g. i = 1 gets the previous commit)
@@ -34,6 +38,46 @@ class GithubAPI:
             return None
         return commits[i]
 
+    @traced("GitHub commit listing", "github")
+    def get_recent_commit_shas(self, count: int) -> list[str]:
+        """
+        Gets the SHAs of the latest commits on the branch, newest first, in as few paginated requests as possible.
+        :param count: The number of commits to get, including the head commit.
+        :return list[str]:
+        """
+        if self.gh_data.gh_type != "branch":
+            raise RuntimeError("Can only be called when the action is run in a branch")
+        commits = self.repo.get_commits(sha=self.gh_data.short_name)
+        return [commit.sha for commit in commits[:count]]
+
+    @traced("GitHub compare", "github")
+    def get_commits_between(self, base: str, head: str) -> list[str]:
+        """
+        Gets the SHAs of the commits after base up to and including head, oldest first, all of the pages of them.
+        Empty if head is not a descendant of base.
+        :param base: The SHA of the older commit, not included
+        :param head: The SHA of the newer commit
+        :return list[str]:
+        """
+        comparison = self.repo.compare(base, head)
+        # Diverged or older heads are not descendants of base.
+        if comparison.status not in ("ahead", "identical"):
+            return []
+        # The commits are a paginated list, which follows the pages of the compare API past its first 250 commits.
+        return [commit.sha for commit in comparison.commits]
+
+    @traced("GitHub commit lookup", "github")
+    def resolve_sha(self, sha: str) -> str | None:
+        """
+        Resolves an abbreviated SHA (or any other commit reference) to the full SHA of the commit
+        :return str | None: The full SHA, or None if there is no such commit
+        """
+        try:
+            return self.repo.get_commit(sha).sha
+        except GithubException:
+            return None
+
+    @traced("GitHub commit lookup", "github")
     def is_commit(self, sha: str) -> Commit | None:
         """
         Checks if a commit exists with the given SHA
@@ -16,3 +16,6 @@ class GithubData:
         path = os.path.normpath(
             "{0}/{1}/{2}".format(self.gh_type, self.short_name, sha))
         return os.path.join(path, '')
+
+    def construct_branch_prefix(self) -> str:
+        return "{0}/{1}/".format(self.gh_type, self.short_name)
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import math
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import numpy as np
+
+from comparison import DEFAULT_SHIFT, MIN_TIME, calibration_factors, run_time_matrix, shifted_geometric_mean
+
+DEFAULT_WORKERS = 8
+# A changepoint needs a mean shift of this many standard errors, and at least MIN_CHANGE relative change.
+CHANGEPOINT_THRESHOLD = 5.0
+MIN_CHANGE = 0.01
+# Problems whose time drifts by more than this per commit are flagged even without a changepoint.
+TREND_THRESHOLD = 0.005
+SPARKLINE_CHARACTERS = "▁▂▃▄▅▆▇█"
+
+
+def fetch_results(shas: list[str], load: Callable[[str], list | None], workers: int = DEFAULT_WORKERS) -> dict:
+    """
+    Loads the results of the commits with a bounded pool of worker threads.
+    :return dict: The results by SHA, commits without results are left out
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        results = dict(zip(shas, executor.map(load, shas)))
+    return {sha: result for sha, result in results.items() if result is not None}
+
+
+def thread_local_factory(factory: Callable):
+    """
+    Wraps a factory so every thread gets its own instance, for clients that are not thread safe.
+    """
+    local = threading.local()
+
+    def get():
+        if not hasattr(local, "instance"):
+            local.instance = factory()
+        return local.instance
+    return get
+
+
+def build_time_series(history: list[tuple[str, list]]) -> tuple[list[str], np.ndarray]:
+    """
+    Builds the (problems, commits) matrix of the mean run times, oldest commit first, NaN where a commit has no time.
+    """
+    names = sorted(set(result["name"] for _, results in history for result in results))
+    series = np.full((len(names), len(history)), np.nan)
+    factors = np.full((len(names), len(history)), np.nan)
+    for j, (_, results) in enumerate(history):
+        available = set(result["name"] for result in results)
+        rows = [i for i, name in enumerate(names) if name in available]
+        with warnings.catch_warnings():
+            # Problems without a single timed run give a NaN mean, which is what we want.
+            warnings.simplefilter("ignore", RuntimeWarning)
+            series[rows, j] = np.nanmean(run_time_matrix(results, [names[i] for i in rows]), axis=1)
+        factors[rows, j] = calibration_factors(results, [names[i] for i in rows])
+    # A problem is only normalized if every commit that timed it was calibrated, so the series stays comparable.
+    calibrated = np.all(np.isfinite(factors) | np.isnan(series), axis=1)
+    series[calibrated] /= np.where(np.isnan(factors[calibrated]), 1.0, factors[calibrated])
+    return names, series
+
+
+def suite_series(series: np.ndarray, shift: float = DEFAULT_SHIFT) -> np.ndarray:
+    """
+    The shifted geometric mean of every commit, over the problems timed in all the commits, so the suite does not
+    change composition along the series. Falls back to every timed problem if no problem is timed in all of them.
+    """
+    complete = np.all(np.isfinite(series), axis=1)
+    if np.any(complete):
+        return shifted_geometric_mean(series[complete], shift, axis=0)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return shifted_geometric_mean(series, shift, axis=0)
+
+
+def _best_split(values: np.ndarray, noise: float) -> tuple[int, float] | None:
+    """
+    Finds the split of the series into two segments with the most significant difference in mean.
+    :return tuple[int, float] | None: The index the second segment starts at and its significance, if any
+    """
+    n = len(values)
+    if n < 4 or noise <= 0:
+        return None
+    sizes = np.arange(2, n - 1)
+    sums = np.cumsum(values)
+    left_means = sums[sizes - 1] / sizes
+    right_means = (sums[-1] - sums[sizes - 1]) / (n - sizes)
+    scores = np.abs(right_means - left_means) / (noise * np.sqrt(1 / sizes + 1 / (n - sizes)))
+    best = int(np.argmax(scores))
+    return int(sizes[best]), float(scores[best])
+
+
+def find_changepoints(times: np.ndarray, threshold: float = CHANGEPOINT_THRESHOLD,
+                      min_change: float = MIN_CHANGE) -> list[tuple[int, float]]:
+    """
+    Finds the commits where the mean log time shifts, by binary segmentation. The noise is estimated from the
+    differences between consecutive commits (median absolute deviation), so it is not inflated by the shifts.
+    :return list[tuple[int, float]]: The index of the first commit after every changepoint and its relative change
+    """
+    indexes = np.flatnonzero(np.isfinite(times))
+    values = np.log(np.maximum(times[indexes], MIN_TIME))
+    if len(values) < 4:
+        return []
+    differences = np.diff(values)
+    noise = 1.4826 * np.median(np.abs(differences - np.median(differences))) / math.sqrt(2)
+    # Perfectly stable series still have timer noise, so we never trust less than 0.1% of noise.
+    noise = max(noise, 1e-3)
+
+    changepoints = []
+    segments = [(0, len(values))]
+    while segments:
+        start, end = segments.pop()
+        split = _best_split(values[start:end], noise)
+        if split is None or split[1] < threshold:
+            continue
+        middle = start + split[0]
+        change = math.exp(np.mean(values[middle:end]) - np.mean(values[start:middle])) - 1
+        if abs(change) < min_change:
+            continue
+        changepoints.append((int(indexes[middle]), change))
+        segments.extend([(start, middle), (middle, end)])
+    return sorted(changepoints)
+
+
+def trend(times: np.ndarray) -> float | None:
+    """
+    The relative change of the time per commit, from a least squares fit of the log times.
+    """
+    indexes = np.flatnonzero(np.isfinite(times))
+    if len(indexes) < 3:
+        return None
+    slope = np.polyfit(indexes, np.log(np.maximum(times[indexes], MIN_TIME)), 1)[0]
+    return math.exp(slope) - 1
+
+
+def sparkline(values: np.ndarray) -> str:
+    """
+    Draws the series with block characters scaled between its minimum and maximum, gaps are spaces.
+    """
+    finite = values[np.isfinite(values)]
+    if len(finite) == 0:
+        return ""
+    low, high = float(np.min(finite)), float(np.max(finite))
+    characters = []
+    for value in values:
+        if not np.isfinite(value):
+            characters.append(" ")
+        elif high == low:
+            characters.append(SPARKLINE_CHARACTERS[0])
+        else:
+            level = int((value - low) / (high - low) * (len(SPARKLINE_CHARACTERS) - 1))
+            characters.append(SPARKLINE_CHARACTERS[level])
+    return "".join(characters)
+
+
+def analyze_series(name: str, times: np.ndarray, shas: list[str]) -> dict:
+    finite = times[np.isfinite(times)]
+    return {
+        "name": name,
+        "times": [float(time) if np.isfinite(time) else None for time in times],
+        "latest_time": float(finite[-1]) if len(finite) else None,
+        "total_change": float(finite[-1] / finite[0] - 1) if len(finite) >= 2 and finite[0] > 0 else None,
+        "trend": trend(times),
+        "changepoints": [{"sha": shas[index], "change": change} for index, change in find_changepoints(times)],
+        "sparkline": sparkline(times)
+    }
+
+
+def build_history(history: list[tuple[str, list]]) -> dict:
+    """
+    Analyzes the results of the commits, given oldest first: the suite and every problem get their time series,
+    per commit trend and changepoints.
+    """
+    shas = [sha for sha, _ in history]
+    names, series = build_time_series(history)
+    return {
+        "commits": shas,
+        "suite": analyze_series("Suite (shifted geometric mean)", suite_series(series), shas),
+        "problems": [analyze_series(name, series[i], shas) for i, name in enumerate(names)]
+    }
+
+
+def is_flagged(analysis: dict) -> bool:
+    """
+    A series is worth reporting if it has a changepoint or drifts by at least TREND_THRESHOLD per commit.
+    """
+    if analysis["changepoints"]:
+        return True
+    return analysis["trend"] is not None and abs(analysis["trend"]) >= TREND_THRESHOLD
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+
+from runner import RUN_STATUS_COMPLETED, BenchmarkRun
+
+
+def get_journal_path(benchmark_dest: str, comparison_suffix: str = "") -> str:
+    return os.path.join(benchmark_dest, "journal{0}.ndjson".format(comparison_suffix))
+
+
+def get_journal_key(run: BenchmarkRun) -> tuple[str, str, int]:
+    return run.config, run.name, run.run
+
+
+class RunJournal:
+    """
+    Append-only NDJSON journal of the finished runs, one line per run, written as soon as the run is done.
+    Every line is flushed and synced to disk, so a cancelled job loses at most the line it was writing.
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = read_journal(path) if resume else {}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # A new journal is started unless we are resuming from the previous one.
+        self.file = open(path, "a" if resume else "w")
+        # A line cut off by a crash must not swallow the first new entry.
+        if resume and self.file.tell() > 0:
+            with open(path, "rb") as file:
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b"\n":
+                    self.file.write("\n")
+
+    def close(self):
+        self.file.close()
+
+    def append(self, run: BenchmarkRun, time: float | None):
+        entry = {
+            "config": run.config,
+            "name": run.name,
+            "run": run.run,
+            "problem": run.problem,
+            "time": time,
+            "resources": run.resources()
+        }
+        with self.lock:
+            self.file.write(json.dumps(entry) + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.entries[get_journal_key(run)] = entry
+
+    def restore(self, runs: list[BenchmarkRun], benchmark_dest: str) -> list[BenchmarkRun]:
+        """
+        Restores the runs that are in the journal, and whose output files are still in the benchmark folder for
+        the runs that completed, by copying their resource usage and status onto the run.
+        :return list[BenchmarkRun]: The runs that still have to be executed, in their original order
+        """
+        missing = []
+        for run in runs:
+            entry = self.entries.get(get_journal_key(run))
+            osrl_file = os.path.join(benchmark_dest, run.config, "{0}.osrl".format(run.file_prefix))
+            completed = entry is not None and entry["resources"]["run_status"] == RUN_STATUS_COMPLETED
+            if entry is None or (completed and not os.path.isfile(osrl_file)):
+                missing.append(run)
+                continue
+            for key, value in entry["resources"].items():
+                setattr(run, key, value)
+        if len(missing) < len(runs):
+            print("Resuming {0} runs from the journal, executing {1} runs".format(len(runs) - len(missing),
+                                                                                   len(missing)))
+        return missing
+
+    def get_time(self, run: BenchmarkRun) -> float | None:
+        entry = self.entries.get(get_journal_key(run))
+        return entry["time"] if entry is not None else None
+
+
+def read_journal(path: str) -> dict:
+    """
+    Reads the journal entries by (config, name, run). A line cut off by a crash is skipped, later lines win.
+    """
+    entries = {}
+    try:
+        with open(path, "r") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                entries[(entry["config"], entry["name"], entry["run"])] = entry
+    except OSError:
+        pass
+    return entries
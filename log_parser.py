@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import math
+import re
+
+# Relative gap used for the time-to-gap metric.
+TARGET_GAP = 0.01
+# The metrics computed from the log of every run.
+LOG_METRICS = ("primal_integral", "dual_integral", "time_to_gap")
+
+# An iteration line of the SHOT log, e.g.
+#      4: MILP-O        0.12     3 | 12       -1.52e+03 | -1.40e+03  1.2e+02 | 7.9e-02 ...
+# The iteration number is left out for lines reporting primal solutions found between iterations.
+_iteration_pattern = re.compile(r"^\s*\d*\s*:\s*(?P<type>\S+)\s+"
+                                r"(?P<time>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?)\s(?P<rest>.*)$")
+_integer_pattern = re.compile(r"^\d+$")
+
+
+def _parse_bounds(rest: str) -> tuple[float, float] | None:
+    """
+    Reads the dual and primal bound from the columns after the time. The dual cut columns "added | total" come first,
+    but are left empty when no cuts were added, so they are recognised by holding two integers.
+    """
+    tokens = rest.replace("|", " | ").split()
+    if len(tokens) >= 6 and _integer_pattern.match(tokens[0]) and tokens[1] == "|" and \
+            _integer_pattern.match(tokens[2]) and tokens[3] != "|" and tokens[4] == "|":
+        dual, primal = tokens[3], tokens[5]
+    elif len(tokens) >= 3 and tokens[1] == "|":
+        dual, primal = tokens[0], tokens[2]
+    else:
+        return None
+    try:
+        return float(dual), float(primal)
+    except ValueError:
+        return None
+
+
+def read_bound_trajectory(path: str) -> list[list[float]]:
+    """
+    Streams the SHOT log and extracts the [time, dual bound, primal bound] of every iteration line where either
+    bound changed. Unbounded values are kept as +-inf.
+    """
+    trajectory = []
+    with open(path, "r", errors="replace") as file:
+        for line in file:
+            match = _iteration_pattern.match(line)
+            if match is None:
+                continue
+            bounds = _parse_bounds(match.group("rest"))
+            if bounds is None or any(math.isnan(bound) for bound in bounds):
+                continue
+            if trajectory and trajectory[-1][1:] == list(bounds):
+                continue
+            trajectory.append([float(match.group("time")), *bounds])
+    return trajectory
+
+
+def bound_gap(bound: float, reference: float | None) -> float:
+    """
+    The gap function of the primal integral (Berthold, 2013): 0 at the reference value, 1 when the bound is missing,
+    infinite or on the other side of zero, and the relative difference otherwise.
+    """
+    if reference is None or not math.isfinite(bound) or not math.isfinite(reference):
+        return 1.0
+    if bound == reference:
+        return 0.0
+    if bound * reference < 0:
+        return 1.0
+    return abs(reference - bound) / max(abs(reference), abs(bound))
+
+
+def bound_integral(times: list[float], bounds: list[float], reference: float | None, end_time: float) -> float:
+    """
+    Integrates the gap of a bound to the reference over time, from the start of the run to end_time.
+    The gap is 1 until the first bound is known.
+    """
+    integral = 0.0
+    previous_time = 0.0
+    previous_gap = 1.0
+    for time, bound in zip(times, bounds):
+        time = min(time, end_time)
+        integral += previous_gap * (time - previous_time)
+        previous_time = time
+        previous_gap = bound_gap(bound, reference)
+    return integral + previous_gap * max(end_time - previous_time, 0.0)
+
+
+def time_to_gap(trajectory: list[list[float]], target: float = TARGET_GAP) -> float | None:
+    """
+    The first time the relative gap between the bounds, computed like SHOT does, is at most the target.
+    """
+    for time, dual, primal in trajectory:
+        if math.isfinite(dual) and math.isfinite(primal) and abs(primal - dual) / (1e-10 + abs(primal)) <= target:
+            return time
+    return None
+
+
+def _finite_or_none(value: float) -> float | None:
+    return value if math.isfinite(value) else None
+
+
+def parse_log(path: str, end_time: float | None = None, reference: float | None = None) -> dict:
+    """
+    Parses the bound trajectory of a SHOT log and computes the primal integral, dual integral and time to a 1% gap.
+    The integrals are measured to the reference objective value, by default the final primal bound of the run, over
+    the time until end_time, by default the last logged iteration.
+    Infinite bounds are stored as None, to keep the results valid JSON.
+    """
+    trajectory = read_bound_trajectory(path)
+    if not trajectory:
+        return {"bounds": [], "primal_integral": None, "dual_integral": None, "time_to_gap": None}
+    times = [point[0] for point in trajectory]
+    if reference is None and math.isfinite(trajectory[-1][2]):
+        reference = trajectory[-1][2]
+    if end_time is None:
+        end_time = times[-1]
+    return {
+        "bounds": [[time, _finite_or_none(dual), _finite_or_none(primal)] for time, dual, primal in trajectory],
+        "primal_integral": bound_integral(times, [point[2] for point in trajectory], reference, end_time),
+        "dual_integral": bound_integral(times, [point[1] for point in trajectory], reference, end_time),
+        "time_to_gap": time_to_gap(trajectory)
+    }
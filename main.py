@@ -4,34 +4,189 @@ import argparse
 import contextlib
 import json
 import os
+import shutil
+import signal
+import subprocess
 import sys
-import xml.etree.ElementTree as ET
+import tempfile
+import threading
+import time
 from collections import defaultdict
 from inspect import getsourcefile
+from typing import TYPE_CHECKING, Callable
 
-from git import Repo
+import numpy as np
+from git import GitCommandError, Repo
 
-from allas import Allas
-from github_api import GithubAPI
-from utils import is_git_repo
+from archive import archive_artifacts, download_artifacts, get_artifact_prefix
+from bisection import (BAD_FRACTION, bisect_commits, find_regressed_problems, regression_evidence,
+                       regression_fraction)
+from calibration import calibration_result, measure_kernel
+from columnar import COLUMNS_EXTENSION, ResultColumns, convert_file, load_columns, to_columns, write_columns
+from comparison import FASTER, SLOWER, TOTAL_PHASE, attribute_phases, compare_results, result_names
+from github_data import GithubData
+from history import DEFAULT_WORKERS, build_history, fetch_results, is_flagged, thread_local_factory
+from journal import RunJournal, get_journal_path
+from log_parser import LOG_METRICS
+from matrix import SolverConfig, interleave_runs, load_matrix
+from osrl_parser import parse_run, parse_runs
+from profiler import (DEFAULT_SAMPLE_FREQUENCY, MAX_SAMPLE_FREQUENCY, PROFILE_RECORD, PROFILE_STAT,
+                      is_perf_available, parse_perf_stat)
+from problems import fetch_problems
+from results_store import ResultsStore, get_data_suffix, sync_from_storage, sync_to_storage
+from run_cache import DEFAULT_RUN_CACHE_DIR, RunCache, apply_run_cache, save_runs
+from runner import RUN_STATUS_FAILED, BenchmarkRun, collect_run_files, run_benchmarks
+from scheduler import RunScheduler
+from serve import DEFAULT_MAX_PENDING, POLL_INTERVAL, JobSpool, start_socket_server
+from serve import DEFAULT_WORKERS as SERVE_WORKERS
+from sharding import assign_shards, get_manifest_path, merge_shards, parse_shard, write_shard_manifest
+from storage import STORAGE_ALLAS, STORAGE_LOCAL, Storage, create_storage
+from tracing import traced, tracer
+
+if TYPE_CHECKING:
+    from github_api import GithubAPI
 
 parser = argparse.ArgumentParser(
     prog="Shot benchmarker",
     description="Used to benchmark the SHOT program"
 )
+parser.add_argument("command", nargs="?", default="run",
+                    choices=["run", "sync", "merge", "history", "bisect", "artifacts", "convert",
+                             "serve"],
+                    help="run: benchmark SHOT, sync: mirror the local results database to and from the result storage, "
+                         "merge: combine the data files of shards, history: report the time trends of recent commits, "
+                         "bisect: find the commit that made the regressed benchmarks slower, "
+                         "artifacts: download the archived run files of a problem, "
+                         "convert: convert data files between the JSON and the columnar format, "
+                         "serve: run the benchmark jobs submitted to a spool directory or socket as they arrive")
+parser.add_argument("files", nargs="*",
+                    help="The data files of the shards, used with the merge command, or the files to convert")
 parser.add_argument("-c", "--compare", action="store_true")
 parser.add_argument("-s", "--store-result", action="store_true")
 parser.add_argument("-r", "--runs", type=int, default=1, help="Number of runs to perform")
+parser.add_argument("-a", "--adaptive", action="store_true",
+                    help="Repeat each problem until its timing confidence interval is narrow enough, instead of --runs")
+parser.add_argument("--min-runs", type=int, default=3, help="Minimum number of runs per problem, used with --adaptive")
+parser.add_argument("--max-runs", type=int, default=20, help="Maximum number of runs per problem, used with --adaptive")
+parser.add_argument("--target-ci-width", type=float, default=0.05,
+                    help="Target width of the 95%% confidence interval relative to the mean, used with --adaptive")
+parser.add_argument("--time-budget", type=float, default=None,
+                    help="Maximum total wall time in seconds spent on a single problem, used with --adaptive")
+parser.add_argument("-w", "--warmup", type=int, default=0,
+                    help="Number of warmup runs per problem, executed before the measurements and thrown away")
+parser.add_argument("--shuffle", action="store_true",
+                    help="Randomize the order of the problems separately for every run, instead of a fixed order")
+parser.add_argument("--seed", type=int, default=None, help="Seed for --shuffle")
+parser.add_argument("--calibrate", action="store_true",
+                    help="Time a calibration kernel before and after the runs, to normalize times to the machine speed")
+parser.add_argument("--shard", type=str, default=None,
+                    help="Only run shard i/N of the problems, balanced by their historical runtimes")
 parser.add_argument("--sha", type=str, help="SHA of the commit to compare to")
+parser.add_argument("-t", "--timeout", type=float, default=None,
+                    help="Wall-clock limit in seconds for a single SHOT run, the run is killed when it expires")
+parser.add_argument("-j", "--jobs", type=int, default=1,
+                    help="Number of SHOT instances to run concurrently, each pinned to its own cores")
+parser.add_argument("--search-depth", type=int, default=int(os.environ.get("INPUT_BASELINE_DEPTH") or 50),
+                    help="Number of previous commits to search for a baseline to compare to")
+parser.add_argument("-i", "--incremental", action="store_true",
+                    help="Only execute the runs whose results are not already in the run cache")
+parser.add_argument("--remote-run-cache", action="store_true",
+                    help="Also keep the run cache in the result storage, used with --incremental")
+parser.add_argument("--results-db", type=str, default=os.environ.get("INPUT_RESULTS_DB") or "results.sqlite",
+                    help="Path of the local results database")
+parser.add_argument("--profile", nargs="?", const=PROFILE_STAT, choices=[PROFILE_STAT, PROFILE_RECORD], default=None,
+                    help="Run the profiled problems under perf stat (hardware counters, the default) or perf record "
+                         "(sampled call graphs), skipped when perf is not available")
+parser.add_argument("--profile-problems", type=str, default=None,
+                    help="Comma separated problems to profile, used with --profile. Defaults to every problem")
+parser.add_argument("--profile-frequency", type=int, default=DEFAULT_SAMPLE_FREQUENCY,
+                    help="Sampling frequency of perf record in Hz, capped at {0}".format(MAX_SAMPLE_FREQUENCY))
+parser.add_argument("--history-commits", type=int, default=30,
+                    help="Number of recent commits on the branch to load, used with the history command")
+parser.add_argument("--history-workers", type=int, default=DEFAULT_WORKERS,
+                    help="Number of results fetched from the result storage concurrently, "
+                         "used with the history command")
+parser.add_argument("--matrix", type=str, default=os.environ.get("INPUT_MATRIX") or None,
+                    help="JSON file listing several SHOT configurations to run interleaved on every problem, "
+                         "each stored with its name as the result suffix and compared in pairs to the first")
+parser.add_argument("--good", type=str, default=None, help="SHA of the last known good commit, used with bisect")
+parser.add_argument("--bad", type=str, default=None, help="SHA of the known bad commit, used with bisect")
+parser.add_argument("--shot-source", type=str, default=os.environ.get("INPUT_SHOT_SOURCE"),
+                    help="Git checkout of SHOT used to build the commits without stored results, used with bisect")
+parser.add_argument("--build-command", type=str,
+                    default=os.environ.get("INPUT_BUILD_COMMAND") or
+                    "cmake -B build -DCMAKE_BUILD_TYPE=Release && cmake --build build --parallel",
+                    help="Shell command building SHOT in --shot-source, used with bisect")
+parser.add_argument("--build-output", type=str, default=os.environ.get("INPUT_BUILD_OUTPUT") or "build/SHOT",
+                    help="Path of the SHOT executable built by --build-command, relative to --shot-source")
+parser.add_argument("--resume", action="store_true",
+                    help="Continue an interrupted run from its journal, only executing the runs that are not in it")
+parser.add_argument("--storage", choices=[STORAGE_ALLAS, STORAGE_LOCAL],
+                    default=os.environ.get("INPUT_STORAGE") or STORAGE_ALLAS,
+                    help="Where the results are shared between jobs: the Allas bucket, or a local directory")
+parser.add_argument("--storage-dir", type=str, default=os.environ.get("INPUT_STORAGE_DIR") or None,
+                    help="The directory of the local result storage, used with --storage local")
+parser.add_argument("--archive", action="store_true",
+                    default=(os.environ.get("INPUT_ARCHIVE_ARTIFACTS") or "").lower() == "true",
+                    help="Upload the trc, log and osrl files of the runs to the result storage, as compressed bundles")
+parser.add_argument("--problem", type=str, default=None,
+                    help="The problem whose run files to download, used with the artifacts command and --sha")
+parser.add_argument("--trace", type=str, default=os.environ.get("INPUT_TRACE") or None,
+                    help="Write the time spent in every stage of the harness to this file, in the Chrome trace format")
+parser.add_argument("--spool-dir", type=str, default=os.environ.get("INPUT_SPOOL_DIR") or "spool",
+                    help="The job queue of the serve command, jobs dropped into its incoming/ folder are run")
+parser.add_argument("--serve-socket", type=str, default=None,
+                    help="Also accept the jobs of the serve command on this Unix socket, one JSON object per line")
+parser.add_argument("--serve-jobs", type=int, default=SERVE_WORKERS,
+                    help="Number of jobs the serve command runs at the same time")
+parser.add_argument("--max-pending", type=int, default=DEFAULT_MAX_PENDING,
+                    help="Number of waiting jobs after which the serve command refuses new ones")
+parser.add_argument("--problems-refresh", type=float, default=3600,
+                    help="Seconds after which the serve command updates the problem checkout, once it is idle")
+parser.add_argument("--sync-direction", choices=["pull", "push", "both"], default="both",
+                    help="Direction to sync the results database in, used with the sync command")
 args = parser.parse_args()
 
+# The suffix of the results of bisection runs, which only hold the regressed benchmarks.
+BISECT_SUFFIX = "-bisect"
+# The history report only lists this many of the changed benchmarks, the rest are in the JSON file.
+MAX_HISTORY_ROWS = 50
+
 
 def main():
+    if args.command == "sync":
+        sync_results()
+        return
+    if args.command == "history":
+        history_report()
+        return
+    if args.command == "bisect":
+        bisect_regression()
+        return
+    if args.command == "artifacts":
+        fetch_problem_artifacts()
+        return
+    if args.command == "convert":
+        convert_results()
+        return
+    if args.command == "serve":
+        serve_jobs()
+        return
     if args.sha is not None and args.compare is False:
         print("Cannot compare to a specific SHA without passing --compare")
         sys.exit(1)
-    if args.sha is not None:
+    if args.sha is not None and not is_verified_sha(args.sha):
         check_sha(args.sha)
+    if args.command == "merge":
+        merge_results()
+        return
+    shard = None
+    if args.shard is not None:
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
 
     benchmark_folder = os.environ.get("INPUT_BENCHMARK_FOLDER")
     benchmark_type = os.environ.get("INPUT_BENCHMARK_TYPE")
@@ -48,22 +203,33 @@ def main():
         print("SHOT executable does not exist")
         sys.exit(1)
 
+    # The matrix executables are resolved before we change the working directory.
+    matrix_configs = None
+    if args.matrix is not None:
+        if args.adaptive:
+            print("The matrix mode cannot be combined with --adaptive")
+            sys.exit(1)
+        try:
+            matrix_configs = load_matrix(args.matrix, is_gams, is_gurobi)
+        except (OSError, ValueError) as e:
+            print("Error reading the matrix {0}: {1}".format(args.matrix, e))
+            sys.exit(1)
+
     print("SHOT executable: ", shot_executable)
     if benchmarks is None or benchmarks == "" or benchmarks == 'all':
         benchmarks = "all"
     else:
         benchmarks = benchmarks.split(",")
         benchmark_files = ["{0}.{1}".format(benchmark, benchmark_type) for benchmark in benchmarks]
-    # Cloning the repo to a subfolder of the current working directory
-    repo_dir = os.path.join(os.getcwd(), "SHOT_benchmark_problems")
-    if os.path.isdir(repo_dir) and is_git_repo(repo_dir):
-        print("Repo already exists")
-        bench_repo = Repo(repo_dir)
-        bench_repo.git.checkout("main")
-        bench_repo.git.pull()
-    else:
-        print("Cloning repo")
-        Repo.clone_from("https://github.com/andreaslundell/SHOT_benchmark_problems.git", repo_dir)
+    # Fetching only the needed problems to a subfolder of the current working directory, or to the cached folder
+    repo_dir = os.environ.get("INPUT_PROBLEMS_DIR") or os.path.join(os.getcwd(), "SHOT_benchmark_problems")
+    problems_revision = os.environ.get("INPUT_PROBLEMS_REVISION") or "main"
+    try:
+        problems_sha = fetch_problems(repo_dir, benchmark_folder, benchmark_type, problems_revision)
+    except (GitCommandError, ValueError) as e:
+        print("Error fetching the benchmark problems: {0}".format(e))
+        sys.exit(1)
+    print("Problem set revision: {0}".format(problems_sha))
 
     # Check if the benchmark folder exists
     if not os.path.isdir(os.path.join(repo_dir, benchmark_folder)):
@@ -86,67 +252,323 @@ def main():
         benchmarks_paths = [os.path.join(repo_dir, benchmark_folder, benchmark_type, benchmark) for benchmark in
                             os.listdir(os.path.join(repo_dir, benchmark_folder, benchmark_type))]
 
+    current_path = os.path.dirname(os.path.abspath(getsourcefile(lambda: 0)))
+    benchmark_dest = get_benchmark_dest(current_path)
+    problems = [(os.path.basename(benchmark).split(".")[0], benchmark) for benchmark in benchmarks_paths]
+    all_problem_names = [name for name, _ in problems]
+    if shard is not None:
+        weights = get_shard_weights(problems, current_path, benchmark_dest, comparison_suffix)
+        problems = assign_shards(problems, weights, shard[1])[shard[0] - 1]
+        print("Running shard {0}/{1} with {2} of {3} benchmarks".format(shard[0], shard[1], len(problems),
+                                                                         len(all_problem_names)))
+
     # Print the benchmarks
     print("Selected benchmarks:")
-    for benchmark in benchmarks_paths:
+    for _, benchmark in problems:
         print(benchmark)
 
     print("Executing SHOT located at: {0}".format(shot_executable))
     # Changes the working directory to the shot folder
+    shot_executable = os.path.abspath(shot_executable)
     os.chdir(os.path.dirname(shot_executable))
+    # A plain run is a matrix with a single configuration, which is stored without an extra suffix.
+    configs = matrix_configs or [SolverConfig(name="", executable=shot_executable, is_gams=is_gams,
+                                              is_gurobi=is_gurobi)]
+    if matrix_configs is not None:
+        print("Running the configurations {0} interleaved".format(", ".join(config.name for config in configs)))
+    expected_times = get_expected_times(benchmark_dest, configs[0].suffix(comparison_suffix))
+
+    # Without any previous timings, the problem file size is used as a rough estimate instead.
+    if expected_times:
+        expected_times = {name: expected_times.get(name, float("inf")) for name, _ in problems}
+    else:
+        expected_times = {name: os.path.getsize(benchmark) for name, benchmark in problems}
+    scheduler = RunScheduler(problems, runs=args.runs, adaptive=args.adaptive, min_runs=args.min_runs,
+                             max_runs=args.max_runs, target_width=args.target_ci_width,
+                             time_budget=args.time_budget, expected_times=expected_times, shuffle=args.shuffle,
+                             seed=args.seed)
+
+    # In incremental mode, the runs that are already known are restored from the run cache instead of executed.
+    if args.incremental:
+        run_cache = RunCache(os.environ.get("INPUT_RUN_CACHE_DIR") or DEFAULT_RUN_CACHE_DIR,
+                             storage=open_storage() if args.remote_run_cache else None)
 
-    # Run the benchmarks
-    for i in range(args.runs):
-        for benchmark in benchmarks_paths:
-            print("Running benchmark: {0}".format(benchmark))
-            benchmark_name = os.path.basename(benchmark).split(".")[0]
-            os.system(
-                "{0} {1} --trc {2}-run-{3}.trc --log {2}-run-{3}.log --osrl {2}-run-{3}.osrl".format(shot_executable,
-                                                                                                     benchmark,
-                                                                                                     benchmark_name, i))
+    # Profiling is opt-in, and the runs go on without it on machines where perf is missing or not permitted.
+    profiled_problems = set()
+    if args.profile is not None:
+        if is_perf_available(args.profile):
+            profiled_problems = set(name for name, _ in problems)
+            if args.profile_problems:
+                profiled_problems &= set(args.profile_problems.split(","))
+            print("Profiling {0} benchmarks with perf {1}".format(len(profiled_problems), args.profile))
+        else:
+            print("perf {0} is not available on this machine, running without profiling".format(args.profile))
+
+    if args.calibrate:
+        calibration_before = measure_kernel()
+
+    # The warmup runs are not cached or collected, their results are simply discarded.
+    if args.warmup > 0:
+        print("Running {0} warmup runs per benchmark".format(args.warmup))
+        scratch_root = tempfile.mkdtemp(prefix="shot-benchmarker-")
+        run_benchmarks(shot_executable, interleave_runs(scheduler.warmup_runs(args.warmup), configs), jobs=args.jobs,
+                       scratch_root=scratch_root, timeout=args.timeout, longest_first=not args.shuffle)
+        shutil.rmtree(scratch_root, ignore_errors=True)
+
+    # Run the benchmarks in rounds decided by the scheduler, every run gets its own scratch directory so
+    # concurrent runs never collide.
+    # Every finished run is written to the journal and the progress table right away, so a cancelled job keeps
+    # what it has done, and --resume continues from there.
+    journal = RunJournal(get_journal_path(benchmark_dest, comparison_suffix), resume=args.resume)
+    write_progress_header(is_ci)
+    run_keys = {}
+
+    def on_run_complete(run: BenchmarkRun):
+        # Move the files to a separate folder.
+        collect_run_files([run], benchmark_dest)
+        if args.incremental and not run.profile:
+            save_runs(run_cache, [run], run_keys[run.config], os.path.join(benchmark_dest, run.config))
+        time = get_total_time(run, os.path.join(benchmark_dest, run.config))
+        journal.append(run, time)
+        write_progress_row(run, time, is_ci)
+
+    # In matrix mode, every run is executed once per configuration, right after each other.
+    runs = []
+    round_runs = interleave_runs(scheduler.initial_runs(), configs)
+    while round_runs:
+        for run in round_runs:
+            if run.name in profiled_problems:
+                run.profile = args.profile
+        pending_runs = journal.restore(round_runs, benchmark_dest)
+        if args.incremental:
+            # Profiled runs are always executed, and their timings include the perf overhead so they are not cached.
+            missing = set()
+            for config in configs:
+                config_runs = [run for run in pending_runs if run.config == config.name and not run.profile]
+                config_missing, run_keys[config.name] = apply_run_cache(
+                    run_cache, config_runs, config.executable, config.options(args.timeout),
+                    config.run_directory(benchmark_dest))
+                missing.update(id(run) for run in config_missing)
+            for run in pending_runs:
+                if not run.profile and id(run) not in missing:
+                    journal.append(run, get_total_time(run, os.path.join(benchmark_dest, run.config)))
+            # Filtered in the original order, to keep the configurations interleaved.
+            pending_runs = [run for run in pending_runs if run.profile or id(run) in missing]
+        scratch_root = tempfile.mkdtemp(prefix="shot-benchmarker-")
+        run_benchmarks(shot_executable, pending_runs, jobs=args.jobs, scratch_root=scratch_root,
+                       timeout=args.timeout, longest_first=not args.shuffle,
+                       profile_frequency=args.profile_frequency, on_complete=on_run_complete)
+        shutil.rmtree(scratch_root, ignore_errors=True)
+        if args.adaptive:
+            for run in round_runs:
+                scheduler.record(run, journal.get_time(run))
+        runs.extend(round_runs)
+        round_runs = interleave_runs(scheduler.next_runs(), configs)
+    journal.close()
+    # Ends the progress table, so the results that follow are not part of it.
+    with smart_open(os.environ['GITHUB_STEP_SUMMARY'] if is_ci else None) as fh:
+        print("", file=fh)
+    calibration = None
+    if args.calibrate:
+        calibration = calibration_result(calibration_before, measure_kernel())
+        print("Calibration factor: {0}".format(round(calibration["factor"], 3)))
+    run_counts = {name: scheduler.run_counts[name] for name, _ in problems}
 
     if is_ci:
         with open(os.environ['GITHUB_OUTPUT'], 'a') as fh:
             print("benchmarks={0}".format(",".join(benchmarks)), file=fh)
+            print("problems_revision={0}".format(problems_sha), file=fh)
+
+    benchmark_names = [name for name, _ in problems]
+    results_by_config = {}
+    for config in configs:
+        run_results = {(run.name, run.run): run for run in runs if run.config == config.name}
+        comparison_data = build_comparison_data(benchmark_names, run_counts, run_results,
+                                                config.run_directory(benchmark_dest), scheduler, calibration)
+        results_by_config[config.name] = comparison_data
+        config_suffix = config.suffix(comparison_suffix)
+
+        summary_lines = ["Problem set revision: {0}".format(problems_sha)]
+        if config.name:
+            summary_lines.append("Configuration: {0} ({1} {2})".format(config.name, config.executable,
+                                                                       " ".join(config.arguments)).strip())
+        if calibration is not None:
+            summary_lines.append("Calibration factor: {0}".format(round(calibration["factor"], 3)))
+        if shard is not None:
+            summary_lines.append("Shard {0}/{1}".format(*shard))
+        write_benchmark_summary(comparison_data, is_ci, config.is_gams, config.is_gurobi, summary_lines)
+
+        if args.archive:
+            handle_archive(config.run_directory(benchmark_dest), run_counts, config_suffix,
+                           part="" if shard is None else "-shard-{0}".format(shard[0]))
+
+        # In sharded mode, the results are compared and uploaded by the merge step instead.
+        if shard is not None:
+            write_shard_results(comparison_data, benchmark_dest, config_suffix, shard,
+                                [name for name, _ in problems], all_problem_names)
+            continue
+
+        publish_results(comparison_data, benchmark_dest, config_suffix, current_path, is_ci, config.is_gams,
+                        config.is_gurobi)
+
+    if len(configs) > 1:
+        write_matrix_comparison(configs, results_by_config, benchmark_dest, comparison_suffix, is_ci)
+
+
+@traced("Aggregate results")
+def build_comparison_data(benchmark_names: list[str], run_counts: dict, run_results: dict, run_directory: str,
+                          scheduler: RunScheduler, calibration: dict | None) -> list:
+    """
+    Parses the files of the runs in run_directory, and builds the results of every benchmark in the data.json format.
+    """
+    # We parse the osrl and trc files of every run and extract the needed information.
+    # Runs that timed out or crashed have no usable results, so we store the run status instead.
+    parsed_runs = [(benchmark, i) for benchmark in benchmark_names for i in range(run_counts[benchmark])
+                   if run_results[(benchmark, i)].completed and
+                   os.path.isfile('{0}/{1}-run-{2}.osrl'.format(run_directory, benchmark, i))]
+    run_files = [('{0}/{1}-run-{2}.osrl'.format(run_directory, benchmark, i),
+                  '{0}/{1}-run-{2}.trc'.format(run_directory, benchmark, i),
+                  '{0}/{1}-run-{2}.log'.format(run_directory, benchmark, i)) for benchmark, i in parsed_runs]
+    parsed_results = dict(zip(parsed_runs, parse_runs(run_files, jobs=args.jobs)))
 
-    # Move the files to a separate folder.
-    current_path = os.path.dirname(os.path.abspath(getsourcefile(lambda: 0)))
-    benchmark_dest = "{0}/benchmarks".format(current_path)
-    os.makedirs(benchmark_dest, exist_ok=True)
-    benchmark_names = []
-    for benchmark in benchmarks_paths:
-        benchmark_names.append(os.path.basename(benchmark).split(".")[0])
-    for i in range(args.runs):
-        for benchmark in benchmark_names:
-            os.rename("{0}/{1}-run-{2}.osrl".format(os.path.dirname(shot_executable), benchmark, i),
-                      "{0}/{1}-run-{2}.osrl".format(benchmark_dest, benchmark, i))
-            os.rename("{0}/{1}-run-{2}.trc".format(os.path.dirname(shot_executable), benchmark, i),
-                      "{0}/{1}-run-{2}.trc".format(benchmark_dest, benchmark, i))
-            os.rename("{0}/{1}-run-{2}.log".format(os.path.dirname(shot_executable), benchmark, i),
-                      "{0}/{1}-run-{2}.log".format(benchmark_dest, benchmark, i))
-
-    # We parse the osrl files and extract the needed information.
     bench_times = defaultdict(lambda: defaultdict(dict))
     statuses = defaultdict(lambda: defaultdict(dict))
     for benchmark in benchmark_names:
-        for i in range(args.runs):
-            tree = ET.parse('{0}/{1}-run-{2}.osrl'.format(benchmark_dest, benchmark, i))
-            root = tree.getroot()
-            times = {}
-            # Save the times
-            for element in root.iter('{os.optimizationservices.org}time'):
-                times[element.attrib['type']] = element.text
-            bench_times[benchmark][i] = times
+        for i in range(run_counts[benchmark]):
+            result = parsed_results.get((benchmark, i))
+            if result is None or "error" in result:
+                bench_times[benchmark][i] = {}
+                run = run_results[(benchmark, i)]
+                # A completed run without a readable osrl file counts as failed.
+                status = RUN_STATUS_FAILED if run.completed else run.run_status or RUN_STATUS_FAILED
+                statuses[benchmark][i] = {"status": status, "substatus": ""}
+                continue
+            bench_times[benchmark][i] = dict(result["times"])
+            statuses[benchmark][i] = {"status": result["status"], "substatus": result["substatus"]}
 
-            statuses[benchmark][i] = defaultdict(lambda: {"status": "", "substatus": ""})
+    comparison_data = []
+    for benchmark in benchmark_names:
+        run_data = []
+        for i in range(run_counts[benchmark]):
+            result = parsed_results.get((benchmark, i), {})
+            # Convert the time to a float
+            try:
+                total_time = float(bench_times[benchmark][i]["Total"])
+            except (KeyError, TypeError, ValueError):
+                total_time = None
+            counters_file = '{0}/{1}-run-{2}.perf.csv'.format(run_directory, benchmark, i)
+            counters = {}
+            if run_results[(benchmark, i)].profile == PROFILE_STAT and os.path.isfile(counters_file):
+                counters = parse_perf_stat(counters_file)
+            run_data.append({"time": total_time, "status": statuses[benchmark][i]["status"],
+                             "substatus": statuses[benchmark][i]["substatus"],
+                             "objective_value": (result.get("objective_values") or [None])[-1],
+                             "primal_bound": result.get("primal_bound"),
+                             "dual_bound": result.get("dual_bound"),
+                             "trace": result.get("trace", {}),
+                             "bounds": result.get("log", {}).get("bounds", []),
+                             "primal_integral": result.get("log", {}).get("primal_integral"),
+                             "dual_integral": result.get("log", {}).get("dual_integral"),
+                             "time_to_gap": result.get("log", {}).get("time_to_gap"),
+                             "phase_times": {phase: time for phase, time in bench_times[benchmark][i].items()
+                                             if time is not None},
+                             "counters": counters,
+                             **run_results[(benchmark, i)].resources()})
+        # Only the runs that produced a time are used for the averages.
+        run_times = [float(run["time"]) for run in run_data if run["time"] is not None]
+        log_metrics = {}
+        for metric in LOG_METRICS:
+            values = [run[metric] for run in run_data if run[metric] is not None]
+            log_metrics["average_{0}".format(metric)] = sum(values) / len(values) if values else None
 
-            # Save the statuses
-            for element in root.iter('{os.optimizationservices.org}status'):
-                statuses[benchmark][i]['status'] = element.attrib['type']
+        comparison_data.append(
+            {
+                "name": benchmark,
+                "runs": run_data,
+                "average_time": sum(run_times) / len(run_times) if run_times else None,
+                "median_time": sorted(run_times)[len(run_times) // 2] if run_times else None,
+                "most_common_status": max(set([run["status"] for run in run_data]),
+                                          key=[run["status"] for run in run_data].count),
+                "most_common_substatus": max(set([run["substatus"] for run in run_data]),
+                                             key=[run["substatus"] for run in run_data].count),
+                **log_metrics,
+                "average_phase_times": get_average_phase_times(run_data),
+                "average_counters": get_average_counters(run_data),
+                **scheduler.summary(benchmark)
+            }
+        )
+        # The calibration is stored with every problem, so the results can be normalized on their own.
+        if calibration is not None:
+            comparison_data[-1]["calibration"] = calibration
+    return comparison_data
 
-            for element in root.iter('{os.optimizationservices.org}substatus'):
-                statuses[benchmark][i]['substatus'] = element.attrib['type']
 
+def write_matrix_comparison(configs: list[SolverConfig], results_by_config: dict, benchmark_dest: str,
+                            comparison_suffix: str, is_ci: bool):
+    """
+    Compares every configuration to the first one. The runs were interleaved, so run i of both configurations
+    saw the same machine conditions and the comparison is paired.
+    """
+    baseline = configs[0]
+    matrix_comparison = {}
+    rows = []
+    for config in configs[1:]:
+        names = [result["name"] for result in results_by_config[config.name]]
+        per_problem, suite = compare_results(results_by_config[config.name], results_by_config[baseline.name], names,
+                                             paired=True)
+        matrix_comparison[config.name] = {"benchmarks": per_problem, "suite": suite}
+        baseline_times = {result["name"]: result["average_time"] for result in results_by_config[baseline.name]}
+        config_times = {result["name"]: result["average_time"] for result in results_by_config[config.name]}
+        for name in names:
+            statistics = per_problem[name]
+            ratio_ci = ""
+            if statistics["time_ratio_lower"] is not None:
+                ratio_ci = "{0} - {1}".format(round(statistics["time_ratio_lower"], 3),
+                                              round(statistics["time_ratio_upper"], 3))
+            rows.append([name, config.name, round_or_empty(baseline_times.get(name)),
+                         round_or_empty(config_times.get(name)), round_or_empty(statistics["time_ratio"], 3),
+                         ratio_ci, statistics["time_classification"]])
+
+    with open("{0}/matrix-comparison{1}.json".format(benchmark_dest, comparison_suffix), "w") as json_file:
+        json.dump({"baseline": baseline.name, "configurations": matrix_comparison}, json_file, sort_keys=True,
+                  indent=4)
+
+    with smart_open(os.environ['GITHUB_STEP_SUMMARY'] if is_ci else None) as fh:
+        print("# Configuration comparison", file=fh)
+        print("Paired comparison of the interleaved runs against {0}".format(baseline.name), file=fh)
+        for name, comparison in matrix_comparison.items():
+            suite = comparison["suite"]
+            if suite.get("problems"):
+                print("{0}: shifted geometric mean ratio {1} (95% CI {2} - {3}) over {4} benchmarks".format(
+                    name, round(suite["ratio"], 3), round(suite["ratio_lower"], 3), round(suite["ratio_upper"], 3),
+                    suite["problems"]), file=fh)
+        headers = ["Benchmark", "Configuration", "Baseline time", "Time", "Time ratio", "95% CI", "Result"]
+        print(generate_markdown_table(headers, rows), file=fh)
+
+
+def write_progress_header(is_ci: bool):
+    with smart_open(os.environ['GITHUB_STEP_SUMMARY'] if is_ci else None) as fh:
+        print("# Progress", file=fh)
+        print("| Benchmark | Run | Status | Time | Wall Time |", file=fh)
+        print("| --- | --- | --- | --- | --- |", file=fh)
+
+
+def write_progress_row(run: BenchmarkRun, time: float | None, is_ci: bool):
+    """
+    Appends a finished run to the progress table of the job summary, as soon as it is done.
+    """
+    name = "{0} ({1})".format(run.name, run.config) if run.config else run.name
+    with smart_open(os.environ['GITHUB_STEP_SUMMARY'] if is_ci else None) as fh:
+        print("| {0} | {1} | {2} | {3} | {4} |".format(name, run.run, run.run_status, round_or_empty(time),
+                                                      round_or_empty(run.wall_time)), file=fh)
+
+
+@traced("Write summary")
+def write_benchmark_summary(comparison_data: list, is_ci: bool, is_gams: bool, is_gurobi: bool,
+                            summary_lines: list[str] | None = None):
+    """
+    Writes the per run results of every benchmark as Markdown tables to the job summary.
+    """
     if is_ci:
         file = os.environ['GITHUB_STEP_SUMMARY']
     else:
@@ -155,97 +577,70 @@ def main():
     with smart_open(file) as fh:
         print('# Benchmark results', file=fh)
         print_benchmark_type(fh, is_gams, is_gurobi)
-        for benchmark in benchmark_names:
+        for line in summary_lines or []:
+            print(line, file=fh)
+        for result in comparison_data:
+            benchmark = result["name"]
             print("## {0}".format(benchmark), file=fh)
             times = []
-            headers = ["Benchmark", "Total Time", "Status", "Substatus"]
+            headers = ["Benchmark", "Total Time", "Status", "Substatus", "Wall Time", "CPU Time", "Peak RSS (MB)"]
             data = []
-            for i in range(args.runs):
-                # Convert the time to a float
-                try:
-                    bench_times[benchmark][i]["Total"] = float(bench_times[benchmark][i]["Total"])
-                except ValueError:
-                    print("Error while parsing time for {0}".format(benchmark), file=fh)
-                    continue
+            for i, run in enumerate(result["runs"]):
+                cpu_time = ""
+                if run.get("user_time") is not None and run.get("sys_time") is not None:
+                    cpu_time = round(run["user_time"] + run["sys_time"], 2)
+                max_rss = round(run["max_rss"] / 1024, 1) if run.get("max_rss") is not None else ""
                 # We generate the Markdown table
                 data.append([
                     "{0} Run #{1}".format(benchmark, str(i)),
-                    round(bench_times[benchmark][i]["Total"], 2),
-                    statuses[benchmark][i]["status"],
-                    statuses[benchmark][i]["substatus"]
+                    round_or_empty(run["time"]),
+                    run["status"],
+                    run["substatus"],
+                    round_or_empty(run.get("wall_time")),
+                    cpu_time,
+                    max_rss
                 ])
-                times.append(bench_times[benchmark][i]["Total"])
+                if run["time"] is not None:
+                    times.append(run["time"])
             markdown_table = generate_markdown_table(headers, data)
             # We write the Markdown table to the output file
             print(markdown_table, file=fh)
+            if len(times) == 0:
+                print("No successful runs", file=fh)
+                continue
             print("Average time: {0}".format(round(sum(times) / len(times), 2)), file=fh)
             print("Median time: {0}".format(round(sorted(times)[len(times) // 2], 2)), file=fh)
+            if "run_count" in result:
+                print("Runs: {0}".format(result["run_count"]), file=fh)
 
-    comparison_data = []
-    for benchmark in benchmark_names:
-        run_data = []
-        for i in range(args.runs):
-            run_data.append({"time": bench_times[benchmark][i]["Total"], "status": statuses[benchmark][i]["status"],
-                             "substatus": statuses[benchmark][i]["substatus"]})
-
-        comparison_data.append(
-            {
-                "name": benchmark,
-                "runs": run_data,
-                "average_time": sum([float(run["time"]) for run in run_data]) / len(run_data),
-                "median_time": sorted([float(run["time"]) for run in run_data])[len(run_data) // 2],
-                "most_common_status": max(set([run["status"] for run in run_data]),
-                                          key=[run["status"] for run in run_data].count),
-                "most_common_substatus": max(set([run["substatus"] for run in run_data]),
-                                             key=[run["substatus"] for run in run_data].count)
-            }
-        )
 
-    # Finally, write the data to a file, and prepare it for upload
-    with open('data.json', 'w') as json_file:
+@traced("Publish results")
+def publish_results(comparison_data: list, benchmark_dest: str, comparison_suffix: str, current_path: str,
+                    is_ci: bool, is_gams: bool, is_gurobi: bool):
+    """
+    Writes data.json, stores the results, and optionally uploads them and compares them to a previous commit.
+    """
+    # Finally, write the data to the benchmark destination, and prepare it for upload. Nothing is written to the
+    # working directory, so jobs sharing a SHOT folder do not collide.
+    os.makedirs(benchmark_dest, exist_ok=True)
+    data_json = "{0}/data{1}.json".format(benchmark_dest, comparison_suffix)
+    with open(data_json, 'w') as json_file:
         json.dump(comparison_data, json_file, sort_keys=True, indent=4)
+    # The columnar copy, for loading the results without parsing the JSON.
+    columns = to_columns(comparison_data)
+    write_columns("{0}/data{1}.{2}".format(benchmark_dest, comparison_suffix, COLUMNS_EXTENSION), columns)
 
-    # Move the file to the benchmark destination.
-    data_json = "{0}/data{1}.json".format(benchmark_dest, comparison_suffix)
-    os.rename("data.json", data_json)
+    store = open_results_store(current_path)
+    branch, sha = get_result_key()
+    store.store_results(branch, sha, comparison_suffix, comparison_data)
 
     if args.store_result:
-        handle_upload(data_json, comparison_suffix)
+        handle_upload(data_json, comparison_suffix, columns)
 
     if args.compare:
-        changes = prepare_comparison(comparison_data, comparison_suffix=comparison_suffix)
+        changes, suite = prepare_comparison(comparison_data, comparison_suffix=comparison_suffix, store=store)
         if changes is not None:
-            headers = ["Benchmark", "Status changed", "New status", "Old status", "Substatus changed", "New substatus",
-                       "Old substatus", "Time changed", "Time change", "New time", "Old time"]
-            markdown_data = []
-            for change in changes.keys():
-                current_changes = changes[change].get("changes", {})
-                if current_changes.get("status_change", False):
-                    status_change = ":white_check_mark:"
-                else:
-                    status_change = ":x:"
-                if current_changes.get("substatus_change", False):
-                    substatus_change = ":white_check_mark:"
-                else:
-                    substatus_change = ":x:"
-                if current_changes.get("changed_time", False):
-                    time_change = ":white_check_mark:"
-                else:
-                    time_change = ":x:"
-
-                markdown_data.append([
-                    change,
-                    status_change,
-                    changes[change].get("current", {}).get("most_common_status", ""),
-                    changes[change].get("previous", {}).get("most_common_status", ""),
-                    substatus_change,
-                    changes[change].get("current", {}).get("most_common_substatus", ""),
-                    changes[change].get("previous", {}).get("most_common_substatus", ""),
-                    time_change,
-                    round(current_changes.get("changed_time", 0), 2),
-                    round(changes[change].get("current", {}).get("average_time", ""), 2),
-                    round(changes[change].get("previous", {}).get("average_time", ""), 2)
-                ])
+            headers, markdown_data = build_change_rows(changes)
             change_table = generate_markdown_table(headers, markdown_data)
             if is_ci:
                 file = os.environ['GITHUB_STEP_SUMMARY']
@@ -254,20 +649,153 @@ def main():
             with smart_open(file) as fh:
                 print('# Comparison to previous commit', file=fh)
                 print_benchmark_type(fh, is_gams, is_gurobi)
+                if suite.get("problems"):
+                    print("Shifted geometric mean (shift {0}s) over {1} benchmarks: {2} (previous {3}), "
+                          "ratio {4} (95% CI {5} - {6})".format(suite["shift"], suite["problems"],
+                                                                round(suite["current_sgm"], 2),
+                                                                round(suite["previous_sgm"], 2),
+                                                                round(suite["ratio"], 3),
+                                                                round(suite["ratio_lower"], 3),
+                                                                round(suite["ratio_upper"], 3)), file=fh)
+                if suite.get("untested"):
+                    print("{0} benchmarks have fewer than two runs in this run or the previous one, so their time "
+                          "changes were not tested. Use --runs 2 or more to compare the times.".format(
+                              suite["untested"]), file=fh)
                 print(change_table, file=fh)
 
-            # Finally, write the data to a file, and prepare it for upload
-            with open('comparison.json', 'w') as json_file:
-                json.dump(changes, json_file, sort_keys=True, indent=4)
-
-            # Move the file to the benchmark destination.
-            data_json = "{0}/comparison{1}.json".format(benchmark_dest, comparison_suffix)
-            os.rename("comparison.json", data_json)
+            # Finally, write the comparison to the benchmark destination.
+            comparison_json = "{0}/comparison{1}.json".format(benchmark_dest, comparison_suffix)
+            with open(comparison_json, 'w') as json_file:
+                # Baselines loaded as columns hold read-only views of their problems, written out as objects.
+                json.dump({"benchmarks": changes, "suite": suite}, json_file, sort_keys=True, indent=4,
+                          default=dict)
 
     else:
         print("Failed to get changes or no changes detected, see log for more information")
 
 
+@traced("Build comparison table")
+def build_change_rows(changes: dict) -> tuple[list[str], list[list]]:
+    """
+    The header and the rows of the comparison table, one row per changed benchmark.
+    """
+    headers = ["Benchmark", "Status changed", "New status", "Old status", "Substatus changed", "New substatus",
+               "Old substatus", "Time changed", "Result", "Time ratio", "95% CI", "Time change",
+               "Normalized time change", "New time", "Old time", "Main phase change", "Primal integral change",
+               "Dual integral change", "Time to 1% gap change", "Counter changes"]
+    markdown_data = []
+    for change in changes.keys():
+        current_changes = changes[change].get("changes", {})
+        if current_changes.get("status_change", False):
+            status_change = ":white_check_mark:"
+        else:
+            status_change = ":x:"
+        if current_changes.get("substatus_change", False):
+            substatus_change = ":white_check_mark:"
+        else:
+            substatus_change = ":x:"
+        if current_changes.get("time_has_changed", False):
+            time_change = ":white_check_mark:"
+        else:
+            time_change = ":x:"
+        ratio_ci = ""
+        if current_changes.get("time_ratio_lower") is not None:
+            ratio_ci = "{0} - {1}".format(round(current_changes["time_ratio_lower"], 3),
+                                          round(current_changes["time_ratio_upper"], 3))
+        # The phase that accounts for most of a time change, so we know where to look.
+        phase_change = ""
+        if current_changes.get("time_has_changed") and current_changes.get("phase_attribution"):
+            phase, phase_time, share = current_changes["phase_attribution"][0]
+            phase_change = "{0} ({1:+.2f}s, {2:.0%})".format(phase, phase_time, share)
+
+        markdown_data.append([
+            change,
+            status_change,
+            changes[change].get("current", {}).get("most_common_status", ""),
+            changes[change].get("previous", {}).get("most_common_status", ""),
+            substatus_change,
+            changes[change].get("current", {}).get("most_common_substatus", ""),
+            changes[change].get("previous", {}).get("most_common_substatus", ""),
+            time_change,
+            current_changes.get("time_classification", ""),
+            round_or_empty(current_changes.get("time_ratio"), 3),
+            ratio_ci,
+            round_or_empty(current_changes.get("changed_time", 0)),
+            round_or_empty(current_changes.get("changed_normalized_time")),
+            round_or_empty(changes[change].get("current", {}).get("average_time")),
+            round_or_empty(changes[change].get("previous", {}).get("average_time")),
+            phase_change,
+            round_or_empty(current_changes.get("changed_primal_integral")),
+            round_or_empty(current_changes.get("changed_dual_integral")),
+            round_or_empty(current_changes.get("changed_time_to_gap")),
+            ", ".join("{0} {1:+.1%}".format(counter, change) for counter, change in
+                      sorted(current_changes.get("changed_counters", {}).items()))
+        ])
+    return headers, markdown_data
+
+
+def write_shard_results(comparison_data: list, benchmark_dest: str, comparison_suffix: str, shard: tuple[int, int],
+                        problems: list[str], all_problems: list[str]):
+    """
+    Writes the data file of a shard, with the shard manifest the merge step uses to check that nothing is missing.
+    """
+    os.makedirs(benchmark_dest, exist_ok=True)
+    data_json = "{0}/data{1}.json".format(benchmark_dest, comparison_suffix)
+    with open(data_json, 'w') as json_file:
+        json.dump(comparison_data, json_file, sort_keys=True, indent=4)
+    write_shard_manifest(get_manifest_path(data_json), shard, problems, all_problems)
+    print("Shard results written to {0}".format(data_json))
+
+
+def merge_results():
+    """
+    Combines the data files of all the shards into one result, then stores, uploads and compares it like a full run.
+    """
+    is_gams = os.environ.get("INPUT_IS_GAMS") == "true"
+    is_gurobi = os.environ.get("INPUT_IS_GUROBI") == "true"
+    is_ci = os.environ.get("CI") is not None
+    comparison_suffix = os.environ.get("INPUT_COMPARISON_SUFFIX") or ""
+    if not args.files:
+        print("No shard data files passed to merge")
+        sys.exit(1)
+    try:
+        comparison_data = merge_shards(args.files)
+    except (OSError, ValueError) as e:
+        print("Error merging the shards: {0}".format(e))
+        sys.exit(1)
+
+    current_path = os.path.dirname(os.path.abspath(getsourcefile(lambda: 0)))
+    benchmark_dest = get_benchmark_dest(current_path)
+    write_benchmark_summary(comparison_data, is_ci, is_gams, is_gurobi,
+                            ["Merged from {0} shards".format(len(args.files))])
+    publish_results(comparison_data, benchmark_dest, comparison_suffix, current_path, is_ci, is_gams, is_gurobi)
+
+
+def get_shard_weights(problems: list[tuple[str, str]], current_path: str, benchmark_dest: str,
+                      suffix: str = "") -> dict:
+    """
+    The historical runtimes used to balance the shards: the newest results of the branch in the results database,
+    or the previous local run. Problems without history get the average runtime, and without any history at all
+    the problem file sizes are used instead.
+    Every shard job has to see the same history (e.g. a synced results database) to compute the same shards.
+    """
+    store = open_results_store(current_path)
+    branch, _ = get_result_key()
+    commits = store.get_commits(branch, suffix)
+    history = {}
+    if commits:
+        for result in store.load_results(branch, commits[0], suffix):
+            if result.get("average_time") is not None:
+                history[result["name"]] = float(result["average_time"])
+    store.close()
+    if not history:
+        history = get_expected_times(benchmark_dest, suffix)
+    if not history:
+        return {name: float(os.path.getsize(problem)) for name, problem in problems}
+    default = sum(history.values()) / len(history)
+    return {name: history.get(name, default) for name, _ in problems}
+
+
 def print_benchmark_type(fh, is_gams, is_gurobi):
     """
     Prints the benchmark type to the file handle
@@ -282,11 +810,36 @@ def print_benchmark_type(fh, is_gams, is_gurobi):
         print("## Ipopt/Cbc", file=fh)
 
 
+def get_expected_times(benchmark_dest: str, suffix: str = "") -> dict:
+    """
+    Reads the average times of the previous local run, used to schedule the longest benchmarks first.
+    Returns an empty dict if there is no previous result.
+    """
+    data_json = "{0}/data{1}.json".format(benchmark_dest, suffix)
+    try:
+        with open(data_json, "r") as file:
+            return {result["name"]: float(result["average_time"]) for result in json.load(file)
+                    if result.get("average_time") is not None}
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+
+
+def get_total_time(run: BenchmarkRun, benchmark_dest: str) -> float | None:
+    """
+    Reads the total time of a finished run from its osrl file, None if the run failed.
+    """
+    osrl_file = '{0}/{1}.osrl'.format(benchmark_dest, run.file_prefix)
+    if not run.completed or not os.path.isfile(osrl_file):
+        return None
+    result = parse_run(osrl_file)
+    return result["times"].get("Total")
+
+
 def check_sha(sha):
     if sha is None:
         return
     try:
-        gh = GithubAPI()
+        gh = get_github_api()
         commit = gh.is_commit(sha)
         if commit is None:
             print("Commit {0} not found".format(sha))
@@ -296,10 +849,37 @@ def check_sha(sha):
         sys.exit(1)
 
 
-def get_comparison_dict(comparison_data: list, previous_result: list) -> dict | None:
+def get_average_phase_times(run_data: list) -> dict:
+    """
+    Averages the time of every phase over the runs that report it.
+    """
+    phase_times = defaultdict(list)
+    for run in run_data:
+        for phase, time in run.get("phase_times", {}).items():
+            phase_times[phase].append(float(time))
+    return {phase: sum(times) / len(times) for phase, times in phase_times.items()}
+
+
+def get_average_counters(run_data: list) -> dict:
+    """
+    Averages every hardware counter over the profiled runs.
+    """
+    counters = defaultdict(list)
+    for run in run_data:
+        for counter, value in run.get("counters", {}).items():
+            counters[counter].append(float(value))
+    return {counter: sum(values) / len(values) for counter, values in counters.items()}
+
+
+@traced("Compare benchmarks")
+def get_comparison_dict(comparison_data: list, previous_result: list, statistics: dict) -> dict | None:
     """
     Matches the current + previous data and returns a comparison array, that can be used by other functions.
+    A time change is only reported when it is statistically significant, the statistics are the comparison of the
+    individual run times per benchmark, see comparison.compare_results.
     """
+    if isinstance(comparison_data, ResultColumns) and isinstance(previous_result, ResultColumns):
+        return get_column_comparison_dict(comparison_data, previous_result, statistics)
     comparison_by_keys = {result["name"]: result for result in comparison_data}
     previous_by_keys = {result["name"]: result for result in previous_result}
 
@@ -311,7 +891,7 @@ def get_comparison_dict(comparison_data: list, previous_result: list) -> dict |
 
     all_changes = {}
 
-    for match in matches:
+    for match in sorted(matches):
         current = comparison_by_keys[match]
         previous = previous_by_keys[match]
         changes = {}
@@ -324,13 +904,41 @@ def get_comparison_dict(comparison_data: list, previous_result: list) -> dict |
                 "most_common_substatus", "")
 
         if "average_time" in current and "average_time" in previous:
-            changes["time_has_changed"] = current["average_time"] != previous["average_time"]
             # Here we do not use any defaults, as to once again not get false positives, if the value somehow
             # does not pass
             try:
                 changes["changed_time"] = float(current["average_time"]) - float(previous["average_time"])
-            except ValueError as e:
+            except (TypeError, ValueError) as e:
                 print("Error parsing average_time: {0}".format(e))
+            # When both sides were calibrated, the times are compared at the speed of the reference machine,
+            # so results from different runner hardware can be compared.
+            if "calibration" in current and "calibration" in previous and "changed_time" in changes:
+                current_time = float(current["average_time"]) / current["calibration"]["factor"]
+                previous_time = float(previous["average_time"]) / previous["calibration"]["factor"]
+                changes["changed_normalized_time"] = current_time - previous_time
+            changes.update(statistics[match])
+            changes["time_has_changed"] = statistics[match]["time_classification"] in (FASTER, SLOWER)
+
+        if current.get("average_phase_times") and previous.get("average_phase_times"):
+            current_phases = current["average_phase_times"]
+            previous_phases = previous["average_phase_times"]
+            changes["changed_phase_times"] = {phase: current_phases[phase] - previous_phases[phase]
+                                              for phase in set(current_phases) & set(previous_phases)}
+            changes["phase_attribution"] = attribute_phases(current_phases, previous_phases)
+
+        # The counters are compared relative to the previous value, as the raw counts vary hugely between problems.
+        if current.get("average_counters") and previous.get("average_counters"):
+            changes["changed_counters"] = {
+                counter: (current["average_counters"][counter] - previous["average_counters"][counter]) /
+                previous["average_counters"][counter]
+                for counter in set(current["average_counters"]) & set(previous["average_counters"])
+                if previous["average_counters"][counter]}
+
+        # The metrics from the bound trajectory show how fast the gap is closed, not only when the run ends.
+        for metric in LOG_METRICS:
+            key = "average_{0}".format(metric)
+            if current.get(key) is not None and previous.get(key) is not None:
+                changes["changed_{0}".format(metric)] = float(current[key]) - float(previous[key])
 
         if len(changes) == 0:
             continue
@@ -347,60 +955,771 @@ def get_comparison_dict(comparison_data: list, previous_result: list) -> dict |
     return all_changes
 
 
-def prepare_comparison(comparison_data: list, current_check: int = 1, comparison_suffix: str = "") -> dict | None:
+def _aligned_columns(current: ResultColumns, previous: ResultColumns, rows: tuple[np.ndarray, np.ndarray], key: str,
+                     labels: str) -> tuple[list[str], np.ndarray, np.ndarray]:
     """
-    Handles checking if there is a previous commit to compare, then downloads the file and reads in its contents.
-    continues on to comparison if this works.
-    If no previous commit is found, it will try to find previous commits (max 5 times) and otherwise exit.
+    The matrix column of both sides over the labels (phases or counters) they have in common, sorted by label.
     """
-    gh_api = GithubAPI()
-    allas = Allas()
-    previous_commit = gh_api.get_commit_from_head(current_check)
-    if previous_commit is None:
-        print("No previous commit found, exiting comparison")
-        return None
-    if args.sha is not None:
-        previous_commit = gh_api.repo.get_commit(args.sha)
-        current_check = None
-
-    downloaded_file_path = allas.download_file(
-        previous_commit.sha,
-        "{0}.json".format(previous_commit.sha),
-        filename_suffix=comparison_suffix
-    )
-    if downloaded_file_path is None:
-        if current_check is None:
-            print("No comparison file found in Allas, exiting comparison")
-            return None
-        print("No comparison file found for commit {0} in Allas, trying older commits".format(previous_commit.sha))
-        if current_check <= 5:
-            return prepare_comparison(comparison_data, current_check + 1, comparison_suffix=comparison_suffix)
-        else:
-            print("No comparison file found for commit {0} in Allas, exiting comparison".format(previous_commit.sha))
-            print("Attempted to find a previous commit, but failed, exiting comparison")
-            return None
+    current_labels, previous_labels = getattr(current, labels), getattr(previous, labels)
+    common = sorted(set(current_labels) & set(previous_labels))
+    current_matrix = np.asarray(current.arrays[key])[rows[0]][:, [current_labels.index(label) for label in common]]
+    previous_matrix = np.asarray(previous.arrays[key])[rows[1]][:, [previous_labels.index(label) for label in common]]
+    return common, current_matrix, previous_matrix
 
-    try:
-        with open(downloaded_file_path, "r") as file:
-            file_contents = json.load(file)
-            return get_comparison_dict(comparison_data, file_contents)
-    except OSError as e:
-        print("Error opening temporary file: {0}".format(e))
+
+def get_column_comparison_dict(current: ResultColumns, previous: ResultColumns, statistics: dict) -> dict | None:
+    """
+    get_comparison_dict for results in columns, every change is computed for all the benchmarks at once from the
+    arrays, and only the resulting changes are turned into dicts.
+    """
+    matches = sorted(set(current.names) & set(previous.names))
+    if not matches:
+        print("No common benchmarks found between this run and the previous run")
         return None
+    rows = (np.array([current.index[name] for name in matches], dtype=np.int64),
+            np.array([previous.index[name] for name in matches], dtype=np.int64))
+
+    def column(results: ResultColumns, side: int, key: str) -> np.ndarray:
+        return np.asarray(results.arrays[key])[rows[side]]
+
+    def statuses(key: str) -> np.ndarray:
+        return (np.array(current.statuses, dtype=object)[column(current, 0, key)] !=
+                np.array(previous.statuses, dtype=object)[column(previous, 1, key)])
 
+    status_change = statuses("status").tolist()
+    substatus_change = statuses("substatus").tolist()
+    current_time, previous_time = column(current, 0, "average_time"), column(previous, 1, "average_time")
+    changed_time = (current_time - previous_time).tolist()
+    has_time = (np.isfinite(current_time) & np.isfinite(previous_time)).tolist()
+    current_factor = column(current, 0, "calibration_factor")
+    previous_factor = column(previous, 1, "calibration_factor")
+    changed_normalized_time = (current_time / current_factor - previous_time / previous_factor).tolist()
+    has_normalized_time = (np.isfinite(current_factor) & np.isfinite(previous_factor)).tolist()
+
+    # The phase changes, and their attribution to the total change, see comparison.attribute_phases.
+    phases, current_phases, previous_phases = _aligned_columns(current, previous, rows, "average_phase_times",
+                                                               "phases")
+    phase_changes = current_phases - previous_phases
+    phase_present = np.isfinite(phase_changes)
+    # The total itself is not attributed.
+    attributable = phase_present.copy()
+    has_phases = (np.any(np.isfinite(current_phases), axis=1) & np.any(np.isfinite(previous_phases), axis=1))
+    if TOTAL_PHASE in phases:
+        total = phases.index(TOTAL_PHASE)
+        total_change = np.nan_to_num(current_phases[:, total]) - np.nan_to_num(previous_phases[:, total])
+        attributable[:, total] = False
+    else:
+        total_change = np.zeros(len(matches))
+    contributing = attributable & (np.nan_to_num(phase_changes) * total_change[:, None] > 0)
+    # Largest change first, ties by phase name, which is the column order.
+    order = np.argsort(np.where(contributing, -np.abs(np.nan_to_num(phase_changes)), np.inf), axis=1, kind="stable")
+    with np.errstate(invalid="ignore", divide="ignore"):
+        shares = phase_changes / total_change[:, None]
+    phase_changes_list, phase_present_list = phase_changes.tolist(), phase_present.tolist()
+    shares_list, contributing_list, order_list = shares.tolist(), contributing.tolist(), order.tolist()
+
+    counters, current_counters, previous_counters = _aligned_columns(current, previous, rows, "average_counters",
+                                                                     "counters")
+    with np.errstate(invalid="ignore", divide="ignore"):
+        counter_changes = (current_counters - previous_counters) / previous_counters
+    has_counters = (np.any(np.isfinite(current_counters), axis=1) & np.any(np.isfinite(previous_counters), axis=1))
+    counter_changes_list = counter_changes.tolist()
+    counter_present_list = (np.isfinite(counter_changes) & (previous_counters != 0)).tolist()
+
+    metrics = []
+    for metric in LOG_METRICS:
+        key = "average_{0}".format(metric)
+        difference = column(current, 0, key) - column(previous, 1, key)
+        metrics.append(("changed_{0}".format(metric), difference.tolist(), np.isfinite(difference).tolist()))
+
+    all_changes = {}
+    for i, match in enumerate(matches):
+        changes = {"status_change": status_change[i], "substatus_change": substatus_change[i]}
+        if has_time[i]:
+            changes["changed_time"] = changed_time[i]
+        if has_normalized_time[i]:
+            changes["changed_normalized_time"] = changed_normalized_time[i]
+        changes.update(statistics[match])
+        changes["time_has_changed"] = statistics[match]["time_classification"] in (FASTER, SLOWER)
+        if has_phases[i]:
+            changes["changed_phase_times"] = {phase: phase_changes_list[i][j] for j, phase in enumerate(phases)
+                                              if phase_present_list[i][j]}
+            changes["phase_attribution"] = [[phases[j], phase_changes_list[i][j], shares_list[i][j]]
+                                            for j in order_list[i][:3] if contributing_list[i][j]]
+        if has_counters[i]:
+            changes["changed_counters"] = {counter: counter_changes_list[i][j] for j, counter in enumerate(counters)
+                                           if counter_present_list[i][j]}
+        for key, difference, present in metrics:
+            if present[i]:
+                changes[key] = difference[i]
+        all_changes[match] = {
+            "changes": changes,
+            "current": current[int(rows[0][i])],
+            "previous": previous[int(rows[1][i])]
+        }
+    return all_changes
 
-def handle_upload(data_json, suffix: str = ""):
+
+def compare_to_previous(comparison_data: list, previous_result: list) -> tuple[dict | None, dict | None]:
+    """
+    Compares the results to the previous ones, running the statistical comparison once for the changes per benchmark
+    and for the whole suite.
+    """
+    names = sorted(set(result_names(comparison_data)) & set(result_names(previous_result)))
+    statistics, suite = compare_results(comparison_data, previous_result, names)
+    changes = get_comparison_dict(comparison_data, previous_result, statistics)
+    if changes is None:
+        return None, None
+    return changes, suite
+
+
+def open_storage() -> Storage:
+    """
+    Opens the result storage chosen with --storage. Only called once it is needed, so plain runs do not connect.
     """
-    Uploads the passed file to Allas
+    return create_storage(args.storage, args.storage_dir)
+
+
+def is_verified_sha(sha: str) -> bool:
+    """
+    Whether the SHA was already resolved to a full SHA on GitHub by the caller, the serve command passes the
+    baseline of a job in INPUT_VERIFIED_SHA so the job does not look it up again.
+    """
+    return sha == os.environ.get("INPUT_VERIFIED_SHA")
+
+
+def get_github_api() -> GithubAPI:
+    """
+    Connects to GitHub, PyGithub is only imported by the commands that look up commits.
+    """
+    from github_api import GithubAPI
+    return GithubAPI()
+
+
+def find_baseline(gh_api: GithubAPI, comparison_suffix: str = "", store: ResultsStore | None = None,
+                  storage: Storage | None = None) -> tuple[str | None, Storage | None]:
+    """
+    Finds the newest of the previous --search-depth commits on the branch that has results, either in the local
+    store or in the result storage. Uses one paginated commit listing and at most one storage listing, however deep
+    the search.
+    :return tuple[str | None, Storage | None]: The SHA of the baseline, and the result storage if it was needed
+    """
+    candidates = gh_api.get_recent_commit_shas(args.search_depth + 1)[1:]
+    if not candidates:
+        return None, storage
+    branch = gh_api.gh_data.short_name
+    stored = set(store.get_commits(branch, comparison_suffix)) if store is not None else set()
+    # If the previous commit is already stored locally, there cannot be a newer baseline in the result storage.
+    if candidates[0] in stored:
+        return candidates[0], storage
+
+    if storage is None:
+        storage = open_storage()
+    available = stored | storage.list_result_commits(comparison_suffix)
+    for sha in candidates:
+        if sha in available:
+            return sha, storage
+    return None, storage
+
+
+@traced("Prepare comparison")
+def prepare_comparison(comparison_data: list, comparison_suffix: str = "",
+                       store: ResultsStore | None = None) -> tuple[dict | None, dict | None]:
     """
-    gh_api = GithubAPI()
-    allas = Allas()
+    Finds the commit to compare to, either --sha or the newest previous commit with results, then reads its results
+    from the local store, or downloads the file from the result storage if the store does not have them.
+    Continues on to comparison if this works.
+    :return tuple[dict | None, dict | None]: The comparison per benchmark and the comparison of the whole suite
+    """
+    storage = None
+    if args.sha is not None and is_verified_sha(args.sha):
+        baseline_sha = args.sha
+    elif args.sha is not None:
+        baseline_sha = get_github_api().repo.get_commit(args.sha).sha
+    else:
+        baseline_sha, storage = find_baseline(get_github_api(), comparison_suffix, store)
+        if baseline_sha is None:
+            print("No results found for the previous {0} commits, exiting comparison".format(args.search_depth))
+            return None, None
+    print("Comparing to commit {0}".format(baseline_sha))
+
+    branch = GithubData().short_name
+    if store is not None:
+        previous_result = store.load_results(branch, baseline_sha, comparison_suffix)
+        if previous_result is not None:
+            print("Using stored results for commit {0}".format(baseline_sha))
+            return compare_to_previous(comparison_data, previous_result)
+
+    if storage is None:
+        storage = open_storage()
+    file_contents = download_results(storage, baseline_sha, comparison_suffix)
+    if file_contents is None:
+        print("No comparison file found for commit {0} in the result storage, exiting comparison".format(baseline_sha))
+        return None, None
+    # We keep the downloaded results, so the next comparison against this commit is a local lookup.
+    if store is not None:
+        store.store_results(branch, baseline_sha, comparison_suffix, file_contents)
+    return compare_to_previous(comparison_data, file_contents)
+
+
+def download_results(storage: Storage, sha: str, comparison_suffix: str = "") -> list | ResultColumns | None:
+    """
+    Downloads the results of the commit, as columns if they were uploaded in the columnar format, otherwise the JSON.
+    """
+    for extension in (COLUMNS_EXTENSION, "json"):
+        path = storage.download_file(sha, filename_suffix=comparison_suffix, extension=extension)
+        if path is None:
+            continue
+        try:
+            if extension == COLUMNS_EXTENSION:
+                return load_columns(path)
+            with open(path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError) as e:
+            print("Error reading the results of {0}: {1}".format(sha, e))
+    return None
+
+
+@traced("Upload results")
+def handle_upload(data_json, suffix: str = "", columns: ResultColumns | None = None):
+    """
+    Uploads the passed file to the result storage, and the columns of the results next to it
+    """
+    gh_api = get_github_api()
+    storage = open_storage()
     # Create the bucket
-    allas.create_bucket()
+    storage.create_bucket()
+    current_commit = gh_api.get_commit_from_head(0)
+    upload_results(storage, current_commit.sha, data_json, suffix, columns)
+
+
+def upload_results(storage: Storage, sha: str, data_json: str, suffix: str = "",
+                   columns: ResultColumns | None = None) -> bool:
+    """
+    Uploads the data file of the commit, and the columns of the results next to it.
+    """
+    success = storage.upload_file(sha, data_json, filename_suffix=suffix)
+    if columns is not None:
+        # Compressed for the transfer, the downloaded copy is read instead of memory-mapped.
+        with tempfile.TemporaryDirectory() as directory:
+            columns_file = os.path.join(directory, "data.{0}".format(COLUMNS_EXTENSION))
+            write_columns(columns_file, columns, compress=True)
+            success = storage.upload_files([(columns_file, storage.get_data_path(sha, suffix,
+                                                                                 COLUMNS_EXTENSION))]) and success
+    return success
+
+
+@traced("Archive run files")
+def handle_archive(run_directory: str, run_counts: dict, suffix: str = "", part: str = ""):
+    """
+    Archives the run files next to the data file of the current commit in the result storage
+    """
+    gh_api = get_github_api()
+    storage = open_storage()
+    storage.create_bucket()
     current_commit = gh_api.get_commit_from_head(0)
-    allas.upload_file(current_commit.sha, data_json, filename_suffix=suffix)
+    prefix = get_artifact_prefix(storage.gh_data.construct_valid_data(current_commit.sha), suffix)
+    work_directory = tempfile.mkdtemp(prefix="shot-benchmarker-artifacts-")
+    try:
+        archive_artifacts(storage, prefix, run_directory, run_counts, work_directory, part=part)
+    finally:
+        shutil.rmtree(work_directory, ignore_errors=True)
+
+
+def fetch_problem_artifacts():
+    """
+    Downloads the archived run files of --problem for the commit --sha to artifacts/<sha>/<problem>.
+    """
+    if args.sha is None or args.problem is None:
+        print("The artifacts command needs both --sha and --problem")
+        sys.exit(1)
+    comparison_suffix = os.environ.get("INPUT_COMPARISON_SUFFIX") or ""
+    storage = open_storage()
+    prefix = get_artifact_prefix(storage.gh_data.construct_valid_data(args.sha), comparison_suffix)
+    files = download_artifacts(storage, prefix, args.problem, os.path.join("artifacts", args.sha, args.problem))
+    if files is None:
+        print("No archived run files found for {0} in commit {1}".format(args.problem, args.sha))
+        sys.exit(1)
+    for file in files:
+        print("Downloaded {0}".format(file))
+
+
+def convert_results():
+    """
+    Converts every data file passed on the command line, .json to .npz or back, next to the original. The JSON from
+    an .npz is a reduced copy, written as .from-npz.json.
+    """
+    if not args.files:
+        print("The convert command needs the data files to convert")
+        sys.exit(1)
+    for file in args.files:
+        try:
+            print("Converted {0} to {1}".format(file, convert_file(file)))
+        except (OSError, ValueError, KeyError) as e:
+            print("Error converting {0}: {1}".format(file, e))
+            sys.exit(1)
+
+
+def get_benchmark_dest(current_path: str) -> str:
+    """
+    The folder the run files and data files are collected to, INPUT_BENCHMARK_DEST or benchmarks/ next to this script.
+    """
+    return os.environ.get("INPUT_BENCHMARK_DEST") or "{0}/benchmarks".format(current_path)
+
+
+def open_results_store(current_path: str) -> ResultsStore:
+    """
+    Opens the local results database, relative paths are resolved against the benchmarker folder.
+    """
+    return ResultsStore(os.path.join(current_path, args.results_db))
+
+
+def get_result_key() -> tuple[str, str]:
+    """
+    The (branch, sha) the results of this run are stored under in the local results database.
+    """
+    return os.environ.get("GITHUB_REF_NAME") or "local", os.environ.get("GITHUB_SHA") or "local"
+
+
+def sync_results():
+    """
+    Mirrors the results of the current branch between the local results database and the result storage.
+    """
+    gh_data = GithubData()
+    current_path = os.path.dirname(os.path.abspath(getsourcefile(lambda: 0)))
+    store = open_results_store(current_path)
+    storage = open_storage()
+    if args.sync_direction in ("pull", "both"):
+        imported = sync_from_storage(store, storage, gh_data.gh_type, gh_data.short_name)
+        print("Imported {0} result files from the result storage".format(imported))
+    if args.sync_direction in ("push", "both"):
+        storage.create_bucket()
+        uploaded = sync_to_storage(store, storage, gh_data.gh_type, gh_data.short_name)
+        print("Uploaded {0} result files to the result storage".format(uploaded))
+    store.close()
+
+
+def history_report():
+    """
+    Loads the results of the last --history-commits commits on the branch, from the local store or else from the
+    result storage with a bounded pool of workers, and writes the time trends and changepoints of the suite and of
+    every problem that changed to the step summary.
+    """
+    gh_api = get_github_api()
+    is_ci = os.environ.get("CI") is not None
+    comparison_suffix = os.environ.get("INPUT_COMPARISON_SUFFIX") or ""
+    current_path = os.path.dirname(os.path.abspath(getsourcefile(lambda: 0)))
+    branch = gh_api.gh_data.short_name
+    # Newest first from GitHub, the series run oldest first.
+    shas = list(reversed(gh_api.get_recent_commit_shas(args.history_commits)))
 
+    store = open_results_store(current_path)
+    results = {}
+    for sha in shas:
+        stored = store.load_results(branch, sha, comparison_suffix)
+        if stored is not None:
+            results[sha] = stored
+    missing = [sha for sha in shas if sha not in results]
+    if missing:
+        storage = open_storage()
+        available = storage.list_result_commits(comparison_suffix)
+        missing = [sha for sha in missing if sha in available]
+        # The swift connection is not thread safe, so every worker gets its own, sharing the download cache.
+        get_storage = thread_local_factory(storage.clone)
 
+        def load(sha: str) -> list | ResultColumns | None:
+            return download_results(get_storage(), sha, comparison_suffix)
+
+        print("Fetching the results of {0} commits from the result storage".format(len(missing)))
+        fetched = fetch_results(missing, load, workers=args.history_workers)
+        for sha, fetched_results in fetched.items():
+            store.store_results(branch, sha, comparison_suffix, fetched_results)
+        results.update(fetched)
+    store.close()
+
+    history = [(sha, results[sha]) for sha in shas if sha in results]
+    if len(history) < 2:
+        print("Found results for {0} of the last {1} commits, need at least 2".format(len(history), len(shas)))
+        return
+    report = build_history(history)
+    with open("{0}/history{1}.json".format(current_path, comparison_suffix), "w") as json_file:
+        json.dump(report, json_file, sort_keys=True, indent=4)
+
+    headers = ["Benchmark", "Latest time", "Change", "Trend per commit", "Changepoints", "History"]
+    flagged = sorted((analysis for analysis in report["problems"] if is_flagged(analysis)),
+                     key=lambda analysis: -abs(analysis["total_change"] or 0.0))
+    rows = []
+    for analysis in [report["suite"]] + flagged[:MAX_HISTORY_ROWS]:
+        rows.append([
+            analysis["name"],
+            round_or_empty(analysis["latest_time"]),
+            "{0:+.1%}".format(analysis["total_change"]) if analysis["total_change"] is not None else "",
+            "{0:+.2%}".format(analysis["trend"]) if analysis["trend"] is not None else "",
+            ", ".join("{0} ({1:+.1%})".format(changepoint["sha"][:7], changepoint["change"])
+                      for changepoint in analysis["changepoints"]),
+            "`{0}`".format(analysis["sparkline"])
+        ])
+
+    with smart_open(os.environ['GITHUB_STEP_SUMMARY'] if is_ci else None) as fh:
+        print("# Performance history", file=fh)
+        print("{0} commits with results, from {1} to {2}".format(len(history), history[0][0][:7],
+                                                                 history[-1][0][:7]), file=fh)
+        print("{0} of {1} benchmarks have a changepoint or a trend".format(len(flagged), len(report["problems"])),
+              file=fh)
+        if len(flagged) > MAX_HISTORY_ROWS:
+            print("Showing the {0} largest changes, see history{1}.json for the rest".format(MAX_HISTORY_ROWS,
+                                                                                         comparison_suffix), file=fh)
+        print(generate_markdown_table(headers, rows), file=fh)
+
+
+def build_commit(sha: str) -> str:
+    """
+    Checks out the commit in --shot-source and builds it with --build-command.
+    :return str: The path of the built SHOT executable, --build-output in the checkout
+    """
+    if args.shot_source is None:
+        print("No results for commit {0}, and building it needs --shot-source".format(sha))
+        sys.exit(1)
+    repo = Repo(args.shot_source)
+    try:
+        repo.git.checkout("--force", sha)
+    except GitCommandError:
+        repo.git.fetch("origin", sha)
+        repo.git.checkout("--force", sha)
+    print("Building commit {0}".format(sha))
+    try:
+        subprocess.run(args.build_command, shell=True, cwd=args.shot_source, check=True)
+    except subprocess.CalledProcessError as e:
+        print("Error building commit {0}: {1}".format(sha, e))
+        sys.exit(1)
+    return os.path.join(os.path.abspath(args.shot_source), args.build_output)
+
+
+def run_commit(sha: str, benchmarks: list[str] | None, current_path: str, comparison_suffix: str):
+    """
+    Builds the commit and benchmarks it with a run of this script, storing the results in the local results database
+    under the commit. Only the given benchmarks are run, or the INPUT_BENCHMARKS if None.
+    """
+    env = dict(os.environ, GITHUB_SHA=sha, INPUT_SHOT_EXECUTABLE=build_commit(sha),
+               INPUT_COMPARISON_SUFFIX=comparison_suffix)
+    if benchmarks is not None:
+        env["INPUT_BENCHMARKS"] = ",".join(benchmarks)
+    # The runs report to the bisection summary only, not to the job summary.
+    env.pop("CI", None)
+    command = [sys.executable, os.path.join(current_path, "main.py"), "run", "-r", str(args.runs), "-j", str(args.jobs),
+               "-w", str(args.warmup), "--results-db", os.path.join(current_path, args.results_db)]
+    if args.timeout is not None:
+        command += ["-t", str(args.timeout)]
+    print("Benchmarking commit {0}".format(sha))
+    if subprocess.run(command, env=env).returncode != 0:
+        print("Error benchmarking commit {0}".format(sha))
+        sys.exit(1)
+
+
+def bisect_regression():
+    """
+    Finds the regressed benchmarks between --good and --bad, then binary searches the commits in between for the
+    first one that made them slower. Stored results are used where they exist, from the local store or the result
+    storage, otherwise the commit is built and only the regressed benchmarks are run.
+    """
+    if args.good is None or args.bad is None:
+        print("The bisect command needs both --good and --bad")
+        sys.exit(1)
+    # An absolute path would point outside the checkout, so every commit would time the same installed binary.
+    if os.path.isabs(args.build_output):
+        print("--build-output must be relative to --shot-source, not {0}".format(args.build_output))
+        sys.exit(1)
+    gh_api = get_github_api()
+    good_sha = gh_api.resolve_sha(args.good)
+    bad_sha = gh_api.resolve_sha(args.bad)
+    for sha, resolved in ((args.good, good_sha), (args.bad, bad_sha)):
+        if resolved is None:
+            print("Commit {0} not found".format(sha))
+            sys.exit(1)
+    is_ci = os.environ.get("CI") is not None
+    comparison_suffix = os.environ.get("INPUT_COMPARISON_SUFFIX") or ""
+    bisect_suffix = comparison_suffix + BISECT_SUFFIX
+    current_path = os.path.dirname(os.path.abspath(getsourcefile(lambda: 0)))
+    branch = gh_api.gh_data.short_name
+    commits = [good_sha] + gh_api.get_commits_between(good_sha, bad_sha)
+    if commits[-1] != bad_sha:
+        print("Commit {0} is not a descendant of {1}".format(bad_sha, good_sha))
+        sys.exit(1)
+
+    store = open_results_store(current_path)
+    storage = None
+
+    def load(sha: str, benchmarks: list[str] | None = None) -> tuple[list, str]:
+        """
+        The results of the commit and where they came from, running it if none of the results cover the benchmarks.
+        """
+        nonlocal storage
+        candidates = [store.load_results(branch, sha, suffix) for suffix in (comparison_suffix, bisect_suffix)]
+        for results in candidates:
+            if results is not None and (benchmarks is None or set(benchmarks) <= set(r["name"] for r in results)):
+                return results, "stored"
+        if storage is None:
+            storage = open_storage()
+        results = download_results(storage, sha, comparison_suffix)
+        if results is not None:
+            store.store_results(branch, sha, comparison_suffix, results)
+            if benchmarks is None or set(benchmarks) <= set(r["name"] for r in results):
+                return results, "storage"
+        # A run stores its results in the results database itself, we read them back from there.
+        run_commit(sha, benchmarks, current_path, bisect_suffix)
+        return store.load_results(branch, sha, bisect_suffix) or [], "run"
+
+    good_results, _ = load(good_sha)
+    bad_results, _ = load(bad_sha)
+    regressed = find_regressed_problems(good_results, bad_results)
+    if not regressed:
+        print("No benchmark is significantly slower in {0} than in {1}".format(bad_sha, good_sha))
+        store.close()
+        return
+    print("Regressed benchmarks: {0}".format(", ".join(regressed)))
+
+    tested = []
+
+    def is_bad(sha: str) -> bool:
+        results, source = load(sha, regressed)
+        fraction = regression_fraction(good_results, bad_results, results, regressed)
+        # A commit without any times for the regressed benchmarks failed on them, which counts as bad.
+        bad = fraction is None or fraction >= BAD_FRACTION
+        tested.append({"sha": sha, "source": source, "fraction": fraction, "bad": bad})
+        print("Commit {0} is {1}".format(sha, "bad" if bad else "good"))
+        return bad
+
+    first_bad = bisect_commits(commits, is_bad)
+    last_good_results = good_results if first_bad == 1 else load(commits[first_bad - 1], regressed)[0]
+    first_bad_results = bad_results if first_bad == len(commits) - 1 else load(commits[first_bad], regressed)[0]
+    store.close()
+    evidence = regression_evidence(last_good_results, first_bad_results, regressed)
+    report = {
+        "good": good_sha,
+        "bad": bad_sha,
+        "first_bad": commits[first_bad],
+        "regressed": regressed,
+        "tested": tested,
+        "evidence": evidence
+    }
+    with open("{0}/bisect{1}.json".format(current_path, comparison_suffix), "w") as json_file:
+        json.dump(report, json_file, sort_keys=True, indent=4)
+
+    tested_rows = [[test["sha"][:7], test["source"],
+                    "{0:.0%}".format(test["fraction"]) if test["fraction"] is not None else "no times",
+                    "bad" if test["bad"] else "good"] for test in tested]
+    evidence_rows = []
+    for name, statistics in evidence["problems"].items():
+        ratio_ci = ""
+        if statistics["time_ratio_lower"] is not None:
+            ratio_ci = "{0} - {1}".format(round(statistics["time_ratio_lower"], 3),
+                                          round(statistics["time_ratio_upper"], 3))
+        evidence_rows.append([name, round_or_empty(statistics["time_ratio"], 3), ratio_ci,
+                              round_or_empty(statistics["adjusted_p_value"], 4), statistics["time_classification"]])
+    with smart_open(os.environ['GITHUB_STEP_SUMMARY'] if is_ci else None) as fh:
+        print("# Performance bisection", file=fh)
+        print("First bad commit: {0} ({1} commits between {2} and {3}, {4} regressed benchmarks)".format(
+            commits[first_bad], len(commits) - 1, good_sha[:7], bad_sha[:7], len(regressed)), file=fh)
+        suite = evidence["suite"]
+        if suite.get("problems"):
+            print("Shifted geometric mean of the regressed benchmarks against the parent commit: ratio {0} "
+                  "(95% CI {1} - {2})".format(round(suite["ratio"], 3), round(suite["ratio_lower"], 3),
+                                              round(suite["ratio_upper"], 3)), file=fh)
+        print("## Evidence", file=fh)
+        print(generate_markdown_table(["Benchmark", "Time ratio", "95% CI", "Adjusted p-value", "Result"],
+                                      evidence_rows), file=fh)
+        print("## Tested commits", file=fh)
+        print(generate_markdown_table(["Commit", "Results", "Position between good and bad", "Verdict"],
+                                      tested_rows), file=fh)
+
+
+def serve_jobs():
+    """
+    Runs the benchmark jobs submitted to the --spool-dir, and to the --serve-socket if given, until stopped with
+    SIGTERM or SIGINT. The problem checkout, the storage connection and its token are set up once and shared by the
+    jobs, at most --serve-jobs of which run at the same time, and the results of every job are published as soon as
+    it finishes. Stopping lets the running jobs finish, jobs that were cut short are run again on the next start.
+    """
+    benchmark_folder = os.environ.get("INPUT_BENCHMARK_FOLDER")
+    benchmark_type = os.environ.get("INPUT_BENCHMARK_TYPE")
+    if benchmark_folder is None or benchmark_type is None:
+        print("Missing required input")
+        sys.exit(1)
+    if args.serve_jobs < 1 or args.max_pending < 1:
+        print("--serve-jobs and --max-pending must be at least 1")
+        sys.exit(1)
+    current_path = os.path.dirname(os.path.abspath(getsourcefile(lambda: 0)))
+    spool = JobSpool(os.path.abspath(args.spool_dir), args.max_pending)
+    requeued = spool.requeue_running()
+    if requeued:
+        print("Requeued {0} jobs that were running when the server stopped".format(requeued))
+
+    repo_dir = os.path.abspath(os.environ.get("INPUT_PROBLEMS_DIR") or os.path.join(os.getcwd(),
+                                                                                   "SHOT_benchmark_problems"))
+    problems_revision = os.environ.get("INPUT_PROBLEMS_REVISION") or "main"
+
+    def refresh_problems() -> str | None:
+        try:
+            return fetch_problems(repo_dir, benchmark_folder, benchmark_type, problems_revision)
+        except (GitCommandError, ValueError) as e:
+            print("Error fetching the benchmark problems: {0}".format(e))
+            return None
+    # The jobs run at the resolved revision, so a branch that moves does not change the problems mid-queue.
+    problems = {"sha": refresh_problems(), "fetched": time.monotonic()}
+    if problems["sha"] is None:
+        sys.exit(1)
+    print("Problem set revision: {0}".format(problems["sha"]))
+
+    # Opened once, when the first job needs them, and shared by the jobs that follow.
+    shared = {}
+    shared_lock = threading.Lock()
+
+    def get_shared(name: str, factory: Callable):
+        with shared_lock:
+            if name not in shared:
+                shared[name] = factory()
+            return shared[name]
+
+    def open_shared_storage() -> Storage:
+        storage = open_storage()
+        storage.create_bucket()
+        return storage
+    # Swift connections are not thread safe, so every worker uses its own clone sharing the token.
+    get_storage = thread_local_factory(lambda: get_shared("storage", open_shared_storage).clone())
+    if args.store_result:
+        get_shared("storage", open_shared_storage)
+    github_lock = threading.Lock()
+
+    stop = threading.Event()
+    wake = threading.Event()
+    # Held by every running job, and taken exclusively to update the problem checkout.
+    running = {"count": 0}
+    running_lock = threading.Condition()
+
+    def handle_signal(signum, frame):
+        print("Stopping, waiting for the running jobs to finish")
+        stop.set()
+        wake.set()
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    def maybe_refresh():
+        with running_lock:
+            if running["count"] or time.monotonic() - problems["fetched"] < args.problems_refresh:
+                return
+            # The jobs keep using the previous revision if the update fails.
+            problems["sha"] = refresh_problems() or problems["sha"]
+            problems["fetched"] = time.monotonic()
+            print("Problem set revision: {0}".format(problems["sha"]))
+
+    def worker():
+        while not stop.is_set():
+            with running_lock:
+                claimed = spool.claim()
+                if claimed is not None:
+                    running["count"] += 1
+                    problems_sha = problems["sha"]
+            if claimed is None:
+                maybe_refresh()
+                wake.wait(POLL_INTERVAL)
+                wake.clear()
+                continue
+            job_id, job = claimed
+            try:
+                storage = get_storage() if args.store_result or job["compare_to"] is not None else None
+                compare_to = None
+                if job["compare_to"] is not None:
+                    with github_lock:
+                        compare_to = get_shared("github", get_github_api).resolve_sha(job["compare_to"])
+                if job["compare_to"] is not None and compare_to is None:
+                    result = {"status": "failed", "error": "Commit {0} not found".format(job["compare_to"])}
+                else:
+                    result = run_job(job_id, job, spool.work_directory(job_id), current_path, repo_dir,
+                                     problems_sha, storage, compare_to)
+            except Exception as e:
+                result = {"status": "failed", "error": str(e)}
+            finally:
+                with running_lock:
+                    running["count"] -= 1
+            spool.finish(job_id, result)
+            print("Job {0} for commit {1}: {2}".format(job_id, job["sha"], result["status"]))
+            # The runs write their own traces, the stages of the server itself are not kept from job to job.
+            tracer.reset()
+
+    server = None
+    if args.serve_socket is not None:
+        server = start_socket_server(args.serve_socket, spool, wake)
+        print("Accepting jobs on {0}".format(args.serve_socket))
+    print("Serving jobs from {0} with {1} workers".format(spool.directory, args.serve_jobs))
+    workers = [threading.Thread(target=worker, name="job-{0}".format(i)) for i in range(args.serve_jobs)]
+    for thread in workers:
+        thread.start()
+    # Joined with a timeout, so the main thread keeps handling the signals.
+    while any(thread.is_alive() for thread in workers):
+        for thread in workers:
+            thread.join(POLL_INTERVAL)
+    if server is not None:
+        server.shutdown()
+        os.unlink(args.serve_socket)
+
+
+@traced("Serve job")
+def run_job(job_id: str, job: dict, work_directory: str, current_path: str, repo_dir: str, problems_sha: str,
+            storage: Storage | None, compare_to: str | None = None) -> dict:
+    """
+    Runs a job with a run of this script, in its own work directory, then uploads its data files for the commit of
+    the job if --store-result. The run reuses the token of the storage, and compares to compare_to, the full SHA the
+    job's baseline was resolved to, without looking it up on GitHub again.
+    The output of the run is written to output.log, its summary to summary.md, and with --trace its stages to
+    trace.json, in the work directory.
+    :return dict: The result of the job, with the "status" done or failed
+    """
+    benchmark_dest = os.path.join(work_directory, "benchmarks")
+    os.makedirs(benchmark_dest, exist_ok=True)
+    env = dict(os.environ, GITHUB_SHA=job["sha"], INPUT_SHOT_EXECUTABLE=job["executable"],
+               INPUT_COMPARISON_SUFFIX=job["suffix"], INPUT_BENCHMARK_DEST=benchmark_dest,
+               INPUT_PROBLEMS_DIR=repo_dir, INPUT_PROBLEMS_REVISION=problems_sha, INPUT_STORAGE=args.storage,
+               CI="true", GITHUB_STEP_SUMMARY=os.path.join(work_directory, "summary.md"),
+               GITHUB_OUTPUT=os.path.join(work_directory, "output.txt"))
+    # The daemon's own options must not leak into the job: archiving would go under the checkout's HEAD, and the
+    # job's configuration and baseline come from the job itself.
+    for name in ("INPUT_ARCHIVE_ARTIFACTS", "INPUT_MATRIX", "INPUT_TRACE", "INPUT_VERIFIED_SHA", "INPUT_SPOOL_DIR"):
+        env.pop(name, None)
+    if args.trace:
+        env["INPUT_TRACE"] = os.path.join(work_directory, "trace.json")
+    if args.storage_dir is not None:
+        env["INPUT_STORAGE_DIR"] = os.path.abspath(args.storage_dir)
+    if storage is not None:
+        env.update(storage.session_environment())
+    command = [sys.executable, os.path.join(current_path, "main.py"), "run",
+               "--results-db", os.path.join(current_path, args.results_db)] + job["arguments"]
+    if job["config"] is not None:
+        command += ["--matrix", job["config"]]
+    if compare_to is not None:
+        command += ["--compare", "--sha", compare_to]
+        env["INPUT_VERIFIED_SHA"] = compare_to
+    print("Running job {0} for commit {1}".format(job_id, job["sha"]))
+    with open(os.path.join(work_directory, "output.log"), "w") as log:
+        returncode = subprocess.run(command, env=env, stdout=log, stderr=subprocess.STDOUT).returncode
+    if returncode != 0:
+        return {"status": "failed", "error": "The run exited with code {0}".format(returncode)}
+
+    uploaded = []
+    if args.store_result:
+        for filename in sorted(os.listdir(benchmark_dest)):
+            suffix = get_data_suffix(filename)
+            if suffix is None:
+                continue
+            data_json = os.path.join(benchmark_dest, filename)
+            columns_file = "{0}/data{1}.{2}".format(benchmark_dest, suffix, COLUMNS_EXTENSION)
+            columns = load_columns(columns_file) if os.path.isfile(columns_file) else None
+            if not upload_results(storage, job["sha"], data_json, suffix, columns):
+                return {"status": "failed", "error": "Uploading {0} failed".format(filename), "uploaded": uploaded}
+            uploaded.append(filename)
+    return {"status": "done", "uploaded": uploaded}
+
+
+@traced("Markdown table")
 def generate_markdown_table(headers, data):
     """
     Handles generating the Markdown table, used in GH Actions Job Summary.
@@ -421,6 +1740,15 @@ def generate_markdown_table(headers, data):
     return "\n".join(markdown_table)
 
 
+def round_or_empty(value, digits: int = 2):
+    """
+    Rounds the value for the Markdown tables, missing values (e.g. from failed runs) are shown as empty cells.
+    """
+    if value is None or value == "":
+        return ""
+    return round(value, digits)
+
+
 @contextlib.contextmanager
 def smart_open(filename=None):
     if filename:
@@ -435,5 +1763,19 @@ def smart_open(filename=None):
             fh.close()
 
 
+def write_trace(path: str):
+    """
+    Writes the stage timings to the trace file, and prints the stages that took the longest.
+    """
+    tracer.write(path)
+    print("Wrote the trace to {0}, slowest stages:".format(path))
+    for name, (total, count) in sorted(tracer.totals().items(), key=lambda item: -item[1][0])[:10]:
+        print("  {0}: {1}s in {2} calls".format(name, round(total, 3), count))
+
+
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        if args.trace:
+            write_trace(args.trace)
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import dataclasses
+import json
+import os
+import re
+from dataclasses import dataclass, field
+
+from runner import BenchmarkRun
+
+# Configuration names end up in file names and result suffixes.
+_name_pattern = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+@dataclass
+class SolverConfig:
+    """
+    A SHOT executable with its extra command line arguments. A plain run is a single configuration without a name.
+    """
+    name: str
+    executable: str
+    arguments: list[str] = field(default_factory=list)
+    is_gams: bool = False
+    is_gurobi: bool = False
+
+    def suffix(self, comparison_suffix: str = "") -> str:
+        """
+        The suffix the results of the configuration are stored under, appended to the comparison suffix.
+        """
+        if not self.name:
+            return comparison_suffix
+        return "{0}-{1}".format(comparison_suffix, self.name)
+
+    def run_directory(self, benchmark_dest: str) -> str:
+        """
+        The folder the trc/log/osrl files of the configuration are collected to.
+        """
+        if not self.name:
+            return benchmark_dest
+        return os.path.join(benchmark_dest, self.name)
+
+    def options(self, timeout: float | None = None) -> dict:
+        """
+        The solver options, as used in the run cache keys.
+        """
+        options = {"is_gams": self.is_gams, "is_gurobi": self.is_gurobi, "timeout": timeout}
+        # Only added when there are arguments, so the keys of plain runs stay the same.
+        if self.arguments:
+            options["arguments"] = self.arguments
+        return options
+
+
+def load_matrix(path: str, is_gams: bool = False, is_gurobi: bool = False) -> list[SolverConfig]:
+    """
+    Reads the configurations from a JSON list of {"name", "executable", "arguments", "is_gams", "is_gurobi"}, where
+    only the name and executable are required. The first configuration is the baseline of the paired comparison.
+    Relative executable paths are resolved against the current directory.
+    Raises a ValueError describing what is wrong with the file.
+    """
+    with open(path, "r") as file:
+        entries = json.load(file)
+    if not isinstance(entries, list) or len(entries) < 2:
+        raise ValueError("The matrix must be a list of at least two configurations")
+    configs = []
+    for entry in entries:
+        name = entry.get("name", "")
+        if not _name_pattern.match(name):
+            raise ValueError("Invalid configuration name {0!r}, use letters, digits, _, . and -".format(name))
+        if "executable" not in entry:
+            raise ValueError("Configuration {0} has no executable".format(name))
+        executable = os.path.abspath(entry["executable"])
+        if not os.path.isfile(executable):
+            raise ValueError("The executable {0} of configuration {1} does not exist".format(executable, name))
+        configs.append(SolverConfig(name=name, executable=executable, arguments=list(entry.get("arguments", [])),
+                                    is_gams=entry.get("is_gams", is_gams), is_gurobi=entry.get("is_gurobi", is_gurobi)))
+    names = [config.name for config in configs]
+    if len(set(names)) != len(names):
+        raise ValueError("The configuration names must be unique")
+    return configs
+
+
+def interleave_runs(runs: list[BenchmarkRun], configs: list[SolverConfig]) -> list[BenchmarkRun]:
+    """
+    Replaces every run with one run per configuration, right after each other, so the configurations of a problem
+    are measured under the same machine conditions. The configuration order rotates with the run index, so no
+    configuration always runs first.
+    """
+    interleaved = []
+    for run in runs:
+        offset = run.run % len(configs)
+        for config in configs[offset:] + configs[:offset]:
+            interleaved.append(dataclasses.replace(run, config=config.name, executable=config.executable,
+                                                   arguments=tuple(config.arguments)))
+    return interleaved
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import os
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+from log_parser import parse_log
+from tracing import traced
+
+# The fields of a GAMS trace record, used when the trace file does not define its own.
+TRACE_FIELDS = [
+    "InputFileName", "ModelType", "SolverName", "NLP", "MIP", "JulianDate", "Direction", "NumberOfEquations",
+    "NumberOfVariables", "NumberOfDiscreteVariables", "NumberOfNonZeros", "NumberOfNonlinearNonZeros",
+    "OptionFile", "ModelStatus", "SolverStatus", "ObjectiveValue", "ObjectiveValueEstimate", "SolverTime",
+    "NumberOfIterations", "NumberOfDomainViolations", "NumberOfNodes"
+]
+
+
+def _local_name(tag: str) -> str:
+    """
+    Strips the namespace from an element tag, e.g. {os.optimizationservices.org}time -> time
+    """
+    return tag.rsplit("}", 1)[-1]
+
+
+def _to_float(value: str | None) -> float | None:
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def empty_result() -> dict:
+    return {
+        "times": {},
+        "status": "",
+        "substatus": "",
+        "general_status": "",
+        "objective_values": [],
+        "other": {},
+        "primal_bound": None,
+        "dual_bound": None
+    }
+
+
+def parse_osrl(path: str) -> dict:
+    """
+    Parses an OSrL file in a single streaming pass, every element is discarded as soon as it has been read.
+    Extracts all the time types, the general and solution statuses, the objective values and SHOT's other
+    results (which include the primal and dual bounds).
+    """
+    result = empty_result()
+    elements = []
+    for event, element in ET.iterparse(path, events=("start", "end")):
+        if event == "start":
+            elements.append(element)
+            continue
+        elements.pop()
+        parent = _local_name(elements[-1].tag) if elements else ""
+        tag = _local_name(element.tag)
+        if tag == "time":
+            result["times"][element.get("type", "")] = _to_float(element.text)
+        elif tag == "status" and parent == "solution":
+            result["status"] = element.get("type", "")
+        elif tag == "substatus":
+            result["substatus"] = element.get("type", "")
+        elif tag == "generalStatus":
+            result["general_status"] = element.get("type", "")
+        elif tag == "obj" and parent == "values":
+            result["objective_values"].append(_to_float(element.text))
+        elif tag == "other" and element.get("name") is not None:
+            result["other"][element.get("name")] = element.get("value", element.text)
+
+        # We do not need the element anymore, so we drop it to keep memory usage flat.
+        element.clear()
+        if elements:
+            elements[-1].remove(element)
+
+    for name, value in result["other"].items():
+        lowered = name.lower()
+        if "primal" in lowered and "bound" in lowered:
+            result["primal_bound"] = _to_float(value)
+        elif "dual" in lowered and "bound" in lowered:
+            result["dual_bound"] = _to_float(value)
+    return result
+
+
+def parse_trace(path: str) -> dict:
+    """
+    Parses a GAMS-style trace file, which consists of comment lines starting with * and a comma separated record.
+    If the comments contain the record definition it is used, otherwise the default GAMS fields are assumed.
+    Numeric values are converted to floats, and NA values become None.
+    """
+    fields = []
+    record = None
+    with open(path, "r") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("*"):
+                definition = line.lstrip("*").strip()
+                if "," in definition and (fields or definition.startswith("InputFileName")):
+                    fields.extend(field.strip() for field in definition.split(",") if field.strip())
+                continue
+            record = line
+
+    if record is None:
+        return {}
+    if not fields:
+        fields = TRACE_FIELDS
+
+    trace = {}
+    for field, value in zip(fields, record.split(",")):
+        value = value.strip()
+        if value == "NA" or value == "":
+            trace[field] = None
+        else:
+            number = _to_float(value)
+            trace[field] = value if number is None else number
+    return trace
+
+
+def parse_run(osrl_file: str, trace_file: str | None = None, log_file: str | None = None) -> dict:
+    """
+    Parses the results of a single run, a broken or missing file is reported in the "error" key.
+    The bound trajectory and its metrics are read from the SHOT log, see log_parser.parse_log.
+    """
+    try:
+        result = parse_osrl(osrl_file)
+    except (OSError, ET.ParseError) as e:
+        print("Error while parsing {0}: {1}".format(osrl_file, e))
+        result = empty_result()
+        result["error"] = str(e)
+
+    result["trace"] = {}
+    if trace_file is not None and os.path.isfile(trace_file):
+        try:
+            result["trace"] = parse_trace(trace_file)
+        except OSError as e:
+            print("Error while parsing {0}: {1}".format(trace_file, e))
+
+    result["log"] = {}
+    if log_file is not None and os.path.isfile(log_file):
+        try:
+            result["log"] = parse_log(log_file, end_time=_to_float(result["times"].get("Total")))
+        except OSError as e:
+            print("Error while parsing {0}: {1}".format(log_file, e))
+    return result
+
+
+def _parse_run_files(files: tuple) -> dict:
+    return parse_run(*files)
+
+
+@traced("Parse run files")
+def parse_runs(files: list[tuple], jobs: int = 1) -> list[dict]:
+    """
+    Parses the (osrl, trc, log) files of many runs, spread over `jobs` processes. The trc and log are optional.
+    :return list[dict]: The parsed results, in the same order as the files.
+    """
+    if jobs <= 1 or len(files) <= 1:
+        return [_parse_run_files(run_files) for run_files in files]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(_parse_run_files, files, chunksize=max(1, len(files) // (jobs * 4))))
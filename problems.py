@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+
+from git import GitCommandError, Repo
+
+from tracing import traced
+from utils import hash_file, is_git_repo
+
+PROBLEMS_REPO_URL = "https://github.com/andreaslundell/SHOT_benchmark_problems.git"
+# Kept inside the .git folder, so it is never part of the checked out files.
+MANIFEST_NAME = "shot-benchmarker-manifest.json"
+
+_sha_pattern = re.compile(r"^[0-9a-f]{40}$")
+
+
+def build_manifest(repo_dir: str, subtree: str) -> dict:
+    """
+    Hashes every file in the subtree, keyed by the path relative to the repo.
+    """
+    files = {}
+    for root, _, filenames in os.walk(os.path.join(repo_dir, subtree)):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            files[os.path.relpath(path, repo_dir)] = hash_file(path)
+    return files
+
+
+def read_manifest(repo: Repo) -> dict:
+    try:
+        with open(os.path.join(repo.git_dir, MANIFEST_NAME), "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(repo: Repo, manifest: dict):
+    with open(os.path.join(repo.git_dir, MANIFEST_NAME), "w") as file:
+        json.dump(manifest, file, sort_keys=True, indent=4)
+
+
+def resolve_revision(repo: Repo, revision: str) -> str:
+    """
+    Resolves a branch or tag name to a commit SHA with a single ls-remote, SHAs are returned as-is.
+    """
+    if _sha_pattern.match(revision):
+        return revision
+    output = repo.git.ls_remote("origin", revision)
+    for line in output.splitlines():
+        sha, ref = line.split("\t", 1)
+        if ref in (revision, "refs/heads/{0}".format(revision), "refs/tags/{0}".format(revision)):
+            return sha
+    raise ValueError("Revision {0} not found in {1}".format(revision, PROBLEMS_REPO_URL))
+
+
+def is_checkout_valid(repo_dir: str, subtree: str, manifest: dict, revision: str) -> bool:
+    """
+    Checks that the cached checkout is at the revision and that every file in the subtree matches its hash.
+    """
+    if manifest.get("revision") != revision or subtree not in manifest.get("subtrees", {}):
+        return False
+    return build_manifest(repo_dir, subtree) == manifest["subtrees"][subtree]
+
+
+@traced("Fetch problems", "git")
+def fetch_problems(repo_dir: str, benchmark_folder: str, benchmark_type: str, revision: str = "main") -> str:
+    """
+    Fetches only the benchmark_folder/benchmark_type subtree of the problem repo, at the given revision, with a
+    shallow sparse checkout. An existing checkout (e.g. restored from the CI cache) is reused without fetching if it
+    is at the revision and its files match the manifest of file hashes.
+    :return str: The commit SHA of the problem set that was checked out
+    """
+    subtree = "{0}/{1}".format(benchmark_folder, benchmark_type)
+    if os.path.isdir(repo_dir) and is_git_repo(repo_dir):
+        repo = Repo(repo_dir)
+    else:
+        print("Initializing problem repo")
+        repo = Repo.init(repo_dir)
+    if "origin" not in [remote.name for remote in repo.remotes]:
+        repo.create_remote("origin", PROBLEMS_REPO_URL)
+
+    sha = resolve_revision(repo, revision)
+    manifest = read_manifest(repo)
+    if is_checkout_valid(repo_dir, subtree, manifest, sha):
+        print("Using cached problems {0} at {1}".format(subtree, sha))
+        return sha
+
+    # Every subtree that was already checked out stays in the sparse checkout, so a shared cache keeps working.
+    subtrees = manifest.get("subtrees", {}) if manifest.get("revision") == sha else {}
+    sparse_paths = sorted(set(subtrees.keys()) | {subtree})
+    print("Fetching problems {0} at {1}".format(subtree, sha))
+    repo.git.sparse_checkout("init", "--cone")
+    repo.git.sparse_checkout("set", *sparse_paths)
+    try:
+        repo.git.fetch("--depth", "1", "--filter=blob:none", "origin", sha)
+    except GitCommandError:
+        # Servers that do not support partial clones still support a plain shallow fetch.
+        repo.git.fetch("--depth", "1", "origin", sha)
+    repo.git.checkout("--force", "--detach", "FETCH_HEAD")
+
+    subtrees[subtree] = build_manifest(repo_dir, subtree)
+    write_manifest(repo, {"revision": sha, "subtrees": subtrees})
+    return sha
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import os
+import shutil
+import subprocess
+import tempfile
+from functools import lru_cache
+
+PROFILE_STAT = "stat"
+PROFILE_RECORD = "record"
+PERF_EVENTS = ("cycles", "instructions", "cache-misses", "branch-misses")
+DEFAULT_SAMPLE_FREQUENCY = 99
+# perf record is capped to this sampling frequency, so profiled runs stay close to normal runs.
+MAX_SAMPLE_FREQUENCY = 1000
+# The files perf writes next to the trc/log/osrl files of a run.
+PROFILE_FILE_EXTENSIONS = ("perf.csv", "perf.data")
+
+
+def build_perf_command(command: list[str], mode: str, output_prefix: str,
+                       frequency: int = DEFAULT_SAMPLE_FREQUENCY) -> list[str]:
+    """
+    Wraps the command with perf stat, counting PERF_EVENTS into <output_prefix>.perf.csv, or with perf record,
+    sampling at a capped frequency into <output_prefix>.perf.data.
+    """
+    if mode == PROFILE_STAT:
+        return ["perf", "stat", "-x", ",", "-e", ",".join(PERF_EVENTS),
+                "-o", "{0}.perf.csv".format(output_prefix), "--"] + command
+    if mode == PROFILE_RECORD:
+        return ["perf", "record", "-q", "-g", "-F", str(min(frequency, MAX_SAMPLE_FREQUENCY)),
+                "-o", "{0}.perf.data".format(output_prefix), "--"] + command
+    raise ValueError("Unknown profile mode {0}".format(mode))
+
+
+@lru_cache(maxsize=None)
+def is_perf_available(mode: str) -> bool:
+    """
+    Checks that perf is installed and allowed to profile, by profiling `true` once.
+    Containers and locked down kernels (perf_event_paranoid) commonly refuse, in which case we run without perf.
+    """
+    if shutil.which("perf") is None or shutil.which("true") is None:
+        return False
+    directory = tempfile.mkdtemp(prefix="shot-benchmarker-perf-")
+    try:
+        command = build_perf_command([shutil.which("true")], mode, os.path.join(directory, "probe"))
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30)
+        return result.returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def parse_perf_stat(path: str) -> dict:
+    """
+    Parses the CSV output of perf stat -x, to {event: count}. Events the CPU could not count are left out.
+    Modifiers like the :u of user space only counting are stripped from the event names.
+    """
+    counters = {}
+    with open(path, "r", errors="replace") as file:
+        for line in file:
+            fields = line.strip().split(",")
+            if len(fields) < 3 or line.startswith("#"):
+                continue
+            event = fields[2].split(":")[0]
+            try:
+                counters[event] = float(fields[0])
+            except ValueError:
+                # <not counted> and <not supported>
+                continue
+    if counters.get("cycles") and "instructions" in counters:
+        counters["instructions-per-cycle"] = counters["instructions"] / counters["cycles"]
+    return counters
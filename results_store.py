@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import time
+
+from storage import Storage
+
+_schema = """
+CREATE TABLE IF NOT EXISTS results (
+    branch TEXT NOT NULL,
+    sha TEXT NOT NULL,
+    suffix TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    PRIMARY KEY (branch, sha, suffix)
+);
+CREATE TABLE IF NOT EXISTS problems (
+    branch TEXT NOT NULL,
+    sha TEXT NOT NULL,
+    suffix TEXT NOT NULL,
+    problem TEXT NOT NULL,
+    average_time REAL,
+    median_time REAL,
+    most_common_status TEXT,
+    most_common_substatus TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (branch, sha, suffix, problem)
+);
+CREATE TABLE IF NOT EXISTS runs (
+    branch TEXT NOT NULL,
+    sha TEXT NOT NULL,
+    suffix TEXT NOT NULL,
+    problem TEXT NOT NULL,
+    run INTEGER NOT NULL,
+    time REAL,
+    status TEXT,
+    substatus TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (branch, sha, suffix, problem, run)
+);
+CREATE INDEX IF NOT EXISTS results_by_time ON results (branch, suffix, stored_at);
+CREATE INDEX IF NOT EXISTS problems_by_problem ON problems (branch, suffix, problem);
+"""
+
+
+class ResultsStore:
+    """
+    Local SQLite database of benchmark results, keyed by (branch, sha, suffix, problem, run).
+    The stored results can be read back in the same format as data.json.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(_schema)
+
+    def close(self):
+        self.conn.close()
+
+    def has_results(self, branch: str, sha: str, suffix: str = "") -> bool:
+        row = self.conn.execute(
+            "SELECT 1 FROM results WHERE branch = ? AND sha = ? AND suffix = ?",
+            (branch, sha, suffix)
+        ).fetchone()
+        return row is not None
+
+    def store_results(self, branch: str, sha: str, suffix: str, comparison_data: list):
+        """
+        Stores the contents of a data.json file, replacing any previous results for the same commit and suffix.
+        """
+        with self.conn:
+            self.conn.execute("DELETE FROM problems WHERE branch = ? AND sha = ? AND suffix = ?", (branch, sha, suffix))
+            self.conn.execute("DELETE FROM runs WHERE branch = ? AND sha = ? AND suffix = ?", (branch, sha, suffix))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results (branch, sha, suffix, stored_at) VALUES (?, ?, ?, ?)",
+                (branch, sha, suffix, time.time())
+            )
+            for result in comparison_data:
+                runs = result.get("runs", [])
+                summary = {key: value for key, value in result.items() if key != "runs"}
+                self.conn.execute(
+                    "INSERT INTO problems VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (branch, sha, suffix, result["name"], result.get("average_time"), result.get("median_time"),
+                     result.get("most_common_status"), result.get("most_common_substatus"), json.dumps(summary))
+                )
+                self.conn.executemany(
+                    "INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(branch, sha, suffix, result["name"], i, run.get("time"), run.get("status"),
+                      run.get("substatus"), json.dumps(run)) for i, run in enumerate(runs)]
+                )
+
+    def load_results(self, branch: str, sha: str, suffix: str = "") -> list | None:
+        """
+        Loads the results of a commit in the data.json format, or None if the commit has no stored results.
+        """
+        if not self.has_results(branch, sha, suffix):
+            return None
+        runs = {}
+        for problem, data in self.conn.execute(
+                "SELECT problem, data FROM runs WHERE branch = ? AND sha = ? AND suffix = ? ORDER BY problem, run",
+                (branch, sha, suffix)):
+            runs.setdefault(problem, []).append(json.loads(data))
+        comparison_data = []
+        for problem, data in self.conn.execute(
+                "SELECT problem, data FROM problems WHERE branch = ? AND sha = ? AND suffix = ? ORDER BY problem",
+                (branch, sha, suffix)):
+            result = json.loads(data)
+            result["runs"] = runs.get(problem, [])
+            comparison_data.append(result)
+        return comparison_data
+
+    def get_commits(self, branch: str, suffix: str = "") -> list[str]:
+        """
+        The commits with stored results on the branch, newest first.
+        """
+        return [sha for sha, in self.conn.execute(
+            "SELECT sha FROM results WHERE branch = ? AND suffix = ? ORDER BY stored_at DESC",
+            (branch, suffix)
+        )]
+
+    def get_problem_history(self, branch: str, problem: str, suffix: str = "", limit: int = 50) -> list[dict]:
+        """
+        The average and median times of a problem over the stored commits on the branch, newest first.
+        """
+        rows = self.conn.execute(
+            "SELECT p.sha, p.average_time, p.median_time, p.most_common_status FROM problems p "
+            "JOIN results r ON r.branch = p.branch AND r.sha = p.sha AND r.suffix = p.suffix "
+            "WHERE p.branch = ? AND p.suffix = ? AND p.problem = ? ORDER BY r.stored_at DESC LIMIT ?",
+            (branch, suffix, problem, limit)
+        )
+        return [{"sha": sha, "average_time": average_time, "median_time": median_time, "most_common_status": status}
+                for sha, average_time, median_time, status in rows]
+
+
+def get_data_suffix(object_name: str) -> str | None:
+    """
+    Extracts the suffix from an object name such as branch/main/<sha>/data<suffix>.json
+    """
+    filename = object_name.rsplit("/", 1)[-1]
+    if not filename.startswith("data") or not filename.endswith(".json"):
+        return None
+    return filename[len("data"):-len(".json")]
+
+
+def sync_from_storage(store: ResultsStore, storage: Storage, gh_type: str, branch: str) -> int:
+    """
+    Imports the results of the branch that are in the result storage but not yet in the local store.
+    :return int: The number of imported result files
+    """
+    prefix = "{0}/{1}/".format(gh_type, branch)
+    imported = 0
+    for object_name in storage.list_objects(prefix):
+        parts = object_name[len(prefix):].split("/")
+        suffix = get_data_suffix(object_name)
+        if len(parts) != 2 or suffix is None:
+            continue
+        sha = parts[0]
+        if store.has_results(branch, sha, suffix):
+            continue
+        contents = storage.download_object(object_name)
+        if contents is None:
+            continue
+        try:
+            store.store_results(branch, sha, suffix, json.loads(contents))
+            imported += 1
+        except (ValueError, KeyError) as e:
+            print("Error importing {0}: {1}".format(object_name, e))
+    return imported
+
+
+def sync_to_storage(store: ResultsStore, storage: Storage, gh_type: str, branch: str) -> int:
+    """
+    Uploads the results of the branch that are in the local store but not yet in the result storage.
+    :return int: The number of uploaded result files
+    """
+    prefix = "{0}/{1}/".format(gh_type, branch)
+    existing = set(storage.list_objects(prefix))
+    uploaded = 0
+    for sha, suffix in store.conn.execute("SELECT sha, suffix FROM results WHERE branch = ?", (branch,)).fetchall():
+        object_name = "{0}{1}/data{2}.json".format(prefix, sha, suffix)
+        if object_name in existing:
+            continue
+        contents = json.dumps(store.load_results(branch, sha, suffix), sort_keys=True, indent=4)
+        if storage.upload_contents(object_name, contents):
+            uploaded += 1
+    return uploaded
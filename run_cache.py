@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+
+from runner import RUN_FILE_EXTENSIONS, RUN_STATUS_COMPLETED, BenchmarkRun
+from storage import Storage
+from utils import hash_file
+
+DEFAULT_RUN_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "shot-benchmarker", "runs")
+# Where the run cache lives in the result storage.
+REMOTE_PREFIX = "run-cache/"
+
+
+def get_run_key(executable_hash: str, problem_name: str, problem_hash: str, options: dict, run_index: int) -> str:
+    """
+    The key of a run result: the SHOT executable, the problem, the solver options and the run index.
+    """
+    key = json.dumps({
+        "executable": executable_hash,
+        "name": problem_name,
+        "problem": problem_hash,
+        "options": options,
+        "run": run_index
+    }, sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class RunCache:
+    """
+    Cache of finished runs, each entry holds the output files and the resource usage of a run.
+    Entries are stored as gzipped JSON files locally, and optionally in the result storage.
+    """
+
+    def __init__(self, directory: str = DEFAULT_RUN_CACHE_DIR, storage: Storage | None = None):
+        self.directory = directory
+        self.storage = storage
+        os.makedirs(directory, exist_ok=True)
+
+    def _local_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], "{0}.json.gz".format(key))
+
+    def load(self, key: str) -> dict | None:
+        path = self._local_path(key)
+        if not os.path.isfile(path) and self.storage is not None:
+            contents = self.storage.download_object("{0}{1}.json.gz".format(REMOTE_PREFIX, key))
+            if contents is not None:
+                self._write_local(path, contents)
+        try:
+            with gzip.open(path, "rt") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, key: str, entry: dict):
+        contents = gzip.compress(json.dumps(entry).encode())
+        self._write_local(self._local_path(key), contents)
+        if self.storage is not None:
+            self.storage.upload_contents("{0}{1}.json.gz".format(REMOTE_PREFIX, key), contents,
+                                       content_type="application/gzip")
+
+    @staticmethod
+    def _write_local(path: str, contents: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as file:
+            file.write(contents)
+        os.replace(tmp_path, path)
+
+
+def create_entry(run: BenchmarkRun, directory: str) -> dict:
+    """
+    Creates a cache entry from a finished run, whose output files have been moved to the directory.
+    """
+    files = {}
+    for extension in RUN_FILE_EXTENSIONS:
+        path = os.path.join(directory, "{0}.{1}".format(run.file_prefix, extension))
+        if os.path.isfile(path):
+            with open(path, "r", errors="replace") as file:
+                files[extension] = file.read()
+    return {"files": files, "resources": run.resources()}
+
+
+def restore_entry(entry: dict, run: BenchmarkRun, directory: str):
+    """
+    Writes the output files of a cached run to the directory, and restores its resource usage on the run,
+    so the results are exactly the same as if it had been executed.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for extension, contents in entry["files"].items():
+        with open(os.path.join(directory, "{0}.{1}".format(run.file_prefix, extension)), "w") as file:
+            file.write(contents)
+    for key, value in entry["resources"].items():
+        setattr(run, key, value)
+    run.run_status = RUN_STATUS_COMPLETED
+
+
+def apply_run_cache(cache: RunCache, runs: list[BenchmarkRun], shot_executable: str, options: dict,
+                    destination: str) -> tuple[list[BenchmarkRun], dict]:
+    """
+    Restores every run that is already in the cache to the destination.
+    :return tuple[list[BenchmarkRun], dict]: The runs that still have to be executed, and the keys of all the runs
+    """
+    executable_hash = hash_file(shot_executable)
+    problem_hashes = {}
+    keys = {}
+    missing = []
+    for run in runs:
+        if run.problem not in problem_hashes:
+            problem_hashes[run.problem] = hash_file(run.problem)
+        key = get_run_key(executable_hash, run.name, problem_hashes[run.problem], options, run.run)
+        keys[(run.name, run.run)] = key
+        entry = cache.load(key)
+        if entry is None:
+            missing.append(run)
+            continue
+        restore_entry(entry, run, destination)
+    print("Reusing {0} cached runs, executing {1} runs".format(len(runs) - len(missing), len(missing)))
+    return missing, keys
+
+
+def save_runs(cache: RunCache, runs: list[BenchmarkRun], keys: dict, directory: str):
+    """
+    Saves the runs that completed to the cache, failed runs are not cached so they are retried the next time.
+    """
+    for run in runs:
+        if run.completed:
+            cache.save(keys[(run.name, run.run)], create_entry(run, directory))
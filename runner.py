@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import os
+import queue
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable
+
+from profiler import DEFAULT_SAMPLE_FREQUENCY, PROFILE_FILE_EXTENSIONS, build_perf_command
+from tracing import stage, traced
+
+# The output files SHOT writes for every run.
+RUN_FILE_EXTENSIONS = ("trc", "log", "osrl")
+
+# The statuses a run can end up with, SHOT's own solution status is stored separately.
+RUN_STATUS_COMPLETED = "completed"
+RUN_STATUS_TIMEOUT = "timeout"
+RUN_STATUS_CRASHED = "crashed"
+RUN_STATUS_FAILED = "failed"
+
+
+@dataclass
+class BenchmarkRun:
+    """
+    A single (problem, run index) pair that should be solved by SHOT.
+    """
+    name: str
+    problem: str
+    run: int
+    expected_time: float = 0.0
+    scratch_dir: str = ""
+    # Warmup runs are executed like any other run, but their results are thrown away.
+    warmup: bool = False
+    # The perf mode the run is profiled with, see profiler.py, empty for a normal run.
+    profile: str = ""
+    # The solver configuration of the run in matrix mode, see matrix.py. An empty executable means the default one.
+    config: str = ""
+    executable: str = ""
+    arguments: tuple = ()
+    # Filled in once the run has finished.
+    run_status: str = ""
+    exit_code: int | None = None
+    wall_time: float | None = None
+    user_time: float | None = None
+    sys_time: float | None = None
+    max_rss: int | None = None
+
+    @property
+    def file_prefix(self) -> str:
+        if self.warmup:
+            return "{0}-warmup-{1}".format(self.name, self.run)
+        return "{0}-run-{1}".format(self.name, self.run)
+
+    def output_file(self, extension: str) -> str:
+        return os.path.join(self.scratch_dir, "{0}.{1}".format(self.file_prefix, extension))
+
+    @property
+    def completed(self) -> bool:
+        return self.run_status == RUN_STATUS_COMPLETED
+
+    def resources(self) -> dict:
+        """
+        The resource usage of the run, in the form stored in data.json.
+        """
+        return {
+            "run_status": self.run_status,
+            "exit_code": self.exit_code,
+            "wall_time": self.wall_time,
+            "user_time": self.user_time,
+            "sys_time": self.sys_time,
+            "max_rss": self.max_rss
+        }
+
+
+def get_core_sets(jobs: int) -> list[list[int]]:
+    """
+    Splits the cores available to this process into `jobs` disjoint sets, one for each worker.
+    If there are fewer cores than workers, the workers share the cores round-robin.
+    """
+    cores = sorted(os.sched_getaffinity(0))
+    if jobs <= 1:
+        return [cores]
+    if len(cores) < jobs:
+        return [[cores[i % len(cores)]] for i in range(jobs)]
+    per_job = len(cores) // jobs
+    return [cores[i * per_job:(i + 1) * per_job] for i in range(jobs)]
+
+
+def order_runs(runs: list[BenchmarkRun]) -> list[BenchmarkRun]:
+    """
+    Orders the runs longest-expected-first, so the long problems do not end up alone at the end of the sweep.
+    The sort is stable, so runs with equal expectations keep their original order.
+    """
+    return sorted(runs, key=lambda run: run.expected_time, reverse=True)
+
+
+def build_command(shot_executable: str, run: BenchmarkRun,
+                  profile_frequency: int = DEFAULT_SAMPLE_FREQUENCY) -> list[str]:
+    command = [
+        run.executable or shot_executable,
+        run.problem,
+        "--trc", run.output_file("trc"),
+        "--log", run.output_file("log"),
+        "--osrl", run.output_file("osrl"),
+        *run.arguments
+    ]
+    if run.profile:
+        return build_perf_command(command, run.profile, os.path.join(run.scratch_dir, run.file_prefix),
+                                  profile_frequency)
+    return command
+
+
+def kill_process_group(pid: int):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def execute_run(shot_executable: str, run: BenchmarkRun, cores: list[int] | None = None,
+                timeout: float | None = None, profile_frequency: int = DEFAULT_SAMPLE_FREQUENCY) -> BenchmarkRun:
+    """
+    Runs SHOT for a single run inside its own scratch directory, pinned to the given cores.
+    SHOT is started in its own process group, which is killed as a whole if the run exceeds the timeout.
+    The wall time, CPU times and peak RSS of the run are recorded on the run. Profiled runs are measured including
+    the overhead of perf.
+    """
+    print("Running benchmark: {0} (run #{1})".format(run.problem, run.run))
+    os.makedirs(run.scratch_dir, exist_ok=True)
+
+    # preexec_fn is not safe with the worker threads around, the child can deadlock before exec. taskset pins SHOT
+    # before it starts, without it the process is pinned right after it is spawned.
+    command = build_command(shot_executable, run, profile_frequency)
+    taskset = shutil.which("taskset") if cores else None
+    if taskset is not None:
+        command = [taskset, "-c", ",".join(str(core) for core in cores)] + command
+
+    start = time.monotonic()
+    try:
+        process = subprocess.Popen(
+            command,
+            cwd=run.scratch_dir,
+            start_new_session=True
+        )
+    except OSError as e:
+        print("Error starting SHOT for {0}: {1}".format(run.file_prefix, e))
+        run.run_status = RUN_STATUS_FAILED
+        return run
+    if cores and taskset is None:
+        try:
+            os.sched_setaffinity(process.pid, cores)
+        except OSError:
+            # SHOT has already exited.
+            pass
+
+    timed_out = threading.Event()
+
+    def on_timeout():
+        timed_out.set()
+        kill_process_group(process.pid)
+
+    timer = None
+    if timeout is not None:
+        timer = threading.Timer(timeout, on_timeout)
+        timer.start()
+    try:
+        # wait4 gives us the resource usage of SHOT itself, not of every child this process has waited for.
+        _, wait_status, usage = os.wait4(process.pid, 0)
+    finally:
+        if timer is not None:
+            timer.cancel()
+    run.wall_time = time.monotonic() - start
+    # We reaped the process ourselves, so Popen must not try to wait for it again.
+    process.returncode = os.waitstatus_to_exitcode(wait_status)
+    # Clean up anything SHOT left running in its process group.
+    kill_process_group(process.pid)
+
+    run.exit_code = process.returncode
+    run.user_time = usage.ru_utime
+    run.sys_time = usage.ru_stime
+    # ru_maxrss is in kilobytes on Linux.
+    run.max_rss = usage.ru_maxrss
+    if timed_out.is_set():
+        run.run_status = RUN_STATUS_TIMEOUT
+        print("Benchmark {0} timed out after {1} seconds".format(run.file_prefix, timeout))
+    elif run.exit_code != 0:
+        run.run_status = RUN_STATUS_CRASHED
+        print("Benchmark {0} exited with code {1}".format(run.file_prefix, run.exit_code))
+    else:
+        run.run_status = RUN_STATUS_COMPLETED
+    return run
+
+
+def run_benchmarks(shot_executable: str, runs: list[BenchmarkRun], jobs: int = 1,
+                   scratch_root: str | None = None, timeout: float | None = None,
+                   longest_first: bool = True, profile_frequency: int = DEFAULT_SAMPLE_FREQUENCY,
+                   on_complete: Callable[[BenchmarkRun], None] | None = None) -> list[BenchmarkRun]:
+    """
+    Executes all the runs with a pool of `jobs` workers. Every worker owns a disjoint set of cores, and every run
+    writes its trc/log/osrl files to its own scratch directory, so concurrent runs never collide.
+    Unless longest_first is disabled, the runs are started longest-expected-first, otherwise in the given order.
+    on_complete is called with every run as soon as it has finished, one run at a time.
+    :return list[BenchmarkRun]: The runs, with their scratch directories set.
+    """
+    if scratch_root is None:
+        scratch_root = tempfile.mkdtemp(prefix="shot-benchmarker-")
+    for run in runs:
+        run.scratch_dir = os.path.join(scratch_root, run.config, run.file_prefix)
+
+    if jobs <= 1:
+        for run in runs:
+            with stage("SHOT run", "run", problem=run.name, run=run.run, config=run.config):
+                execute_run(shot_executable, run, timeout=timeout, profile_frequency=profile_frequency)
+            if on_complete is not None:
+                on_complete(run)
+        return runs
+
+    # Each worker takes a free core set from the queue for the duration of one run.
+    core_sets = queue.Queue()
+    for core_set in get_core_sets(jobs):
+        core_sets.put(core_set)
+
+    complete_lock = threading.Lock()
+
+    def worker(run: BenchmarkRun) -> BenchmarkRun:
+        cores = core_sets.get()
+        try:
+            with stage("SHOT run", "run", problem=run.name, run=run.run, config=run.config):
+                execute_run(shot_executable, run, cores, timeout, profile_frequency)
+        finally:
+            core_sets.put(cores)
+        if on_complete is not None:
+            with complete_lock:
+                on_complete(run)
+        return run
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        # We consume the results so that exceptions from the workers are raised here.
+        list(executor.map(worker, order_runs(runs) if longest_first else runs))
+
+    return runs
+
+
+@traced("Collect run files")
+def collect_run_files(runs: list[BenchmarkRun], destination: str):
+    """
+    Moves the output files of every run, and the perf output of profiled runs, from its scratch directory to the
+    destination folder. The runs of a matrix configuration go to a subfolder named after the configuration.
+    """
+    for run in runs:
+        run_destination = os.path.join(destination, run.config)
+        os.makedirs(run_destination, exist_ok=True)
+        for extension in RUN_FILE_EXTENSIONS + PROFILE_FILE_EXTENSIONS:
+            source = run.output_file(extension)
+            if os.path.isfile(source):
+                shutil.move(source, os.path.join(run_destination, "{0}.{1}".format(run.file_prefix, extension)))
+        shutil.rmtree(run.scratch_dir, ignore_errors=True)
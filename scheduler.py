@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import math
+import random
+import statistics
+from collections import defaultdict
+
+from runner import BenchmarkRun
+from stats import t_critical
+
+
+def relative_ci_width(times: list[float], confidence: float = 0.95) -> float:
+    """
+    Width of the confidence interval of the mean, relative to the mean. Infinite if it cannot be computed.
+    """
+    if len(times) < 2:
+        return math.inf
+    mean = statistics.fmean(times)
+    if mean <= 0:
+        return math.inf
+    half_width = t_critical(len(times) - 1, confidence) * statistics.stdev(times) / math.sqrt(len(times))
+    return 2 * half_width / mean
+
+
+class RunScheduler:
+    """
+    Decides which runs to execute, in rounds. In the fixed mode every problem is run `runs` times in a single round.
+    In the adaptive mode every problem is run min_runs times, after which each round repeats only the problems
+    whose timing confidence interval is still wider than target_width (relative to the mean), until they hit
+    max_runs or have used up time_budget seconds.
+    With shuffle, the problem order is randomized separately for every round of runs, so drift on the machine
+    does not always land on the same problems.
+    """
+
+    def __init__(self, problems: list[tuple[str, str]], runs: int = 1, adaptive: bool = False, min_runs: int = 3,
+                 max_runs: int = 20, target_width: float = 0.05, time_budget: float | None = None,
+                 confidence: float = 0.95, expected_times: dict | None = None, shuffle: bool = False,
+                 seed: int | None = None):
+        self.problems = problems
+        self.adaptive = adaptive
+        # The confidence interval needs at least two samples.
+        self.min_runs = max(min_runs, 2) if adaptive else runs
+        self.max_runs = max(max_runs, self.min_runs) if adaptive else runs
+        self.target_width = target_width
+        self.time_budget = time_budget
+        self.confidence = confidence
+        self.expected_times = expected_times or {}
+        self.run_counts = defaultdict(int)
+        self.times = defaultdict(list)
+        self.spent = defaultdict(float)
+        self.finished = set()
+        self.shuffle = shuffle
+        self.random = random.Random(seed)
+
+    def _ordered_problems(self) -> list[tuple[str, str]]:
+        if not self.shuffle:
+            return self.problems
+        problems = list(self.problems)
+        self.random.shuffle(problems)
+        return problems
+
+    def _create_run(self, name: str, problem: str) -> BenchmarkRun:
+        run = BenchmarkRun(name=name, problem=problem, run=self.run_counts[name],
+                           expected_time=self.expected_times.get(name, 0.0))
+        self.run_counts[name] += 1
+        return run
+
+    def initial_runs(self) -> list[BenchmarkRun]:
+        return [self._create_run(name, problem) for _ in range(self.min_runs)
+                for name, problem in self._ordered_problems()]
+
+    def record(self, run: BenchmarkRun, time: float | None):
+        """
+        Records the measured time of a finished run, None for runs that failed.
+        """
+        if time is not None:
+            self.times[run.name].append(time)
+        self.spent[run.name] += run.wall_time or 0.0
+
+    def is_done(self, name: str) -> bool:
+        if name in self.finished:
+            return True
+        if not self.adaptive or self.run_counts[name] >= self.max_runs:
+            return True
+        if self.time_budget is not None and self.spent[name] >= self.time_budget:
+            return True
+        # Problems that never produce a time cannot converge, so we do not keep repeating them.
+        if self.run_counts[name] >= self.min_runs and not self.times[name]:
+            return True
+        return relative_ci_width(self.times[name], self.confidence) <= self.target_width
+
+    def next_runs(self) -> list[BenchmarkRun]:
+        """
+        The runs of the next round, an empty list once every problem is done.
+        """
+        runs = []
+        for name, problem in self._ordered_problems():
+            if self.is_done(name):
+                self.finished.add(name)
+                continue
+            runs.append(self._create_run(name, problem))
+        return runs
+
+    def warmup_runs(self, count: int) -> list[BenchmarkRun]:
+        """
+        Runs that are executed before the measurements and thrown away, they do not count towards the run count.
+        """
+        return [BenchmarkRun(name=name, problem=problem, run=i, expected_time=self.expected_times.get(name, 0.0),
+                             warmup=True) for i in range(count) for name, problem in self._ordered_problems()]
+
+    def summary(self, name: str) -> dict:
+        """
+        The scheduling information of a problem, as stored in data.json.
+        """
+        width = relative_ci_width(self.times[name], self.confidence)
+        return {
+            "run_count": self.run_counts[name],
+            "relative_ci_width": width if math.isfinite(width) else None
+        }
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import datetime
+import json
+import os
+import re
+import socketserver
+import threading
+import uuid
+
+from profiler import PROFILE_RECORD, PROFILE_STAT
+
+DEFAULT_MAX_PENDING = 100
+DEFAULT_WORKERS = 1
+# How often the workers look for new jobs when nothing wakes them up.
+POLL_INTERVAL = 1.0
+SPOOL_FOLDERS = ("incoming", "running", "done", "failed", "work")
+
+# The options of main.py run a job may pass, and whether they take a value, None if it is optional. Options that
+# upload, pick the storage or the commits to compare to are left to the server, which publishes the results under the
+# SHA of the job.
+JOB_OPTIONS = {
+    "-r": True, "--runs": True, "-a": False, "--adaptive": False, "--min-runs": True, "--max-runs": True,
+    "--target-ci-width": True, "--time-budget": True, "-w": True, "--warmup": True, "--shuffle": False,
+    "--seed": True, "--calibrate": False, "-t": True, "--timeout": True, "-j": True, "--jobs": True,
+    "-i": False, "--incremental": False, "--profile": None, "--profile-problems": True, "--profile-frequency": True
+}
+
+# The results are stored and looked up under full SHAs, a baseline to compare to may be abbreviated as the server
+# resolves it.
+_sha_pattern = re.compile(r"^[0-9a-f]{40}$")
+_short_sha_pattern = re.compile(r"^[0-9a-f]{7,40}$")
+_suffix_pattern = re.compile(r"^[A-Za-z0-9_.-]*$")
+
+
+def validate_arguments(arguments: list[str]):
+    """
+    Checks that the arguments only use the JOB_OPTIONS, each followed by its value if it takes one.
+    Raises a ValueError naming the first argument that is not allowed.
+    """
+    i = 0
+    while i < len(arguments):
+        option, has_value, _ = arguments[i].partition("=")
+        if option not in JOB_OPTIONS:
+            raise ValueError("The argument {0!r} is not allowed in a job".format(arguments[i]))
+        if JOB_OPTIONS[option] and not has_value:
+            if i + 1 == len(arguments):
+                raise ValueError("The option {0} needs a value".format(option))
+            i += 1
+        elif JOB_OPTIONS[option] is None and not has_value:
+            if i + 1 < len(arguments) and arguments[i + 1] in (PROFILE_STAT, PROFILE_RECORD):
+                i += 1
+        elif JOB_OPTIONS[option] is False and has_value:
+            raise ValueError("The option {0} does not take a value".format(option))
+        i += 1
+
+
+def validate_job(job: dict) -> dict:
+    """
+    Checks a job and returns it with the optional fields filled in. A job is a JSON object of
+    {"sha", "executable", "config", "suffix", "compare_to", "arguments"}, where only the sha and the executable are
+    required. The config is a matrix file, see matrix.load_matrix. The arguments are passed on to main.py run, and may
+    only use the JOB_OPTIONS.
+    Raises a ValueError describing what is wrong with the job.
+    """
+    if not isinstance(job, dict):
+        raise ValueError("A job must be a JSON object")
+    if not isinstance(job.get("sha"), str) or not _sha_pattern.match(job["sha"]):
+        raise ValueError("Invalid commit SHA {0!r}, use the full 40 character SHA".format(job.get("sha")))
+    if not isinstance(job.get("executable"), str) or not os.path.isfile(job["executable"]):
+        raise ValueError("The executable {0!r} does not exist".format(job.get("executable")))
+    if job.get("config") is not None and not os.path.isfile(job["config"]):
+        raise ValueError("The configuration file {0!r} does not exist".format(job["config"]))
+    if not _suffix_pattern.match(job.get("suffix") or ""):
+        raise ValueError("Invalid suffix {0!r}, use letters, digits, _, . and -".format(job.get("suffix")))
+    if job.get("compare_to") is not None and not _short_sha_pattern.match(str(job["compare_to"])):
+        raise ValueError("Invalid commit SHA {0!r} to compare to".format(job["compare_to"]))
+    arguments = job.get("arguments") or []
+    if not isinstance(arguments, list) or not all(isinstance(argument, str) for argument in arguments):
+        raise ValueError("The arguments must be a list of strings")
+    validate_arguments(arguments)
+    return {"sha": job["sha"], "executable": os.path.abspath(job["executable"]),
+            "config": os.path.abspath(job["config"]) if job.get("config") else None, "suffix": job.get("suffix") or "",
+            "compare_to": job.get("compare_to"), "arguments": arguments}
+
+
+class JobSpool:
+    """
+    A job queue in a directory, a job is a JSON file that moves from incoming/ to running/ and then to done/ or
+    failed/ by renames. Renames are atomic, so producers can drop jobs into incoming/ themselves (written elsewhere
+    and renamed in), and every job is claimed by exactly one worker. The files of a job are kept in work/<id>/.
+    """
+
+    def __init__(self, directory: str, max_pending: int = DEFAULT_MAX_PENDING):
+        self.directory = directory
+        self.max_pending = max_pending
+        for folder in SPOOL_FOLDERS:
+            os.makedirs(os.path.join(directory, folder), exist_ok=True)
+
+    def _path(self, folder: str, job_id: str) -> str:
+        return os.path.join(self.directory, folder, "{0}.json".format(job_id))
+
+    def work_directory(self, job_id: str) -> str:
+        return os.path.join(self.directory, "work", job_id)
+
+    def pending(self) -> list[str]:
+        """
+        The ids of the jobs waiting in incoming/, oldest first. The ids sort by the time the job was submitted.
+        """
+        return sorted(filename[:-len(".json")] for filename in os.listdir(os.path.join(self.directory, "incoming"))
+                      if filename.endswith(".json"))
+
+    def submit(self, job: dict) -> str | None:
+        """
+        Adds the job to the queue.
+        :return str | None: The id of the job, or None if the queue is full
+        """
+        if len(self.pending()) >= self.max_pending:
+            return None
+        job_id = "{0}-{1}".format(datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%S%f"),
+                                  uuid.uuid4().hex[:8])
+        temporary_path = self._path("work", job_id)
+        with open(temporary_path, "w") as file:
+            json.dump(job, file, sort_keys=True, indent=4)
+        os.replace(temporary_path, self._path("incoming", job_id))
+        return job_id
+
+    def claim(self) -> tuple[str, dict] | None:
+        """
+        Moves the oldest valid job to running/. Jobs that cannot be read or are invalid go to failed/.
+        :return tuple[str, dict] | None: The id and the job, or None if there is no job waiting
+        """
+        for job_id in self.pending():
+            try:
+                os.rename(self._path("incoming", job_id), self._path("running", job_id))
+            except FileNotFoundError:
+                # Claimed by another worker.
+                continue
+            try:
+                with open(self._path("running", job_id), "r") as file:
+                    return job_id, validate_job(json.load(file))
+            except (OSError, ValueError) as e:
+                self.finish(job_id, {"status": "failed", "error": str(e)})
+        return None
+
+    def finish(self, job_id: str, result: dict):
+        """
+        Moves the job to done/ or failed/, by the status of the result, with the result added to the job file.
+        """
+        folder = "done" if result.get("status") == "done" else "failed"
+        try:
+            with open(self._path("running", job_id), "r") as file:
+                job = json.load(file)
+        except (OSError, ValueError):
+            job = {}
+        with open(self._path("running", job_id), "w") as file:
+            json.dump({"job": job, "result": result}, file, sort_keys=True, indent=4)
+        os.replace(self._path("running", job_id), self._path(folder, job_id))
+
+    def requeue_running(self) -> int:
+        """
+        Moves the jobs left in running/ by a daemon that was stopped back to incoming/.
+        :return int: The number of requeued jobs
+        """
+        requeued = 0
+        for filename in os.listdir(os.path.join(self.directory, "running")):
+            if filename.endswith(".json"):
+                os.replace(os.path.join(self.directory, "running", filename),
+                           os.path.join(self.directory, "incoming", filename))
+                requeued += 1
+        return requeued
+
+
+class _JobHandler(socketserver.StreamRequestHandler):
+    """
+    Reads one job per line and answers every job with a line of {"accepted": true, "id"} or
+    {"accepted": false, "error"}. A full queue is an error, so producers slow down instead of piling up jobs.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                job_id = self.server.spool.submit(validate_job(json.loads(line)))
+                if job_id is None:
+                    reply = {"accepted": False, "error": "The queue is full, try again later"}
+                else:
+                    reply = {"accepted": True, "id": job_id}
+                    self.server.wake.set()
+            except ValueError as e:
+                reply = {"accepted": False, "error": str(e)}
+            self.wfile.write((json.dumps(reply) + "\n").encode())
+
+
+def start_socket_server(path: str, spool: JobSpool, wake: threading.Event) -> socketserver.UnixStreamServer:
+    """
+    Accepts jobs on a Unix socket in a background thread, adding them to the spool and waking up the workers.
+    """
+    if os.path.exists(path):
+        os.unlink(path)
+    server = socketserver.ThreadingUnixStreamServer(path, _JobHandler)
+    server.daemon_threads = True
+    server.spool = spool
+    server.wake = wake
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import heapq
+import json
+import os
+from collections import Counter
+
+
+def parse_shard(value: str) -> tuple[int, int]:
+    """
+    Parses a shard of the form i/N, where i is between 1 and N.
+    """
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise ValueError("Shard must be of the form i/N, got {0}".format(value))
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError("Shard index must be between 1 and {0}, got {1}".format(count, index))
+    return index, count
+
+
+def assign_shards(problems: list[tuple[str, str]], weights: dict, count: int) -> list[list[tuple[str, str]]]:
+    """
+    Assigns the problems to `count` shards with the greedy longest-processing-time rule: the problems are taken
+    longest first, and each goes to the shard with the least total weight so far.
+    Ties are broken by name and shard index, so every shard job computes the same assignment from the same weights.
+    """
+    shards = [[] for _ in range(count)]
+    loads = [(0.0, i) for i in range(count)]
+    for name, problem in sorted(problems, key=lambda item: (-weights.get(item[0], 0.0), item[0])):
+        load, i = heapq.heappop(loads)
+        shards[i].append((name, problem))
+        heapq.heappush(loads, (load + weights.get(name, 0.0), i))
+    return shards
+
+
+def write_shard_manifest(path: str, shard: tuple[int, int], problems: list[str], all_problems: list[str]):
+    with open(path, "w") as file:
+        json.dump({
+            "index": shard[0],
+            "count": shard[1],
+            "problems": sorted(problems),
+            "all_problems": sorted(all_problems)
+        }, file, sort_keys=True, indent=4)
+
+
+def get_manifest_path(data_file: str) -> str:
+    """
+    The shard manifest lives next to the data file, data<suffix>.json -> shard<suffix>.json
+    """
+    directory, filename = os.path.split(data_file)
+    return os.path.join(directory, "shard" + filename[len("data"):])
+
+
+def merge_shards(data_files: list[str]) -> list:
+    """
+    Merges the data files of the shards into one result, after checking that every shard is present exactly once
+    and that every problem is in exactly one of them.
+    Raises a ValueError describing what is wrong otherwise.
+    """
+    manifests = []
+    merged = []
+    for data_file in data_files:
+        with open(get_manifest_path(data_file), "r") as file:
+            manifests.append(json.load(file))
+        with open(data_file, "r") as file:
+            merged.extend(json.load(file))
+
+    counts = set(manifest["count"] for manifest in manifests)
+    if len(counts) != 1:
+        raise ValueError("The shards disagree on the number of shards: {0}".format(sorted(counts)))
+    count = counts.pop()
+    indexes = sorted(manifest["index"] for manifest in manifests)
+    if indexes != list(range(1, count + 1)):
+        missing = sorted(set(range(1, count + 1)) - set(indexes))
+        duplicate = sorted(set(i for i in indexes if indexes.count(i) > 1))
+        raise ValueError("Expected shards 1 to {0}, missing: {1}, duplicate: {2}".format(count, missing, duplicate))
+    if len(set(tuple(manifest["all_problems"]) for manifest in manifests)) != 1:
+        raise ValueError("The shards were created from different problem lists")
+
+    names = Counter(result["name"] for result in merged)
+    duplicates = sorted(name for name, occurrences in names.items() if occurrences > 1)
+    if duplicates:
+        raise ValueError("Problems found in more than one shard: {0}".format(", ".join(duplicates)))
+    missing = sorted(set(manifests[0]["all_problems"]) - set(names))
+    if missing:
+        raise ValueError("Problems missing from the shards: {0}".format(", ".join(missing)))
+    return sorted(merged, key=lambda result: result["name"])
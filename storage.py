@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import abc
+import os
+import shutil
+import tempfile
+
+from github_data import GithubData
+
+STORAGE_ALLAS = "allas"
+STORAGE_LOCAL = "local"
+DEFAULT_STORAGE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "shot-benchmarker", "storage")
+
+
+class Storage(abc.ABC):
+    """
+    Where the results are shared between jobs. Objects are named like in the Allas bucket, the data file of a commit
+    is <ref type>/<branch>/<sha>/data<suffix>.json.
+    Backends implement create_bucket, upload_contents, upload_files, fetch_object, fetch_range and list_objects, the
+    rest is shared.
+    """
+
+    def __init__(self, gh_data: GithubData | None = None):
+        self._gh_data = gh_data
+
+    @property
+    def gh_data(self) -> GithubData:
+        # Only needed for the result paths, so runs that only use the run cache work outside of Actions.
+        if self._gh_data is None:
+            self._gh_data = GithubData()
+        return self._gh_data
+
+    def clone(self) -> Storage:
+        """
+        A storage for use in another thread. Backends that are thread safe return themselves.
+        """
+        return self
+
+    def session_environment(self) -> dict:
+        """
+        Environment variables that let a child process reuse the authentication of this storage.
+        """
+        return {}
+
+    @abc.abstractmethod
+    def create_bucket(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def upload_contents(self, path: str, contents: str | bytes, content_type: str = "application/json") -> bool:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def upload_files(self, files: list[tuple[str, str]], content_type: str = "application/octet-stream") -> bool:
+        """
+        Uploads local files, streamed from disk rather than read into memory.
+        :param files: The (local path, object name) of every file
+        :return bool: Whether every file was uploaded
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def fetch_object(self, path: str) -> None | str:
+        """
+        Fetches the object and returns the path of a local file with its contents, None if it does not exist.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def fetch_range(self, path: str, offset: int, length: int) -> None | bytes:
+        """
+        Fetches length bytes of the object starting at offset, None if it does not exist.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def list_objects(self, prefix: str = "") -> list[str]:
+        raise NotImplementedError
+
+    def download_object(self, path: str) -> None | bytes:
+        local_path = self.fetch_object(path)
+        if local_path is None:
+            return None
+        with open(local_path, 'rb') as local_file:
+            return local_file.read()
+
+    def get_data_path(self, sha: str, filename_suffix: str = "", extension: str = "json") -> str:
+        return "{0}data{1}.{2}".format(self.gh_data.construct_valid_data(sha), filename_suffix, extension)
+
+    def upload_file(self, sha: str, file: str, filename_suffix: str = "") -> bool:
+        """
+        Uploads the data file of the commit.
+        """
+        path = self.get_data_path(sha, filename_suffix)
+        print("Uploading file: {0}".format(path))
+        with open(file, "r") as f:
+            return self.upload_contents(path, f.read(), content_type="application/json")
+
+    def download_file(self, sha: str, filename_suffix: str = "", extension: str = "json") -> None | str:
+        """
+        Downloads the data file of the commit, in the JSON or the columnar format.
+        :return None | str: The local path of the file, or None if it does not exist
+        """
+        return self.fetch_object(self.get_data_path(sha, filename_suffix, extension))
+
+    def list_result_commits(self, filename_suffix: str = "") -> set[str]:
+        """
+        The SHAs of the commits on the branch that have results, from a single listing.
+        """
+        prefix = self.gh_data.construct_branch_prefix()
+        data_file = "data{0}.json".format(filename_suffix)
+        commits = set()
+        for object_name in self.list_objects(prefix):
+            parts = object_name[len(prefix):].split("/")
+            if len(parts) == 2 and parts[1] == data_file:
+                commits.add(parts[0])
+        return commits
+
+
+class LocalStorage(Storage):
+    """
+    Stores the objects as files in a directory, with the same layout as the bucket. Useful on self-hosted runners
+    with a shared disk, and as an offline stand-in for Allas.
+    """
+
+    def __init__(self, directory: str = DEFAULT_STORAGE_DIR, gh_data: GithubData | None = None):
+        super().__init__(gh_data)
+        self.directory = directory
+
+    def _path(self, path: str) -> str:
+        local_path = os.path.normpath(os.path.join(self.directory, path))
+        # Object names come from the results, they must not point outside the storage directory.
+        if os.path.commonpath([local_path, os.path.abspath(self.directory)]) != os.path.abspath(self.directory):
+            raise ValueError("Invalid object name {0}".format(path))
+        return local_path
+
+    def create_bucket(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+    def upload_contents(self, path: str, contents: str | bytes, content_type: str = "application/json") -> bool:
+        if isinstance(contents, str):
+            contents = contents.encode()
+        local_path = self._path(path)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        # Written to a temporary file first, so readers never see a partial object.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(local_path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as file:
+            file.write(contents)
+        os.replace(tmp_path, local_path)
+        print("File uploaded: {0}".format(path))
+        return True
+
+    def upload_files(self, files: list[tuple[str, str]], content_type: str = "application/octet-stream") -> bool:
+        for source, path in files:
+            local_path = self._path(path)
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(local_path), suffix=".tmp")
+            os.close(fd)
+            shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, local_path)
+            print("File uploaded: {0}".format(path))
+        return True
+
+    def fetch_object(self, path: str) -> None | str:
+        local_path = self._path(path)
+        return local_path if os.path.isfile(local_path) else None
+
+    def fetch_range(self, path: str, offset: int, length: int) -> None | bytes:
+        local_path = self.fetch_object(path)
+        if local_path is None:
+            return None
+        with open(local_path, "rb") as file:
+            file.seek(offset)
+            return file.read(length)
+
+    def list_objects(self, prefix: str = "") -> list[str]:
+        objects = []
+        for root, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if filename.endswith(".tmp"):
+                    continue
+                name = os.path.relpath(os.path.join(root, filename), self.directory).replace(os.sep, "/")
+                if name.startswith(prefix):
+                    objects.append(name)
+        return sorted(objects)
+
+
+def create_storage(backend: str | None = None, directory: str | None = None) -> Storage:
+    """
+    Creates the storage backend, by default from INPUT_STORAGE (allas or local) and INPUT_STORAGE_DIR.
+    The Swift client is only imported when Allas is used.
+    """
+    backend = backend or os.environ.get("INPUT_STORAGE") or STORAGE_ALLAS
+    if backend == STORAGE_LOCAL:
+        return LocalStorage(directory or os.environ.get("INPUT_STORAGE_DIR") or DEFAULT_STORAGE_DIR)
+    if backend == STORAGE_ALLAS:
+        from allas import Allas
+        return Allas()
+    raise ValueError("Unknown storage backend {0}".format(backend))
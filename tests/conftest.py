@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+import importlib
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# The GitHub environment is only used to name the objects in the storage.
+os.environ.setdefault("GITHUB_REF_TYPE", "branch")
+os.environ.setdefault("GITHUB_REF_NAME", "test")
+os.environ.setdefault("GITHUB_RUN_NUMBER", "0")
+
+
+@pytest.fixture(scope="session")
+def main_module():
+    """
+    The main module, which parses its command line when it is imported.
+    """
+    argv = sys.argv
+    sys.argv = [os.path.join(REPO_DIR, "main.py"), "run"]
+    try:
+        return importlib.import_module("main")
+    finally:
+        sys.argv = argv
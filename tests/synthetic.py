@@ -0,0 +1,106 @@
+"""
+Synthetic run files and results for the tests and the benchmarks: OSrL, trace and log files like SHOT writes them,
+result sets in the data.json format, and a fake SHOT executable. Nothing touches the network.
+"""
+from __future__ import annotations
+
+import os
+import random
+import stat
+import sys
+
+PHASES = ("Total", "ProblemInitialization", "DualStrategy", "PrimalStrategy", "ReformulationProblem")
+
+_osrl_template = """<?xml version="1.0" encoding="UTF-8"?>
+<osrl xmlns="os.optimizationservices.org">
+  <general><generalStatus type="normal"/></general>
+  <optimization numberOfSolutions="1">
+    <solution targetObjectiveIdx="-1">
+      <status type="{status}"><substatus type="{substatus}"/></status>
+      <objectives><values numberOfObj="1"><obj idx="-1">{objective}</obj></values></objectives>
+    </solution>
+    <otherResults>
+      <other name="PrimalBound" value="{objective}"/>
+      <other name="DualBound" value="{dual_bound}"/>
+    </otherResults>
+    <timingInformation>
+{times}
+    </timingInformation>
+  </optimization>
+</osrl>
+"""
+
+# Writes the same kind of files as SHOT, with a short sleep standing in for the solve.
+_fake_shot = """#!{python}
+import os, sys, time
+sys.path.insert(0, {tests_dir!r})
+from synthetic import write_run_files
+arguments = dict(zip(sys.argv[2::2], sys.argv[3::2]))
+time.sleep(0.01)
+name = os.path.basename(sys.argv[1])
+write_run_files(arguments["--osrl"], arguments["--trc"], arguments["--log"], name, hash(name) % 100 / 10 + 1.0)
+"""
+
+
+def write_run_files(osrl_file: str, trace_file: str, log_file: str, name: str, total: float):
+    """
+    Writes a synthetic OSrL, trace and log file of a run that took total seconds.
+    """
+    objective = 100.0 + len(name)
+    times = [(phase, total if phase == "Total" else total / (i + 1)) for i, phase in enumerate(PHASES)]
+    with open(osrl_file, "w") as file:
+        file.write(_osrl_template.format(
+            status="optimal", substatus="globallyOptimal", objective=objective, dual_bound=objective - 0.5,
+            times="\n".join('      <time type="{0}" unit="second">{1}</time>'.format(phase, value)
+                            for phase, value in times)))
+    with open(trace_file, "w") as file:
+        file.write("* Trace Record Definition\n* InputFileName,ModelType,SolverName,ObjectiveValue,SolverTime\n")
+        file.write("{0},MINLP,SHOT,{1},{2}\n".format(name, objective, total))
+    with open(log_file, "w") as file:
+        for iteration in range(50):
+            dual = objective - 50.0 / (iteration + 1)
+            primal = objective + 50.0 / (iteration + 1)
+            file.write(" {0:5d}: MILP-O  {1:.2f}  3 | 12  {2:.6e} | {3:.6e}  1.0e-01 | 1.0e-02\n".format(
+                iteration, total * (iteration + 1) / 50, dual, primal))
+
+
+def synthetic_results(problems: int, runs: int, seed: int, slowdown: float = 1.0) -> list:
+    """
+    A result set in the data.json format, where every tenth problem is slowdown times slower.
+    """
+    generator = random.Random(seed)
+    results = []
+    for i in range(problems):
+        base = 0.5 + (i % 97) / 10
+        factor = slowdown if i % 10 == 0 else 1.0
+        run_data = []
+        for _ in range(runs):
+            total = base * factor * generator.lognormvariate(0, 0.03)
+            run_data.append({"time": total, "status": "optimal", "substatus": "globallyOptimal",
+                             "phase_times": {phase: total / (j + 1) for j, phase in enumerate(PHASES)}})
+        times = [run["time"] for run in run_data]
+        results.append({
+            "name": "problem{0:05d}".format(i),
+            "runs": run_data,
+            "average_time": sum(times) / len(times),
+            "median_time": sorted(times)[len(times) // 2],
+            "most_common_status": "optimal",
+            "most_common_substatus": "globallyOptimal",
+            "average_phase_times": {phase: sum(run["phase_times"][phase] for run in run_data) / runs
+                                    for phase in PHASES},
+            "average_counters": {},
+            "average_primal_integral": base,
+            "average_dual_integral": base * 2,
+            "average_time_to_gap": base / 2,
+            "run_count": runs
+        })
+    return results
+
+
+def write_fake_shot(path: str):
+    """
+    Writes an executable that stands in for SHOT, see _fake_shot.
+    """
+    with open(path, "w") as file:
+        file.write(_fake_shot.format(python=sys.executable, tests_dir=os.path.dirname(os.path.abspath(__file__))))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
@@ -0,0 +1,156 @@
+"""
+Benchmarks of the harness itself on synthetic data, so slowdowns in the parse, aggregate, compare and report paths are
+caught before they hit big suites. Save a baseline and fail on regressions with pytest-benchmark:
+
+    python -m pytest tests/test_benchmarks.py --benchmark-autosave
+    python -m pytest tests/test_benchmarks.py --benchmark-compare --benchmark-compare-fail=min:25%
+
+Run the other tests without them with --benchmark-skip.
+"""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+
+import pytest
+
+from synthetic import synthetic_results, write_fake_shot, write_run_files
+
+pytest.importorskip("pytest_benchmark")
+
+from archive import archive_artifacts  # noqa: E402
+from columnar import load_columns, to_columns, write_columns  # noqa: E402
+from osrl_parser import parse_runs  # noqa: E402
+from runner import RUN_STATUS_COMPLETED, collect_run_files, run_benchmarks  # noqa: E402
+from scheduler import RunScheduler  # noqa: E402
+from storage import LocalStorage  # noqa: E402
+
+# The compared result sets.
+PROBLEMS = 2000
+RUNS = 20
+# The problems and runs whose files are parsed and aggregated.
+PARSE_PROBLEMS = 50
+PARSE_RUNS = 20
+E2E_PROBLEMS = 10
+E2E_JOBS = 4
+
+
+@pytest.fixture(scope="module")
+def run_directory(tmp_path_factory) -> tuple[str, list[str]]:
+    directory = str(tmp_path_factory.mktemp("runs"))
+    names = ["problem{0:05d}".format(i) for i in range(PARSE_PROBLEMS)]
+    for name in names:
+        for i in range(PARSE_RUNS):
+            prefix = os.path.join(directory, "{0}-run-{1}".format(name, i))
+            write_run_files(prefix + ".osrl", prefix + ".trc", prefix + ".log", name, 1.0 + i / 10)
+    return directory, names
+
+
+@pytest.fixture(scope="module")
+def compared() -> tuple[list, list]:
+    return synthetic_results(PROBLEMS, RUNS, seed=2, slowdown=1.05), synthetic_results(PROBLEMS, RUNS, seed=1)
+
+
+def test_parse(benchmark, run_directory):
+    directory, names = run_directory
+    run_files = [tuple(os.path.join(directory, "{0}-run-{1}.{2}".format(name, i, extension))
+                       for extension in ("osrl", "trc", "log"))
+                 for name in names for i in range(PARSE_RUNS)]
+    parsed = benchmark(parse_runs, run_files)
+    assert len(parsed) == len(run_files)
+
+
+def test_aggregate(benchmark, main_module, run_directory):
+    directory, names = run_directory
+    scheduler = RunScheduler([(name, name) for name in names], runs=PARSE_RUNS)
+    runs = scheduler.initial_runs()
+    for run in runs:
+        run.run_status = RUN_STATUS_COMPLETED
+    run_results = {(run.name, run.run): run for run in runs}
+    run_counts = {name: PARSE_RUNS for name in names}
+    results = benchmark(main_module.build_comparison_data, names, run_counts, run_results, directory, scheduler, None)
+    assert len(results) == PARSE_PROBLEMS
+
+
+def test_compare(benchmark, main_module, compared):
+    changes, suite = benchmark(main_module.compare_to_previous, *compared)
+    assert changes is not None and suite is not None
+
+
+def test_compare_columns(benchmark, main_module, compared):
+    current, previous = (to_columns(results) for results in compared)
+    changes, suite = benchmark(main_module.compare_to_previous, current, previous)
+    assert changes is not None and suite is not None
+
+
+def test_report(benchmark, main_module, compared):
+    changes, _ = main_module.compare_to_previous(*compared)
+    headers, rows = main_module.build_change_rows(changes)
+    benchmark(main_module.generate_markdown_table, headers, rows)
+
+
+def test_write_json(benchmark, tmp_path, compared):
+    path = str(tmp_path / "data.json")
+
+    def write():
+        with open(path, "w") as file:
+            json.dump(compared[0], file, sort_keys=True, indent=4)
+
+    benchmark(write)
+
+
+def test_load_json(benchmark, tmp_path, compared):
+    path = str(tmp_path / "data.json")
+    with open(path, "w") as file:
+        json.dump(compared[0], file, sort_keys=True, indent=4)
+
+    def load():
+        with open(path, "r") as file:
+            return json.load(file)
+
+    assert len(benchmark(load)) == PROBLEMS
+
+
+def test_write_columns(benchmark, tmp_path, compared):
+    columns = to_columns(compared[0])
+    benchmark(write_columns, str(tmp_path / "data.npz"), columns)
+
+
+def test_load_columns(benchmark, tmp_path, compared):
+    path = str(tmp_path / "data.npz")
+    write_columns(path, to_columns(compared[0]))
+    assert len(benchmark(load_columns, path)) == PROBLEMS
+
+
+def test_end_to_end(benchmark, main_module, tmp_path):
+    """
+    A small run through a fake SHOT, storing and archiving the results in the local storage.
+    """
+    shot_executable = str(tmp_path / "fake-shot")
+    write_fake_shot(shot_executable)
+    storage = LocalStorage(str(tmp_path / "storage"))
+    problems = [("problem{0:05d}".format(i), str(tmp_path / "problem{0:05d}".format(i))) for i in range(E2E_PROBLEMS)]
+    run_counts = {name: 2 for name, _ in problems}
+    destination = str(tmp_path / "destination")
+
+    def end_to_end():
+        os.makedirs(destination)
+        scheduler = RunScheduler(problems, runs=2)
+        runs = run_benchmarks(shot_executable, scheduler.initial_runs(), jobs=E2E_JOBS,
+                              scratch_root=os.path.join(destination, "scratch"))
+        collect_run_files(runs, destination)
+        results = main_module.build_comparison_data([name for name, _ in problems], run_counts,
+                                                    {(run.name, run.run): run for run in runs}, destination,
+                                                    scheduler, None)
+        with open(os.path.join(destination, "data.json"), "w") as file:
+            json.dump(results, file)
+        storage.upload_file("0" * 40, os.path.join(destination, "data.json"))
+        downloaded = main_module.download_results(storage, "0" * 40)
+        archive_artifacts(storage, "artifacts/", destination, run_counts, os.path.join(destination, "bundles"))
+        shutil.rmtree(destination)
+        return downloaded
+
+    downloaded = benchmark.pedantic(end_to_end, rounds=3)
+    assert [result["name"] for result in downloaded] == [name for name, _ in problems]
+    assert all(result["most_common_status"] == "optimal" for result in downloaded)
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from columnar import convert_file, load_columns, load_results, to_columns, write_columns
+from comparison import run_time_matrix
+from synthetic import synthetic_results
+
+
+@pytest.fixture
+def results() -> list:
+    results = synthetic_results(20, 5, seed=1)
+    results[0]["calibration"] = {"factor": 1.5}
+    results[1]["runs"][2]["time"] = None
+    results[2]["runs"] = results[2]["runs"][:3]
+    results[2]["run_count"] = 3
+    results[3]["average_time_to_gap"] = None
+    return results
+
+
+def assert_same_results(restored: list, results: list):
+    assert len(restored) == len(results)
+    for problem, result in zip(restored, results):
+        assert dict(problem) == {key: result[key] for key in problem}
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_columns_round_trip(tmp_path, results: list, compress: bool):
+    path = str(tmp_path / "data.npz")
+    write_columns(path, to_columns(results), compress=compress)
+    columns = load_columns(path)
+    assert_same_results(columns.to_records(), results)
+    names = [result["name"] for result in results]
+    np.testing.assert_array_equal(run_time_matrix(columns, names), run_time_matrix(results, names))
+
+
+def test_convert_file_round_trip(tmp_path, results: list):
+    path = str(tmp_path / "data.json")
+    with open(path, "w") as file:
+        json.dump(results, file)
+    columns_path = convert_file(path)
+    assert columns_path == str(tmp_path / "data.npz")
+    json_path = convert_file(columns_path)
+    # The columns do not hold every field, so converting back never replaces the original data.json.
+    assert json_path == str(tmp_path / "data.from-npz.json")
+    assert_same_results(load_results(json_path), results)
+    with pytest.raises(FileExistsError):
+        convert_file(columns_path)
+    assert load_results(path) == results
+
+
+def test_invalid_columns(tmp_path):
+    path = str(tmp_path / "data.npz")
+    with open(path, "w") as file:
+        file.write("not a zip file")
+    with pytest.raises(ValueError):
+        load_columns(path)
+    assert not os.path.exists(str(tmp_path / "data.from-npz.json"))
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import copy
+
+import pytest
+
+from columnar import to_columns
+from comparison import FASTER, INSUFFICIENT_DATA, NO_CHANGE, SLOWER, compare_results
+from synthetic import synthetic_results
+
+PROBLEMS = 50
+RUNS = 10
+
+
+def classifications(current: list, previous: list) -> dict:
+    names = sorted(result["name"] for result in current)
+    per_problem, _ = compare_results(current, previous, names)
+    return {name: comparison["time_classification"] for name, comparison in per_problem.items()}
+
+
+def calibrate(results: list, factor: float) -> list:
+    results = copy.deepcopy(results)
+    for result in results:
+        result["calibration"] = {"factor": factor}
+    return results
+
+
+def test_identical_times_are_not_changed():
+    results = synthetic_results(PROBLEMS, RUNS, seed=1)
+    assert set(classifications(results, results).values()) == {NO_CHANGE}
+
+
+@pytest.mark.parametrize("slowdown, expected", [(1.5, SLOWER), (1 / 1.5, FASTER)])
+def test_changed_problems_are_classified(slowdown: float, expected: str):
+    previous = synthetic_results(PROBLEMS, RUNS, seed=1)
+    current = synthetic_results(PROBLEMS, RUNS, seed=2, slowdown=slowdown)
+    changed = ["problem{0:05d}".format(i) for i in range(0, PROBLEMS, 10)]
+    classified = classifications(current, previous)
+    assert all(classified[name] == expected for name in changed)
+    assert all(classification == NO_CHANGE for name, classification in classified.items() if name not in changed)
+
+
+def test_single_runs_are_untested():
+    previous = synthetic_results(PROBLEMS, 1, seed=1)
+    current = synthetic_results(PROBLEMS, 1, seed=2, slowdown=1.5)
+    names = sorted(result["name"] for result in current)
+    per_problem, suite = compare_results(current, previous, names)
+    assert all(comparison["time_classification"] == INSUFFICIENT_DATA for comparison in per_problem.values())
+    assert suite["untested"] == PROBLEMS
+
+
+def test_one_sided_calibration_uses_the_raw_times():
+    results = synthetic_results(PROBLEMS, RUNS, seed=1)
+    assert set(classifications(calibrate(results, 2.0), results).values()) == {NO_CHANGE}
+    assert set(classifications(results, calibrate(results, 2.0)).values()) == {NO_CHANGE}
+
+
+def test_calibrated_times_are_normalized():
+    results = synthetic_results(PROBLEMS, RUNS, seed=1)
+    # The same raw times on a machine that is twice as slow are twice as fast.
+    assert set(classifications(calibrate(results, 2.0), calibrate(results, 1.0)).values()) == {FASTER}
+
+
+def test_columns_are_classified_like_json():
+    previous = synthetic_results(PROBLEMS, RUNS, seed=1)
+    current = calibrate(synthetic_results(PROBLEMS, RUNS, seed=2, slowdown=1.5), 1.2)
+    names = sorted(result["name"] for result in current)
+    expected, _ = compare_results(current, previous, names)
+    actual, _ = compare_results(to_columns(current), to_columns(previous), names)
+    for name in names:
+        assert actual[name]["time_classification"] == expected[name]["time_classification"]
+        assert actual[name]["time_ratio"] == pytest.approx(expected[name]["time_ratio"])
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import os
+
+from journal import RunJournal, get_journal_path, read_journal
+from runner import RUN_STATUS_COMPLETED, RUN_STATUS_TIMEOUT, BenchmarkRun
+
+
+def make_runs() -> list[BenchmarkRun]:
+    return [BenchmarkRun(name=name, problem=name + ".nl", run=run) for name in ("a", "b") for run in range(2)]
+
+
+def finish(run: BenchmarkRun, benchmark_dest: str, status: str = RUN_STATUS_COMPLETED) -> BenchmarkRun:
+    run.run_status = status
+    run.exit_code = 0
+    run.wall_time = 1.0 + run.run
+    run.max_rss = 1024
+    if status == RUN_STATUS_COMPLETED:
+        with open(os.path.join(benchmark_dest, "{0}.osrl".format(run.file_prefix)), "w") as file:
+            file.write("<osrl/>")
+    return run
+
+
+def test_resume_restores_finished_runs(tmp_path):
+    benchmark_dest = str(tmp_path)
+    path = get_journal_path(benchmark_dest)
+    runs = make_runs()
+    journal = RunJournal(path)
+    journal.append(finish(runs[0], benchmark_dest), 1.5)
+    journal.append(finish(runs[1], benchmark_dest, RUN_STATUS_TIMEOUT), None)
+    journal.close()
+
+    resumed = RunJournal(path, resume=True)
+    runs = make_runs()
+    missing = resumed.restore(runs, benchmark_dest)
+    assert missing == runs[2:]
+    assert runs[0].run_status == RUN_STATUS_COMPLETED and runs[0].wall_time == 1.0 and runs[0].max_rss == 1024
+    assert runs[1].run_status == RUN_STATUS_TIMEOUT
+    assert resumed.get_time(runs[0]) == 1.5
+    assert resumed.get_time(runs[1]) is None
+    resumed.close()
+
+
+def test_completed_run_without_files_is_rerun(tmp_path):
+    benchmark_dest = str(tmp_path)
+    path = get_journal_path(benchmark_dest)
+    runs = make_runs()
+    journal = RunJournal(path)
+    journal.append(finish(runs[0], benchmark_dest), 1.5)
+    journal.close()
+    os.remove(os.path.join(benchmark_dest, "a-run-0.osrl"))
+
+    resumed = RunJournal(path, resume=True)
+    assert resumed.restore(make_runs(), benchmark_dest) == make_runs()
+    resumed.close()
+
+
+def test_truncated_line_is_skipped_and_repaired(tmp_path):
+    benchmark_dest = str(tmp_path)
+    path = get_journal_path(benchmark_dest)
+    runs = make_runs()
+    journal = RunJournal(path)
+    journal.append(finish(runs[0], benchmark_dest), 1.5)
+    journal.close()
+    # A crash while writing the second entry.
+    with open(path, "a") as file:
+        file.write('{"config": "", "name": "a", "run": 1, "time": ')
+    assert list(read_journal(path)) == [("", "a", 0)]
+
+    resumed = RunJournal(path, resume=True)
+    resumed.append(finish(runs[2], benchmark_dest), 2.5)
+    resumed.close()
+    assert list(read_journal(path)) == [("", "a", 0), ("", "b", 0)]
+
+
+def test_new_journal_replaces_the_previous_one(tmp_path):
+    benchmark_dest = str(tmp_path)
+    path = get_journal_path(benchmark_dest, "-matrix")
+    journal = RunJournal(path)
+    journal.append(finish(make_runs()[0], benchmark_dest), 1.5)
+    journal.close()
+    RunJournal(path).close()
+    assert read_journal(path) == {}
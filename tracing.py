@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+
+class Tracer:
+    """
+    Records how long the stages of the harness take, as complete events in the Chrome trace format, which can be
+    opened in chrome://tracing or Perfetto. Stages from worker threads show up on their own tracks.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+        self.origin = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name: str, category: str = "harness", **details):
+        """
+        Times the block as a stage, the details are shown as the arguments of the event.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            event = {"name": name, "cat": category, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                     "ts": (start - self.origin) * 1e6, "dur": (end - start) * 1e6}
+            if details:
+                event["args"] = {key: str(value) for key, value in details.items()}
+            with self.lock:
+                self.events.append(event)
+
+    def totals(self) -> dict:
+        """
+        The total time in seconds and the number of events of every stage.
+        """
+        totals = defaultdict(lambda: [0.0, 0])
+        with self.lock:
+            for event in self.events:
+                totals[event["name"]][0] += event["dur"] / 1e6
+                totals[event["name"]][1] += 1
+        return {name: tuple(total) for name, total in totals.items()}
+
+    def reset(self):
+        """
+        Drops the recorded stages, so a long-running process does not keep every stage it ever ran.
+        """
+        with self.lock:
+            self.events = []
+
+    def write(self, path: str):
+        with self.lock:
+            events = list(self.events)
+        with open(path, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+
+# The stages are recorded all the time, as the overhead is a list append per stage, and exported with --trace.
+tracer = Tracer()
+stage = tracer.stage
+
+
+def traced(name: str, category: str = "harness"):
+    """
+    Decorator timing every call of the function as a stage.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with tracer.stage(name, category):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,3 +1,5 @@
+import hashlib
+
 from git import Repo, exc
 
 
@@ -10,6 +12,15 @@ def is_git_repo(path):
         return False
 
 
+# Hashes the contents of a file, without reading it into memory all at once.
+def hash_file(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
 def get_last_completed_run(repo):
     resp = repo.get_workflow_runs()
     print(resp)